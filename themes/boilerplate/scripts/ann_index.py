@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+ann_index.py
+
+Approximate nearest neighbor indexes used by generate_related_content.py for
+large corpora, e.g. glossaries generated with generate_content.py.
+
+Backends:
+    hnsw  - graph index (FAISS IndexHNSWFlat, or IndexHNSWSQ for float16/int8
+            embeddings), high recall, memory of the full vectors plus the graph
+    ivfpq - inverted lists with product quantization (FAISS IndexIVFPQ), a few
+            bytes per vector, lower recall, for the largest corpora
+
+Building these indexes takes much longer than searching them, so an index is
+written to a file together with a fingerprint of the embedded texts and the
+index settings, and reused while the corpus is unchanged.
+"""
+
+import os
+import json
+import math
+import numpy as np
+from translation_cache import hash_content, write_file_atomic
+
+ANN_BACKENDS = ('hnsw', 'ivfpq')
+
+# Corpus sizes from which generate_related_content.py picks a backend automatically
+HNSW_MIN_PAGES = 20000
+IVFPQ_MIN_PAGES = 200000
+
+HNSW_M = 32  # Graph neighbors per vector
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_PROBES = 16  # Inverted lists visited per query
+IVF_TRAIN_ROWS = 100000  # Vectors used to train the coarse and product quantizers
+PQ_DIMENSIONS_PER_CODE = 4  # Dimensions encoded by one byte of a PQ code
+
+# Minimum training points per centroid recommended by FAISS
+TRAIN_POINTS_PER_CENTROID = 39
+
+def index_settings(backend, count, dimension, precision):
+    """Return the settings of an index of count vectors, they are part of the fingerprint"""
+    if backend == 'hnsw':
+        return {'backend': backend, 'm': HNSW_M, 'ef_construction': HNSW_EF_CONSTRUCTION,
+                'precision': precision}
+    # Enough training points for every centroid and PQ codebook entry
+    nlist = max(1, min(int(4 * math.sqrt(count)), count // TRAIN_POINTS_PER_CENTROID))
+    bits = max(1, min(8, int(math.log2(max(count // TRAIN_POINTS_PER_CENTROID, 2)))))
+    subquantizers = max(k for k in range(1, max(dimension // PQ_DIMENSIONS_PER_CODE, 1) + 1)
+                        if dimension % k == 0)
+    return {'backend': backend, 'nlist': nlist, 'subquantizers': subquantizers, 'bits': bits}
+
+def build_ann_index(embeddings, backend):
+    """
+    Build an approximate index of an EmbeddingMatrix
+
+    Args:
+        embeddings (EmbeddingMatrix): Normalized embeddings
+        backend (str): One of ANN_BACKENDS
+
+    Returns:
+        faiss.Index: Inner product index with the embeddings added
+    """
+    import faiss
+
+    dimension = embeddings.dimension
+    settings = index_settings(backend, len(embeddings), dimension, embeddings.precision)
+    if backend == 'hnsw':
+        if embeddings.precision == 'float32':
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            qtype = faiss.ScalarQuantizer.QT_fp16 if embeddings.precision == 'float16' else faiss.ScalarQuantizer.QT_8bit
+            index = faiss.IndexHNSWSQ(dimension, qtype, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif backend == 'ivfpq':
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, settings['nlist'], settings['subquantizers'],
+                                 settings['bits'], faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"Unknown ANN backend '{backend}', expected one of {', '.join(ANN_BACKENDS)}")
+
+    if not index.is_trained:
+        # Train on an evenly spread sample of the corpus
+        step = max(1, len(embeddings) // IVF_TRAIN_ROWS)
+        index.train(np.ascontiguousarray(embeddings.rows(slice(None, None, step))))
+    for _, block in embeddings.blocks():
+        index.add(np.ascontiguousarray(block))
+    return index
+
+def configure_search(index, backend):
+    """Set the search-time parameters, they are not part of the fingerprint"""
+    import faiss
+
+    if backend == 'hnsw':
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    else:
+        faiss.extract_index_ivf(index).nprobe = IVF_PROBES
+    return index
+
+def index_fingerprint(text_hashes, backend, embeddings, model_name=None):
+    """Return the hash identifying an index of the given texts, in this order, embedded by model_name with the settings"""
+    settings = index_settings(backend, len(embeddings), embeddings.dimension, embeddings.precision)
+    return hash_content(json.dumps({'model': model_name, 'settings': settings, 'texts': list(text_hashes)}))
+
+def load_or_build_ann_index(embeddings, backend, index_path=None, text_hashes=None, model_name=None):
+    """
+    Return an approximate index of the embeddings, reusing the index file when it is up to date
+
+    Args:
+        embeddings (EmbeddingMatrix): Normalized embeddings
+        backend (str): One of ANN_BACKENDS
+        index_path (str): Path of the index file, the index is not persisted when None
+        text_hashes (list): Hash of the text of each embedding, identifies the corpus
+        model_name (str): Model and encoder the embeddings were produced with, an index of
+                          the same texts embedded by another model is not reused
+    """
+    import faiss
+
+    fingerprint = None
+    meta_path = f"{index_path}.json" if index_path else None
+    if index_path and text_hashes is not None:
+        fingerprint = index_fingerprint(text_hashes, backend, embeddings, model_name)
+        if os.path.exists(index_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f).get('fingerprint')
+                if stored == fingerprint:
+                    print(f"Using {backend} index: {index_path}")
+                    return configure_search(faiss.read_index(index_path), backend)
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"Ignoring unreadable index {index_path}: {e}")
+
+    print(f"Building {backend} index of {len(embeddings)} vectors...")
+    index = build_ann_index(embeddings, backend)
+    if fingerprint:
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        temp_path = f"{index_path}.tmp"
+        faiss.write_index(index, temp_path)
+        os.replace(temp_path, index_path)
+        write_file_atomic(meta_path, json.dumps({'fingerprint': fingerprint}))
+    return configure_search(index, backend)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+benchmark_related_content.py
+
+Benchmarks of the stages of generate_related_content.py on a synthetic corpus,
+so changes to the pipeline can be compared without a real content tree.
+
+Usage:
+    python benchmark_related_content.py batching                  # fixed batches of 8 vs token budget batching
+    python benchmark_related_content.py batching --pages 2000 --batch-tokens 8192
+    python benchmark_related_content.py precision                 # recall@3 of compressed embeddings vs exact cosine
+    python benchmark_related_content.py ann --pages 50000         # recall and latency of hnsw/ivfpq vs the flat index
+    python benchmark_related_content.py extract                   # markdown text extractor vs markdown + BeautifulSoup
+    python benchmark_related_content.py onnx --threads 4          # int8 ONNX encoder vs PyTorch, speed and neighbor agreement
+"""
+
+import os
+import re
+import time
+import random
+import difflib
+import argparse
+from pathlib import Path
+import numpy as np
+import generate_related_content as related
+from embedding_matrix import EmbeddingMatrix, PRECISIONS, normalize
+from ann_index import ANN_BACKENDS, build_ann_index, configure_search
+from markdown_text import SHORTCODE, iter_lines
+
+WORDS = ("sensor parking vehicle bay occupancy detection magnetic radar battery gateway "
+         "installation city street lorawan nb-iot signal dashboard api integration payment "
+         "enforcement zone permit analytics accuracy weather temperature maintenance "
+         "deployment network firmware cloud mobile application driver revenue").split()
+
+def synthetic_texts(pages, seed=0):
+    """Return texts with a realistic mix of lengths: many short pages, some cut at MAX_TEXT_LENGTH"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(pages):
+        length = min(int(rng.lognormvariate(5.5, 0.9)), related.MAX_TEXT_LENGTH)
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(rng.choice(WORDS))
+        texts.append(' '.join(words)[:related.MAX_TEXT_LENGTH])
+    return texts
+
+def encode_fixed(model, texts, batch_size=8):
+    """Encode texts in file order in fixed batches, like generate_embeddings() used to"""
+    encoded = []
+    for i in range(0, len(texts), batch_size):
+        encoded.extend(model.encode(texts[i:i + batch_size], show_progress_bar=False))
+    return np.array(encoded).astype('float32')
+
+def benchmark_batching(args):
+    """Compare pages/sec of fixed batches of 8 with batches of similar length bounded by a token budget"""
+    texts = synthetic_texts(args.pages, args.seed)
+    model = related.load_model(args.model)
+    # Warm up so the first timed run does not pay for lazy initialization
+    model.encode(texts[:8], show_progress_bar=False)
+
+    start = time.perf_counter()
+    fixed = encode_fixed(model, texts)
+    fixed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = related.encode_texts(model, texts, args.batch_tokens)
+    batched_seconds = time.perf_counter() - start
+
+    lengths = related.count_tokens(model, texts)
+    print(f"\n{len(texts)} texts, {min(lengths)}-{max(lengths)} tokens, mean {np.mean(lengths):.0f}")
+    print(f"Fixed batches of 8:      {fixed_seconds:7.2f}s  {len(texts) / fixed_seconds:8.1f} pages/sec")
+    print(f"Token budget {args.batch_tokens:>6}:     {batched_seconds:7.2f}s  {len(texts) / batched_seconds:8.1f} pages/sec")
+    print(f"Speedup: {fixed_seconds / batched_seconds:.2f}x")
+    # Padding changes the numerics slightly, the vectors must still agree
+    print(f"Max abs difference of embeddings: {np.abs(fixed - batched).max():.2e}")
+
+def synthetic_file_data(texts):
+    """Return file data of synthetic pages spread over a few sections"""
+    return [{'path': f"section{i % 5}/page{i}.md", 'section': f"section{i % 5}", 'slug': f"page{i}",
+             'title': '', 'text': text, 'is_index': False} for i, text in enumerate(texts)]
+
+def recall(neighbors, exact):
+    """Return the share of exact neighbors found, averaged over pages"""
+    found = [len(set(neighbors[i][0]) & set(related_pages)) / len(related_pages)
+             for i, (related_pages, _) in exact.items() if related_pages]
+    return float(np.mean(found)) if found else 1.0
+
+def benchmark_precision(args):
+    """Compare recall@TOP_K and memory of compressed embeddings against exact cosine similarity"""
+    texts = synthetic_texts(args.pages, args.seed)
+    file_data = synthetic_file_data(texts)
+    model = related.load_model(args.model)
+    raw = related.encode_texts(model, texts)
+    embeddings = normalize(raw)
+    exact = related.find_neighbors(file_data, embeddings, backend="numpy")
+
+    print(f"\n{len(texts)} pages, recall@{related.TOP_K} against exact cosine similarity")
+    # Inner product of raw vectors, what the index computed before normalization
+    unnormalized = related.find_neighbors(file_data, raw, backend="numpy")
+    print(f"{'unnormalized float32':<22} {'numpy':<6} recall {recall(unnormalized, exact):.3f}")
+    for precision in PRECISIONS:
+        matrix = EmbeddingMatrix(embeddings, precision)
+        for backend in ("numpy", "faiss"):
+            start = time.perf_counter()
+            neighbors = related.find_neighbors(file_data, matrix, backend=backend)
+            seconds = time.perf_counter() - start
+            print(f"{precision:<22} {backend:<6} recall {recall(neighbors, exact):.3f}  "
+                  f"{matrix.nbytes / 1024 / 1024:8.2f} MB  {seconds:6.2f}s")
+
+def clustered_embeddings(pages, dimension, seed=0, topics=None):
+    """Return normalized random vectors grouped around topics, a stand-in for encoding a large corpus"""
+    rng = np.random.default_rng(seed)
+    topics = topics or max(1, pages // 50)
+    centers = rng.standard_normal((topics, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, topics, pages)] + 0.7 * rng.standard_normal((pages, dimension)).astype(np.float32)
+    return normalize(vectors)
+
+def benchmark_ann(args):
+    """Compare build time, query latency, size and recall@TOP_K of approximate indexes with the flat index"""
+    import faiss
+
+    embeddings = clustered_embeddings(args.pages, args.dimension, args.seed)
+    matrix = EmbeddingMatrix(embeddings)
+    rng = np.random.default_rng(args.seed)
+    queries = rng.choice(args.pages, min(args.queries, args.pages), replace=False)
+    k = related.TOP_K + related.SEARCH_MARGIN
+
+    start = time.perf_counter()
+    flat = related.build_index(matrix)
+    build_seconds = time.perf_counter() - start
+    indexes = {'flat': (flat, build_seconds)}
+    for backend in ANN_BACKENDS:
+        start = time.perf_counter()
+        index = configure_search(build_ann_index(matrix, backend), backend)
+        indexes[backend] = (index, time.perf_counter() - start)
+
+    exact = None
+    print(f"\n{args.pages} vectors of dimension {args.dimension}, {len(queries)} queries")
+    for name, (index, build_seconds) in indexes.items():
+        start = time.perf_counter()
+        scores, indices = index.search(np.ascontiguousarray(embeddings[queries]), k)
+        seconds = time.perf_counter() - start
+        # Same filtering as find_neighbors(), recall is measured on what ends up in the YAML
+        neighbors = {}
+        for row, i in enumerate(queries):
+            related_pages = [int(j) for j in indices[row] if j >= 0 and j != i][:related.TOP_K]
+            neighbors[int(i)] = (related_pages, None)
+        if exact is None:
+            exact = neighbors
+        size = faiss.serialize_index(index).nbytes
+        print(f"{name:<6} build {build_seconds:7.2f}s  query {seconds / len(queries) * 1000:7.3f} ms  "
+              f"size {size / 1024 / 1024:8.1f} MB  recall@{related.TOP_K} {recall(neighbors, exact):.3f}")
+
+def reference_extract_text(content):
+    """Text of markdown rendered to HTML with markdown and parsed with BeautifulSoup, the extractor used before"""
+    import markdown
+    from bs4 import BeautifulSoup
+
+    html = markdown.markdown(content)
+    text = BeautifulSoup(html, 'html.parser').get_text(separator=' ', strip=True)
+    return re.sub(r'\s+', ' ', text).strip()[:related.MAX_TEXT_LENGTH]
+
+def synthetic_markdown(pages, seed=0):
+    """Return markdown pages using the syntax found in content: headings, lists, links, tables, shortcodes"""
+    rng = random.Random(seed)
+
+    def sentence():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + '.'
+
+    blocks = [
+        lambda: f"## {sentence()}",
+        lambda: f"{sentence()} **{rng.choice(WORDS)}** {sentence()} [{rng.choice(WORDS)}](/hardware/{rng.choice(WORDS)}/)",
+        lambda: '\n'.join(f"- {sentence()}" for _ in range(3)),
+        lambda: f"{{{{< lazyimg src=\"/images/{rng.choice(WORDS)}.webp\"\n  alt=\"{sentence()}\" >}}}}",
+        lambda: f"![{rng.choice(WORDS)}](https://example.com/{rng.choice(WORDS)}.png)",
+        lambda: f"| {rng.choice(WORDS)} | {rng.choice(WORDS)} |\n|---|---|\n| {sentence()} | {sentence()} |",
+        lambda: f"> {sentence()} `{rng.choice(WORDS)}`",
+        lambda: f"{{{{< blockquote >}}}}{sentence()}{{{{< /blockquote >}}}}",
+    ]
+    return ['\n\n'.join(rng.choice(blocks)() for _ in range(rng.randint(5, 60))) for _ in range(pages)]
+
+def content_markdown(content_dir):
+    """Return the markdown bodies of the content files under content_dir"""
+    import frontmatter
+    from frontmatter import TOMLHandler
+
+    bodies = []
+    for root, _, files in os.walk(content_dir):
+        for file in files:
+            if file.endswith('.md'):
+                try:
+                    with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                        bodies.append(frontmatter.load(f, handler=TOMLHandler()).content)
+                except Exception as e:
+                    print(f"Skipping {file}: {e}")
+    return bodies
+
+def benchmark_extract(args):
+    """Compare speed and output of the markdown text extractor with markdown + BeautifulSoup"""
+    corpora = {'synthetic': synthetic_markdown(args.pages, args.seed)}
+    if os.path.isdir(args.path):
+        corpora['content'] = content_markdown(args.path)
+    else:
+        print(f"Warning: content directory {args.path} not found, comparing on synthetic pages only")
+
+    for name, bodies in corpora.items():
+        if not bodies:
+            continue
+        start = time.perf_counter()
+        for body in bodies:
+            reference_extract_text(body)
+        reference_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        extracted = [related.extract_text_from_markdown(body) for body in bodies]
+        seconds = time.perf_counter() - start
+
+        # The old extractor leaked shortcode markup into the text, compare without it. It also
+        # kept the pipes of tables, markdown renders tables only with the tables extension.
+        expected = [reference_extract_text(SHORTCODE.sub(' ', '\n'.join(iter_lines(body)))) for body in bodies]
+        identical = sum(a == b for a, b in zip(expected, extracted))
+        similarity = np.mean([difflib.SequenceMatcher(None, a.split(), b.split(), autojunk=False).ratio()
+                              for a, b in zip(expected, extracted)])
+        print(f"\n{name}: {len(bodies)} pages")
+        print(f"markdown + BeautifulSoup: {reference_seconds / len(bodies) * 1000:8.3f} ms/page")
+        print(f"markdown_text:            {seconds / len(bodies) * 1000:8.3f} ms/page  "
+              f"({reference_seconds / max(seconds, 1e-9):.1f}x faster)")
+        print(f"Identical texts: {identical}/{len(bodies)}, mean similarity {similarity:.3f}")
+        if args.show_diff:
+            for a, b in zip(expected, extracted):
+                if a != b:
+                    print(f"- {a}\n+ {b}")
+                    break
+
+def benchmark_onnx(args):
+    """Compare speed of the int8 ONNX encoder with PyTorch and check they find the same neighbors"""
+    from onnx_encoder import load_onnx_encoder, default_onnx_dir
+
+    texts = synthetic_texts(args.pages, args.seed)
+    file_data = synthetic_file_data(texts)
+    encoders = {
+        'torch': related.load_model(args.model),
+        'onnx int8': load_onnx_encoder(args.model, args.onnx_dir or default_onnx_dir(args.hugo_root), args.threads),
+    }
+
+    embeddings = {}
+    print(f"\n{len(texts)} pages")
+    for name, model in encoders.items():
+        # Warm up so the timed run does not pay for lazy initialization
+        model.encode(texts[:8], show_progress_bar=False)
+        start = time.perf_counter()
+        embeddings[name] = normalize(related.encode_texts(model, texts, args.batch_tokens))
+        seconds = time.perf_counter() - start
+        print(f"{name:<10} {seconds:7.2f}s  {len(texts) / seconds:8.1f} pages/sec")
+
+    torch_embeddings, onnx_embeddings = embeddings['torch'], embeddings['onnx int8']
+    cosine = (torch_embeddings * onnx_embeddings).sum(axis=1)
+    print(f"Cosine similarity of the vectors: mean {cosine.mean():.4f}, min {cosine.min():.4f}")
+    exact = related.find_neighbors(file_data, torch_embeddings, backend="numpy")
+    neighbors = related.find_neighbors(file_data, onnx_embeddings, backend="numpy")
+    print(f"Neighbor agreement with torch (recall@{related.TOP_K}): {recall(neighbors, exact):.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stages of generate_related_content.py")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    batching = subparsers.add_parser("batching", help="Fixed batches vs token budget batching of the encoder")
+    batching.add_argument("--pages", type=int, default=500, help="Number of synthetic pages (default: 500)")
+    batching.add_argument("--batch-tokens", type=int, default=related.BATCH_TOKENS,
+                          help=f"Token budget of a batch (default: {related.BATCH_TOKENS})")
+    batching.add_argument("--model", type=str, default=related.MODEL_NAME,
+                          help=f"Model name to use (default: {related.MODEL_NAME})")
+    batching.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus")
+    batching.set_defaults(run=benchmark_batching)
+
+    precision = subparsers.add_parser("precision", help="Recall of float16/int8 embeddings vs exact cosine similarity")
+    precision.add_argument("--pages", type=int, default=2000, help="Number of synthetic pages (default: 2000)")
+    precision.add_argument("--model", type=str, default=related.MODEL_NAME,
+                           help=f"Model name to use (default: {related.MODEL_NAME})")
+    precision.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus")
+    precision.set_defaults(run=benchmark_precision)
+
+    ann = subparsers.add_parser("ann", help="Recall and latency of approximate indexes vs the flat index")
+    ann.add_argument("--pages", type=int, default=50000, help="Number of synthetic vectors (default: 50000)")
+    ann.add_argument("--dimension", type=int, default=768, help="Dimension of the vectors (default: 768)")
+    ann.add_argument("--queries", type=int, default=2000, help="Number of queries (default: 2000)")
+    ann.add_argument("--seed", type=int, default=0, help="Seed of the synthetic vectors")
+    ann.set_defaults(run=benchmark_ann)
+
+    extract = subparsers.add_parser("extract", help="Markdown text extractor vs markdown + BeautifulSoup")
+    extract.add_argument("--pages", type=int, default=1000, help="Number of synthetic pages (default: 1000)")
+    extract.add_argument("--path", type=str,
+                         default=str(Path(__file__).resolve().parents[3] / "content"),
+                         help="Content directory to compare on as well (default: content of the Hugo root)")
+    extract.add_argument("--seed", type=int, default=0, help="Seed of the synthetic pages")
+    extract.add_argument("--show-diff", action="store_true", help="Print the first text which differs")
+    extract.set_defaults(run=benchmark_extract)
+
+    onnx = subparsers.add_parser("onnx", help="Int8 ONNX encoder vs PyTorch, speed and neighbor agreement")
+    onnx.add_argument("--pages", type=int, default=500, help="Number of synthetic pages (default: 500)")
+    onnx.add_argument("--model", type=str, default=related.MODEL_NAME,
+                      help=f"Model name to use (default: {related.MODEL_NAME})")
+    onnx.add_argument("--hugo-root", type=str,
+                      default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")),
+                      help="Hugo root directory, as given to generate_related_content.py (default: two levels up from script location)")
+    onnx.add_argument("--onnx-dir", type=str, default=None,
+                      help="Directory of exported ONNX models, the model is exported when missing "
+                           "(default: .embedding_cache/onnx in the Hugo root)")
+    onnx.add_argument("--threads", type=int, default=None, help="Threads used by onnxruntime (default: all cores)")
+    onnx.add_argument("--batch-tokens", type=int, default=related.BATCH_TOKENS,
+                      help=f"Token budget of a batch (default: {related.BATCH_TOKENS})")
+    onnx.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus")
+    onnx.set_defaults(run=benchmark_onnx)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+embedding_matrix.py
+
+L2 normalized embeddings of a corpus held in memory by generate_related_content.py.
+
+Related content is ranked by cosine similarity, which is the inner product of
+normalized vectors. The normalized matrix can be kept with reduced precision to
+cut memory, scores are computed on float32 blocks decoded on the fly:
+    float32 - 4 bytes per dimension, exact
+    float16 - 2 bytes per dimension
+    int8    - 1 byte per dimension plus a float32 scale per vector
+"""
+
+import numpy as np
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+# Rows decoded to float32 at once when computing scores of compressed embeddings
+DECODE_BLOCK_ROWS = 4096
+
+def normalize(embeddings, out=None):
+    """
+    Return the float32 embeddings scaled to unit L2 norm, zero vectors are kept as they are
+
+    With out, which may be embeddings itself, the rows are normalized into out block
+    by block, without temporary matrices of the size of the embeddings.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    tiny = np.finfo(np.float32).tiny
+    if out is None:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, tiny)
+    for start in range(0, len(embeddings), DECODE_BLOCK_ROWS):
+        block = embeddings[start:start + DECODE_BLOCK_ROWS]
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        np.divide(block, np.maximum(norms, tiny), out=out[start:start + DECODE_BLOCK_ROWS])
+    return out
+
+class EmbeddingMatrix:
+    """
+    Normalized embeddings stored with a given precision
+
+    Args:
+        embeddings (np.ndarray): L2 normalized float32 matrix with a row per page
+        precision (str): One of PRECISIONS
+    """
+
+    def __init__(self, embeddings, precision='float32'):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported embedding precision '{precision}', expected one of {', '.join(PRECISIONS)}")
+        self.precision = precision
+        self.scales = None
+        if precision == 'int8':
+            # A scale per vector keeps the full int8 range for every row
+            peaks = np.abs(embeddings).max(axis=1, keepdims=True)
+            self.scales = np.where(peaks > 0, peaks / 127, 1).astype(np.float32)
+            self.data = np.round(embeddings / self.scales).astype(np.int8)
+        else:
+            self.data = np.asarray(embeddings, dtype=precision)
+
+    @property
+    def dimension(self):
+        return self.data.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.data)
+
+    def rows(self, indices):
+        """Return the float32 vectors of the given rows (index array or slice)"""
+        if self.precision == 'int8':
+            return self.data[indices].astype(np.float32) * self.scales[indices]
+        return self.data[indices].astype(np.float32, copy=False)
+
+    def blocks(self, block_rows=DECODE_BLOCK_ROWS):
+        """Yield (first row, float32 vectors) of consecutive blocks of rows"""
+        for start in range(0, len(self), block_rows):
+            yield start, self.rows(slice(start, start + block_rows))
+
+    def inner_products(self, queries):
+        """Return the float32 scores of queries (float32 rows) against all vectors, shape (queries, rows)"""
+        if self.precision == 'float32':
+            return queries @ self.data.T
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start, block in self.blocks():
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
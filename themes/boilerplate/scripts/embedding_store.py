@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+embedding_store.py
+
+Persistent on-disk store of text embeddings used by generate_related_content.py.
+
+Embeddings are stored per model under the sha256 of the embedded text, so a
+rerun only encodes new or edited pages. Vectors are kept as raw float32 rows in
+a single file which is memory mapped, so cached vectors are paged in on demand
+instead of being parsed and copied.
+
+Layout of the store directory:
+    <model>/index.json   - {"dimension": ..., "rows": {text hash: row}, "seconds_per_text": ...}
+    <model>/vectors.f32  - float32 matrix of shape (rows, dimension), rows are only appended
+"""
+
+import os
+import re
+import json
+import numpy as np
+from translation_cache import hash_content, write_file_atomic
+
+STORE_VERSION = 1
+
+class EmbeddingStore:
+    """
+    Content-hash store of embeddings of one model
+
+    Args:
+        store_dir (str): Directory holding the store
+        model_name (str): Name of the model producing the embeddings
+    """
+
+    def __init__(self, store_dir, model_name):
+        self.model_name = model_name
+        self.model_dir = os.path.join(str(store_dir), re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+        self.index_path = os.path.join(self.model_dir, 'index.json')
+        self.vectors_path = os.path.join(self.model_dir, 'vectors.f32')
+        self.dimension = None
+        # {text hash: row in the vectors file}
+        self.rows = {}
+        self.seconds_per_text = None
+        self._vectors = None
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable embedding store index {self.index_path}: {e}")
+            return
+        if index.get('version') != STORE_VERSION or index.get('model') != self.model_name:
+            print(f"Ignoring embedding store index with unsupported version: {self.index_path}")
+            return
+
+        self.dimension = index['dimension']
+        self.seconds_per_text = index.get('seconds_per_text')
+        # Rows appended after the index was last saved (e.g. an interrupted run) are ignored
+        stored_rows = self._stored_rows()
+        self.rows = {text_hash: row for text_hash, row in index['rows'].items() if row < stored_rows}
+
+    def _stored_rows(self):
+        if not self.dimension or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dimension)
+
+    def vectors(self):
+        """Return the memory mapped matrix of all stored vectors"""
+        if self._vectors is None:
+            stored_rows = self._stored_rows()
+            if stored_rows == 0:
+                return np.empty((0, self.dimension or 0), dtype=np.float32)
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                      shape=(stored_rows, self.dimension))
+        return self._vectors
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, text_hash):
+        return text_hash in self.rows
+
+    def get(self, texts):
+        """
+        Look up the embeddings of texts
+
+        Returns:
+            tuple: (float32 matrix with a row per text, or None while the dimension is unknown,
+                    list of positions of texts missing in the store)
+        """
+        return self.lookup([hash_content(text) for text in texts])
+
+    def lookup(self, text_hashes, out=None):
+        """
+        Look up embeddings by the hashes of their texts, see get()
+
+        Args:
+            text_hashes (list): Hashes of the texts
+            out (np.ndarray): Float32 matrix with a row per hash the found embeddings are
+                              written to and which is returned, allocated when None
+        """
+        text_rows = [self.rows.get(text_hash) for text_hash in text_hashes]
+        missing = [i for i, row in enumerate(text_rows) if row is None]
+        self.hits += len(text_hashes) - len(missing)
+        self.misses += len(missing)
+        if self.dimension is None:
+            return out, missing
+
+        embeddings = np.zeros((len(text_hashes), self.dimension), dtype=np.float32) if out is None else out
+        found = [i for i, row in enumerate(text_rows) if row is not None]
+        if found:
+            embeddings[found] = self.vectors()[[text_rows[i] for i in found]]
+        return embeddings, missing
+
+    def put(self, texts, embeddings, encode_seconds=None):
+        """
+        Store the embeddings of texts
+
+        Args:
+            texts (list): Embedded texts
+            embeddings (np.ndarray): Matrix with a row per text
+            encode_seconds (float): Time it took to encode the texts, used to report the time saved
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = embeddings.shape[1]
+        if encode_seconds is not None:
+            self.encode_seconds += encode_seconds
+
+        new_rows = {}
+        for text, vector in zip(texts, embeddings):
+            text_hash = hash_content(text)
+            if text_hash not in self.rows and text_hash not in new_rows:
+                new_rows[text_hash] = vector
+        if not new_rows:
+            return
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        first_row = self._stored_rows()
+        with open(self.vectors_path, 'ab') as f:
+            # Drop a partially written row left by an interrupted run
+            f.truncate(first_row * 4 * self.dimension)
+            f.write(np.stack(list(new_rows.values())).tobytes())
+        for row, text_hash in enumerate(new_rows, start=first_row):
+            self.rows[text_hash] = row
+        self._vectors = None
+
+    def save(self):
+        """Write the index of the store"""
+        if self.dimension is None:
+            return
+        if self.misses and self.encode_seconds:
+            self.seconds_per_text = self.encode_seconds / self.misses
+        index = {
+            'version': STORE_VERSION,
+            'model': self.model_name,
+            'dimension': self.dimension,
+            'seconds_per_text': self.seconds_per_text,
+            'rows': self.rows,
+        }
+        write_file_atomic(self.index_path, json.dumps(index))
+
+    def print_report(self):
+        """Print hit rate and the estimated encoding time saved by the store"""
+        total = self.hits + self.misses
+        if not total:
+            return
+        print("\nEmbedding store report:")
+        print(f"Hits: {self.hits} | Misses: {self.misses} | Hit rate: {self.hits / total:.1%}")
+        if self.misses:
+            print(f"Encoded {self.misses} texts in {self.encode_seconds:.1f}s")
+        seconds_per_text = (self.encode_seconds / self.misses if self.misses and self.encode_seconds
+                            else self.seconds_per_text)
+        if self.hits and seconds_per_text:
+            print(f"Estimated encoding time saved: {self.hits * seconds_per_text:.1f}s")
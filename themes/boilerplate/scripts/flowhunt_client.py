@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+flowhunt_client.py
+
+Shared FlowHunt API client used by translate_with_flowhunt.py and generate_content.py.
+
+The module owns a single pooled API client per process (see get_client()), which:
+    - keeps HTTP connections alive in a pool sized for concurrent calls
+    - caches the workspace ID of the API key
+    - retries transient errors (connection errors, 429 and 5xx responses) with exponential backoff
+    - checks the status of many tasks at once over the pooled connections (check_many)
+    - tells tasks that are still running from tasks that will never produce a result
+      (failed, unknown or expired), so callers stop polling the latter
+    - limits the request rate and the number of concurrent requests of invoke and status
+      calls with a token bucket (RateLimiter), which slows down on 429 responses and
+      honors their Retry-After header
+
+Environment variables:
+    FLOWHUNT_API_KEY    - FlowHunt API key (also read from the .env file next to the scripts)
+    FLOWHUNT_API_HOST   - FlowHunt API host, can be pointed to a local fake server for testing
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import flowhunt
+import urllib3
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+API_HOST = os.getenv("FLOWHUNT_API_HOST", "https://api.flowhunt.io")
+
+# Number of pooled HTTP connections, also the upper bound of concurrent API calls
+DEFAULT_POOL_SIZE = 32
+
+# HTTP statuses worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_RETRY_BACKOFF = 1.0
+
+# Default limit of API requests per second
+DEFAULT_RATE_LIMIT = 10.0
+
+# Statuses of flow tasks that finished without a result
+FAILED_STATUSES = {"FAILURE", "FAILED", "ERROR", "REVOKED"}
+
+_client = None
+
+def load_api_key():
+    """Load the FlowHunt API key from the .env file or environment, exit if it is missing"""
+    env_path = os.path.join(script_dir, '.env')
+    if os.path.exists(env_path):
+        print(f"Loading environment variables from {env_path}")
+        load_dotenv(env_path)
+    else:
+        print("No .env file found, using environment variables if available")
+
+    api_key = os.getenv("FLOWHUNT_API_KEY")
+    if not api_key:
+        print("Error: FLOWHUNT_API_KEY not found in environment variables or .env file")
+        print("Please set the FLOWHUNT_API_KEY environment variable or add it to the .env file")
+        sys.exit(1)
+    return api_key
+
+class FlowTaskError(Exception):
+    """Raised when a flow task failed, checking it again will not produce a result"""
+
+def is_transient_error(error):
+    """Check if an API error is worth retrying"""
+    if isinstance(error, flowhunt.ApiException):
+        return not error.status or error.status in RETRY_STATUSES
+    return isinstance(error, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError))
+
+def get_retry_after(error):
+    """Return the number of seconds requested by the Retry-After header of an API error, or None"""
+    headers = getattr(error, 'headers', None) or {}
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """
+    Token bucket limiting the rate and concurrency of API requests
+
+    The rate is halved on every throttled (429) response, down to min_rate, and
+    all requests pause for the Retry-After period. Each successful request then
+    raises the rate a little until it recovers to the configured limit.
+
+    Args:
+        rate (float): Maximum number of requests per second
+        max_concurrent (int): Maximum number of requests in flight at once
+        burst (float): Maximum number of requests sent at once after an idle period
+        min_rate (float): Lowest rate the limiter slows down to
+    """
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, max_concurrent=DEFAULT_POOL_SIZE, burst=None, min_rate=0.2):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttle_events = 0
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.recent_requests = deque()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        self.slots.acquire()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.recent_requests.append(now)
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def release(self):
+        """Mark a request as finished"""
+        self.slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def on_success(self):
+        """Recover the rate slowly after successful requests"""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.02)
+
+    def on_throttle(self, retry_after=None):
+        """Slow down after a throttled request"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.throttle_events += 1
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+    def current_rate(self, window=10.0):
+        """Return the measured number of requests per second over the last window seconds"""
+        with self.lock:
+            now = time.monotonic()
+            while self.recent_requests and self.recent_requests[0] < now - window:
+                self.recent_requests.popleft()
+            return len(self.recent_requests) / window
+
+    def status(self):
+        """Return a short description of the current rate and throttling"""
+        return (f"Rate: {self.current_rate():.1f} req/s (limit {self.rate:.1f}) | "
+                f"Throttled: {self.throttle_events}")
+
+class FlowHuntClient:
+    """
+    FlowHunt API client with a pooled HTTP connection and retries
+
+    Args:
+        api_key (str): FlowHunt API key
+        host (str): FlowHunt API host
+        pool_size (int): Number of pooled HTTP connections
+        max_retries (int): Number of retries of transient errors
+        retry_backoff (float): Initial delay in seconds between retries, doubled after each retry
+        rate_limit (float): Maximum number of API requests per second
+        max_concurrent (int): Maximum number of API requests in flight at once, defaults to pool_size
+    """
+
+    def __init__(self, api_key, host=API_HOST, pool_size=DEFAULT_POOL_SIZE,
+                 max_retries=DEFAULT_MAX_RETRIES, retry_backoff=DEFAULT_RETRY_BACKOFF,
+                 rate_limit=DEFAULT_RATE_LIMIT, max_concurrent=None):
+        configuration = flowhunt.Configuration(host=host)
+        configuration.api_key['APIKeyHeader'] = api_key
+        configuration.connection_pool_maxsize = pool_size
+
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.limiter = RateLimiter(rate_limit, max_concurrent or pool_size)
+        self.api_client = flowhunt.ApiClient(configuration)
+        self.flows_api = flowhunt.FlowsApi(self.api_client)
+        self._workspace_id = None
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Release pooled connections and threads"""
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.api_client.close()
+
+    def call(self, method, *args, **kwargs):
+        """Call an API method within the rate limit, retrying transient errors with exponential backoff"""
+        attempt = 0
+        while True:
+            try:
+                with self.limiter:
+                    result = method(*args, **kwargs)
+                self.limiter.on_success()
+                return result
+            except Exception as e:
+                retry_after = None
+                if isinstance(e, flowhunt.ApiException) and e.status == 429:
+                    retry_after = get_retry_after(e)
+                    self.limiter.on_throttle(retry_after)
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+                delay = self.retry_backoff * 2 ** attempt * (1 + random.uniform(0, 0.1))
+                attempt += 1
+                # The limiter already pauses all requests for the Retry-After period
+                if retry_after is None:
+                    time.sleep(delay)
+
+    def workspace_id(self):
+        """Return the workspace ID of the API key, or None if it cannot be retrieved"""
+        if self._workspace_id is None:
+            try:
+                api_response = self.call(flowhunt.AuthApi(self.api_client).get_user)
+                self._workspace_id = api_response.api_key_workspace_id
+            except flowhunt.ApiException as e:
+                print(f"Exception when calling AuthApi->get_user: {e}")
+                return None
+        return self._workspace_id
+
+    def invoke_flow(self, flow_id, human_input, variables):
+        """
+        Invoke a flow in the workspace of the API key
+
+        Args:
+            flow_id (str): FlowHunt flow ID
+            human_input (str): Input of the flow
+            variables (dict): Flow variables
+
+        Returns:
+            str: Task ID of the invoked flow
+        """
+        flow_invoke_request = flowhunt.FlowInvokeRequest(variables=variables, human_input=human_input)
+        response = self.call(
+            self.flows_api.invoke_flow_singleton,
+            flow_id=flow_id,
+            workspace_id=self.workspace_id(),
+            flow_invoke_request=flow_invoke_request
+        )
+        return response.id
+
+    def check(self, flow_id, task_id):
+        """
+        Check if a flow task has completed
+
+        Returns:
+            tuple: (is_ready, parsed result JSON or None)
+
+        Raises:
+            FlowTaskError: The task finished with one of FAILED_STATUSES
+        """
+        response = self.call(
+            self.flows_api.get_invoked_flow_results,
+            flow_id=flow_id, task_id=task_id, workspace_id=self.workspace_id()
+        )
+        if response.status == "SUCCESS":
+            return True, json.loads(response.result)
+        if str(response.status).upper() in FAILED_STATUSES:
+            raise FlowTaskError(f"task {task_id} finished with status {response.status}")
+        return False, None
+
+    def check_many(self, flow_id, task_ids):
+        """
+        Check many flow tasks concurrently over the pooled connections
+
+        Returns:
+            dict: {task_id: (is_ready, parsed result JSON or None)}, transient errors are reported as
+                  not ready, failed, unknown or expired tasks as ready without a result (True, None)
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size)
+
+        def check_one(task_id):
+            try:
+                return self.check(flow_id, task_id)
+            except Exception as e:
+                print(f"Error checking flow results for process {task_id}: {str(e)}")
+                if is_transient_error(e):
+                    return False, None
+                return True, None
+
+        task_ids = list(task_ids)
+        return dict(zip(task_ids, self._executor.map(check_one, task_ids)))
+
+def get_client(api_key=None, rate_limit=DEFAULT_RATE_LIMIT, max_concurrent=None):
+    """
+    Return the FlowHunt client shared by the whole process
+
+    The rate limits only apply when the client is created by the first call.
+    """
+    global _client
+    if _client is None:
+        _client = FlowHuntClient(api_key or load_api_key(), rate_limit=rate_limit, max_concurrent=max_concurrent)
+        atexit.register(_client.close)
+    return _client
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+flowhunt_polling.py
+
+Adaptive polling of FlowHunt tasks used by translate_with_flowhunt.py and generate_content.py.
+
+Instead of checking every pending task on each sweep, every task gets its own
+next check time:
+    - completion times of finished tasks are learned per flow (median of recent runs)
+    - a task is first checked around its expected finish time
+    - when it is not ready by then (or nothing is learned yet), checks back off
+      exponentially from the minimum interval, with random jitter
+    - the minimum interval (the --check-interval CLI option) is always honored as a floor
+    - a task running longer than its deadline, a multiple of the learned completion
+      time (or a fixed timeout while nothing is learned), is given up on, as are tasks
+      the caller reports as failed
+"""
+
+import time
+import random
+import statistics
+from collections import defaultdict, deque
+
+DEFAULT_MAX_INTERVAL = 120
+DEFAULT_BACKOFF = 1.5
+DEFAULT_JITTER = 0.1
+# Seconds a task may run while no completion time of its flow is learned
+DEFAULT_TIMEOUT = 3600
+# Once learned, a task may run this many times the median completion time, but at least DEFAULT_MIN_TIMEOUT
+DEFAULT_TIMEOUT_FACTOR = 10
+DEFAULT_MIN_TIMEOUT = 300
+
+class CompletionTimeEstimator:
+    """
+    Learns typical completion times of tasks per flow
+
+    Args:
+        window (int): Number of recent completion times kept per flow
+    """
+
+    def __init__(self, window=50):
+        self.durations = defaultdict(lambda: deque(maxlen=window))
+
+    def observe(self, flow_id, seconds):
+        """Record the completion time of a finished task"""
+        self.durations[flow_id].append(seconds)
+
+    def expected(self, flow_id):
+        """Return the expected completion time of a flow in seconds, or None if unknown"""
+        durations = self.durations.get(flow_id)
+        if not durations:
+            return None
+        return statistics.median(durations)
+
+class AdaptivePoller:
+    """
+    Schedules status checks of pending FlowHunt tasks individually
+
+    Args:
+        min_interval (float): Minimum number of seconds between two checks of a task
+        max_interval (float): Maximum number of seconds between two checks of a task
+        backoff (float): Multiplier of the interval after each unsuccessful check
+        jitter (float): Random fraction added to each delay to spread checks
+        estimator (CompletionTimeEstimator): Shared estimator of completion times
+        timeout (float): Seconds a task may run while no completion time of its flow is learned
+        timeout_factor (float): Multiple of the learned completion time a task may run
+        min_timeout (float): Lower bound of the deadline derived from the learned completion time
+    """
+
+    def __init__(self, min_interval, max_interval=DEFAULT_MAX_INTERVAL, backoff=DEFAULT_BACKOFF,
+                 jitter=DEFAULT_JITTER, estimator=None, timeout=DEFAULT_TIMEOUT,
+                 timeout_factor=DEFAULT_TIMEOUT_FACTOR, min_timeout=DEFAULT_MIN_TIMEOUT):
+        if min_interval <= 0:
+            raise ValueError(f"Minimum check interval must be positive, got {min_interval}")
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.jitter = jitter
+        self.estimator = estimator or CompletionTimeEstimator()
+        self.timeout = timeout
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        # {task_id: {'flow_id': ..., 'started': ..., 'next_check': ..., 'backoff_steps': ...}}
+        self.tasks = {}
+        self.status_checks = 0
+        self.completed = 0
+        self.failed_tasks = 0
+
+    def start(self, task_id, flow_id, now=None):
+        """Register a newly invoked task and schedule its first check"""
+        now = time.monotonic() if now is None else now
+        self.tasks[task_id] = {'flow_id': flow_id, 'started': now, 'next_check': now, 'backoff_steps': 0}
+        self._schedule(task_id, now)
+
+    def _schedule(self, task_id, now):
+        task = self.tasks[task_id]
+        elapsed = now - task['started']
+        expected = self.estimator.expected(task['flow_id'])
+        if expected is not None and elapsed < expected:
+            # Check right when the task is expected to finish
+            delay = expected - elapsed
+        else:
+            delay = self.min_interval * self.backoff ** task['backoff_steps']
+            if delay < self.max_interval:
+                task['backoff_steps'] += 1
+        delay = min(max(delay, self.min_interval), self.max_interval)
+        delay *= 1 + random.uniform(0, self.jitter)
+        task['next_check'] = now + delay
+
+    def delay(self, task_id, now=None):
+        """Return the number of seconds until the next check of a task is due"""
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.tasks[task_id]['next_check'] - now)
+
+    def next_due(self):
+        """Return (task_id, next check time) of the task due first, or (None, None)"""
+        if not self.tasks:
+            return None, None
+        task_id = min(self.tasks, key=lambda t: self.tasks[t]['next_check'])
+        return task_id, self.tasks[task_id]['next_check']
+
+    def due_tasks(self, now=None):
+        """Return the IDs of all tasks whose check is due"""
+        now = time.monotonic() if now is None else now
+        return [task_id for task_id, task in self.tasks.items() if task['next_check'] <= now]
+
+    def checked(self, task_id, is_ready, now=None):
+        """
+        Record a status check of a task
+
+        A finished task is forgotten and its completion time is learned,
+        otherwise its next check is scheduled.
+        """
+        now = time.monotonic() if now is None else now
+        self.status_checks += 1
+        if is_ready:
+            task = self.tasks.pop(task_id)
+            self.estimator.observe(task['flow_id'], now - task['started'])
+            self.completed += 1
+        else:
+            self._schedule(task_id, now)
+
+    def deadline(self, task_id):
+        """Return the number of seconds a task may run before it is given up on"""
+        expected = self.estimator.expected(self.tasks[task_id]['flow_id'])
+        if expected is None:
+            return self.timeout
+        return max(self.min_timeout, expected * self.timeout_factor)
+
+    def timed_out(self, task_id, now=None):
+        """Check if a task has been running longer than its deadline"""
+        now = time.monotonic() if now is None else now
+        return now - self.tasks[task_id]['started'] > self.deadline(task_id)
+
+    def failed(self, task_id):
+        """Stop tracking a task that failed or timed out, without learning from it"""
+        if self.tasks.pop(task_id, None) is not None:
+            self.failed_tasks += 1
+
+    def forget(self, task_id):
+        """Stop tracking a task without learning from it"""
+        self.tasks.pop(task_id, None)
+
+    def eta(self, task_id, now=None):
+        """Return the expected number of seconds until a task finishes, or None if unknown"""
+        now = time.monotonic() if now is None else now
+        task = self.tasks[task_id]
+        expected = self.estimator.expected(task['flow_id'])
+        if expected is None:
+            return None
+        return max(0.0, task['started'] + expected - now)
+
+    def summary(self):
+        """Return a short description of the polling statistics"""
+        per_task = self.status_checks / self.completed if self.completed else 0.0
+        return (f"Status checks: {self.status_checks} ({per_task:.1f} per completed task), "
+                f"failed or timed out tasks: {self.failed_tasks}")
@@ -24,133 +24,82 @@ Examples:
     
     # Prevent overwriting existing files
     python generate_content.py --input_file topics.csv --flow_id "flow-id" --output_dir output --no-overwrite
+
+    # Collect results of tasks scheduled by an interrupted run (see job_journal.py)
+    python generate_content.py --input_file topics.csv --flow_id "flow-id" --output_dir output --resume
 """
 
 import os
 import sys
 import argparse
 import time
-import json
 import csv
 from pathlib import Path
 from tqdm import tqdm
-from dotenv import load_dotenv
-import flowhunt
-
-# Load environment variables from .env file
-script_dir = os.path.dirname(os.path.abspath(__file__))
-env_path = os.path.join(script_dir, '.env')
-if os.path.exists(env_path):
-    print(f"Loading environment variables from {env_path}")
-    load_dotenv(env_path)
-else:
-    print("No .env file found, using environment variables if available")
-
-# Get API key from environment variable
-api_key = os.getenv("FLOWHUNT_API_KEY")
-if not api_key:
-    print("Error: FLOWHUNT_API_KEY not found in environment variables or .env file")
-    print("Please set the FLOWHUNT_API_KEY environment variable or add it to the .env file")
-    sys.exit(1)
-
-def get_workspace_id():
-    """Get the workspace ID from FlowHunt API"""
-    api_client = initialize_api_client()
-    api_instance = flowhunt.AuthApi(api_client)
+from flowhunt_client import get_client, load_api_key, DEFAULT_RATE_LIMIT
+from flowhunt_polling import AdaptivePoller
+from job_journal import JobJournal, DEFAULT_JOURNAL_PATH
 
-    try:
-        api_response = api_instance.get_user()
-        return api_response.api_key_workspace_id
-    except flowhunt.ApiException as e:
-        print(f"Exception when calling AuthApi->get_user: {e}")
-        return None
-
-def initialize_api_client():
-    """Initialize and return a FlowHunt API client"""
-    configuration = flowhunt.Configuration(
-        host="https://api.flowhunt.io"
-    )
-    configuration.api_key['APIKeyHeader'] = api_key
-    return flowhunt.ApiClient(configuration)
+# Get API key from .env file or environment variable
+api_key = load_api_key()
 
-def invoke_flow_for_content(api_instance, flow_input, flow_id, workspace_id, filename):
+def invoke_flow_for_content(client, flow_input, flow_id, filename):
     """
     Invoke a FlowHunt flow to generate content for a flow input
     
     Args:
-        api_instance: FlowHunt API instance
+        client (FlowHuntClient): FlowHunt API client
         flow_input (str): Input text to generate content for
         flow_id (str): FlowHunt flow ID
-        workspace_id (str): FlowHunt workspace ID
         filename (str): Filename to be passed to the flow
 
     Returns:
         str: Process ID or None if failed
     """
     try:
-        # Prepare the request payload
-        flow_invoke_request = flowhunt.FlowInvokeRequest(
-            variables={
+        return client.invoke_flow(
+            flow_id,
+            flow_input,
+            {
                 "today": time.strftime("%Y-%m-%d"),
                 "v": "1",
                 "filename": filename,
-            }, 
-            human_input=flow_input
-        )
-        
-        # Invoke the flow
-        response = api_instance.invoke_flow_singleton(
-            flow_id=flow_id,
-            workspace_id=workspace_id,
-            flow_invoke_request=flow_invoke_request
+            }
         )
         
-        return response.id
-        
     except Exception as e:
         print(f"Error invoking flow for input '{flow_input}': {str(e)}")
         return None
 
-def check_flow_results(api_instance, process_id, flow_id, workspace_id):
+def extract_generated_content(result):
     """
-    Check if a flow has completed and get the results
+    Extract generated content from the results of a completed flow
     
     Args:
-        api_instance: FlowHunt API instance
-        process_id (str): Process ID to check
-        flow_id (str): FlowHunt flow ID
-        workspace_id (str): FlowHunt workspace ID
+        result (dict): Parsed result of the flow
         
     Returns:
-        tuple: (is_ready, result_text)
+        str: Generated content, "NOCONTENT" if the flow produced nothing, or None if the result is malformed
     """
     try:
-        response = api_instance.get_invoked_flow_results(
-            flow_id=flow_id, task_id=process_id, workspace_id=workspace_id
-        )
-        
-        if response.status == "SUCCESS":
-            generated_content = json.loads(response.result)
-            content = ""
-            for output in generated_content['outputs'][0]['outputs']:
-                part = output['results']['message']['result'].strip()
-                if part.startswith("```"):
-                    part = "\n".join(part.splitlines()[1:]).strip()
-                if part.endswith("```"):
-                    part = part[:-3].strip()
-                content += part + "\n"
-            content = content.strip()
-
-            if not content:
-                content = "NOCONTENT"
-
-            return True, content.strip()
-        else:
-            return False, None
+        content = ""
+        for output in result['outputs'][0]['outputs']:
+            part = output['results']['message']['result'].strip()
+            if part.startswith("```"):
+                part = "\n".join(part.splitlines()[1:]).strip()
+            if part.endswith("```"):
+                part = part[:-3].strip()
+            content += part + "\n"
+        content = content.strip()
+
+        if not content:
+            content = "NOCONTENT"
+
+        return content.strip()
             
     except Exception as e:
-        print(f"Error checking flow results for process {process_id}: {str(e)}")
-        return False, None
+        print(f"Error extracting generated content: {str(e)}")
+        return None
 
 def detect_csv_delimiter(file_path):
     """
@@ -270,14 +219,26 @@ def save_content(content, filename, output_dir, allow_overwrite=True):
         print(f"Error saving content to '{filename}': {str(e)}")
         return None
 
-def process_topics(topics, flow_id, workspace_id, output_dir, allow_overwrite=True):
-    """Process topics using FlowHunt API"""
-    if not topics:
+def process_topics(topics, flow_id, output_dir, allow_overwrite=True, check_interval=10, journal=None,
+                   resumed_jobs=()):
+    """
+    Process topics using FlowHunt API, polling each task on its own adaptive schedule
+
+    Every invoked flow is recorded in the job journal. Jobs resumed from the journal
+    are not invoked again, their already running FlowHunt tasks are polled instead.
+    """
+    original_count = len(topics)
+
+    # Topics of resumed jobs are already being generated
+    resumed_files = {job['job_key'] for job in resumed_jobs}
+    topics = [topic for topic in topics
+              if os.path.join(output_dir, topic['filename'].strip()) not in resumed_files]
+
+    if not topics and not resumed_jobs:
         print("No topics to process")
         return
     
     skipped_count = 0
-    original_count = len(topics)
     
     # Filter out existing files if overwrite is not allowed
     if not allow_overwrite:
@@ -302,7 +263,7 @@ def process_topics(topics, flow_id, workspace_id, output_dir, allow_overwrite=Tr
         
         topics = topics_to_process
         
-        if not topics:
+        if not topics and not resumed_jobs:
             print("No new topics to process - all files already exist")
             print(f"\nContent Generation Summary:")
             print(f"Topics skipped (files already exist): {skipped_count}")
@@ -312,71 +273,135 @@ def process_topics(topics, flow_id, workspace_id, output_dir, allow_overwrite=Tr
             return
     
     print(f"Processing {len(topics)} topics")
-    check_interval = 10
-    
-    with initialize_api_client() as api_client:
-        api_instance = flowhunt.FlowsApi(api_client)
-        
-        # Dictionary to track tasks: {process_id: topic_data}
-        pending_tasks = {}
-        completed_tasks = []
-        failed_tasks = []
-        
-        # Schedule all tasks
-        progress_bar = tqdm(total=len(topics), desc="Scheduling content generation")
-        
-        for topic in topics:
-            flow_input = topic['flow_input'].strip()
-            filename = topic['filename'].strip()
-            
-            if not flow_input or not filename:
-                continue
-                
-            process_id = invoke_flow_for_content(api_instance, flow_input, flow_id, workspace_id, filename)
+    poller = AdaptivePoller(check_interval)
+    client = get_client()
+
+    # Dictionary to track tasks: {process_id: topic_data}
+    pending_tasks = {}
+    # Journal IDs of the tasks: {process_id: job_id}
+    job_ids = {}
+    completed_tasks = []
+    failed_tasks = []
+
+    # Tasks of an interrupted run, invoked again when they failed or expired on the server
+    resumed_task_ids = {job['task_id'] for job in resumed_jobs}
+    for job in resumed_jobs:
+        pending_tasks[job['task_id']] = job['inputs']
+        job_ids[job['task_id']] = job['id']
+        poller.start(job['task_id'], flow_id)
+    if resumed_jobs:
+        print(f"Collecting results of {len(resumed_jobs)} tasks scheduled by an interrupted run")
+
+    # Schedule all tasks
+    progress_bar = tqdm(total=len(topics), desc="Scheduling content generation")
+
+    for topic in topics:
+        flow_input = topic['flow_input'].strip()
+        filename = topic['filename'].strip()
+
+        if not flow_input or not filename:
+            continue
+
+        process_id = invoke_flow_for_content(client, flow_input, flow_id, filename)
+        job_key = os.path.join(output_dir, filename)
+        inputs = {'flow_input': flow_input, 'filename': filename, 'output_dir': output_dir}
+
+        if process_id:
+            pending_tasks[process_id] = inputs
+            poller.start(process_id, flow_id)
+            if journal:
+                job_ids[process_id] = journal.scheduled(job_key, flow_id, process_id, inputs)
+        else:
+            failed_tasks.append(topic)
+            if journal:
+                journal.failed(None, "flow invocation failed", job_key, flow_id, inputs)
+            progress_bar.update(1)
 
-            if process_id:
-                pending_tasks[process_id] = topic
+    progress_bar.close()
+    print(f"Scheduled {len(pending_tasks)} tasks, now waiting for results...")
+
+    # Process results
+    progress_bar = tqdm(total=len(pending_tasks), desc="Processing content generation")
+
+    last_status = time.monotonic()
+    while pending_tasks:
+        # Wait until the next task is due for a status check
+        _, next_check = poller.next_due()
+        time.sleep(max(0.0, next_check - time.monotonic()))
+
+        # Check all due tasks at once over the pooled connections
+        results = client.check_many(flow_id, poller.due_tasks())
+
+        for process_id, (is_ready, result) in results.items():
+            if is_ready and result is None:
+                error = "flow task failed"
+                print(f"\nFlow task {process_id} for '{pending_tasks[process_id]['flow_input']}' failed")
+            elif not is_ready and poller.timed_out(process_id):
+                error = "flow task timed out"
+                print(f"\nFlow task {process_id} for '{pending_tasks[process_id]['flow_input']}' did not finish "
+                      f"within {poller.deadline(process_id):.0f}s, giving up")
             else:
-                failed_tasks.append(topic)
+                error = None
+                poller.checked(process_id, is_ready)
+                if not is_ready:
+                    continue
+
+            if error:
+                poller.failed(process_id)
+                topic_data = pending_tasks.pop(process_id)
+                job_id = job_ids.pop(process_id, None)
+                if process_id in resumed_task_ids:
+                    # A task of an interrupted run is invoked once more instead of being given up
+                    new_process_id = invoke_flow_for_content(client, topic_data['flow_input'], flow_id,
+                                                             topic_data['filename'])
+                    if new_process_id:
+                        print(f"Invoked the flow again for '{topic_data['flow_input']}'")
+                        pending_tasks[new_process_id] = topic_data
+                        poller.start(new_process_id, flow_id)
+                        if journal:
+                            job_key = os.path.join(topic_data['output_dir'], topic_data['filename'])
+                            job_ids[new_process_id] = journal.scheduled(job_key, flow_id, new_process_id,
+                                                                        topic_data, job_id)
+                        continue
+                    error = "flow invocation failed"
+                failed_tasks.append(topic_data)
+                if journal and job_id is not None:
+                    journal.failed(job_id, error)
                 progress_bar.update(1)
-        
-        progress_bar.close()
-        print(f"Scheduled {len(pending_tasks)} tasks, now waiting for results...")
-        
-        # Process results
-        progress_bar = tqdm(total=len(pending_tasks), desc="Processing content generation")
-        
-        while pending_tasks:
-            time.sleep(check_interval)
-            process_ids = list(pending_tasks.keys())
-            completed_in_batch = 0
-            
-            for process_id in process_ids:
-                topic_data = pending_tasks[process_id]
-                is_ready, content = check_flow_results(api_instance, process_id, flow_id, workspace_id)
-                
-                if is_ready:
-                    del pending_tasks[process_id]
-                    completed_in_batch += 1
-                    
-                    if content:
-                        output_path = save_content(content, topic_data['filename'], output_dir, allow_overwrite)
-                        if output_path:
-                            completed_tasks.append(topic_data)
-                            print(f"\nGenerated content for '{topic_data['flow_input']}' saved to: {output_path}")
-                        else:
-                            failed_tasks.append(topic_data)
-                    else:
-                        failed_tasks.append(topic_data)
-                        print(f"\nFailed to generate content for '{topic_data['flow_input']}'")
-            
-            progress_bar.update(completed_in_batch)
-            
-            if pending_tasks:
-                print(f"\nStill waiting for {len(pending_tasks)} tasks to complete...")
-        
-        progress_bar.close()
-    
+                continue
+
+            topic_data = pending_tasks.pop(process_id)
+            job_id = job_ids.pop(process_id, None)
+            content = extract_generated_content(result)
+
+            if content:
+                output_path = save_content(content, topic_data['filename'], topic_data['output_dir'], allow_overwrite)
+                if output_path:
+                    completed_tasks.append(topic_data)
+                    print(f"\nGenerated content for '{topic_data['flow_input']}' saved to: {output_path}")
+                    if journal and job_id is not None:
+                        journal.completed(job_id)
+                else:
+                    failed_tasks.append(topic_data)
+                    if journal and job_id is not None:
+                        journal.failed(job_id, "content could not be saved")
+            else:
+                failed_tasks.append(topic_data)
+                print(f"\nFailed to generate content for '{topic_data['flow_input']}'")
+                if journal and job_id is not None:
+                    journal.failed(job_id, "flow returned no content")
+
+            progress_bar.update(1)
+
+        if pending_tasks and time.monotonic() - last_status >= check_interval:
+            last_status = time.monotonic()
+            etas = [eta for eta in (poller.eta(task_id) for task_id in pending_tasks) if eta is not None]
+            eta_text = f", next expected completion in {min(etas):.0f}s" if etas else ""
+            print(f"\nStill waiting for {len(pending_tasks)} tasks to complete{eta_text}... "
+                  f"({client.limiter.status()})")
+
+    progress_bar.close()
+
     # Print summary
     print("\nContent Generation Summary:")
     if skipped_count > 0:
@@ -385,6 +410,8 @@ def process_topics(topics, flow_id, workspace_id, output_dir, allow_overwrite=Tr
     print(f"Topics failed: {len(failed_tasks)}")
     print(f"Total topics in input: {original_count}")
     print(f"Total topics processed: {len(completed_tasks) + len(failed_tasks)}")
+    print(poller.summary())
+    print(client.limiter.status())
 
 def main():
     """Main function to parse arguments and process topics"""
@@ -413,11 +440,43 @@ def main():
         action="store_true",
         help="Prevent overwriting existing files (default: allow overwrite)"
     )
+    parser.add_argument(
+        "--check-interval",
+        type=int,
+        default=10,
+        help="Minimum interval in seconds between two status checks of a task, at least 1 (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=DEFAULT_RATE_LIMIT,
+        help="Maximum number of FlowHunt API requests per second, lowered automatically when throttled (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--max-concurrent-requests",
+        type=int,
+        default=None,
+        help="Maximum number of FlowHunt API requests in flight at once (default: size of the connection pool)"
+    )
+    parser.add_argument(
+        "--journal",
+        default=DEFAULT_JOURNAL_PATH,
+        help="Path of the job journal recording invoked FlowHunt tasks (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Collect results of tasks scheduled by an interrupted run instead of invoking the flow again"
+    )
     
     args = parser.parse_args()
+
+    if args.check_interval < 1:
+        print("Error: --check-interval must be at least 1")
+        sys.exit(1)
     
     # Get workspace ID
-    workspace_id = get_workspace_id()
+    workspace_id = get_client(api_key, args.rate_limit, args.max_concurrent_requests).workspace_id()
     if not workspace_id:
         print("Error: Unable to retrieve workspace ID. Please check your API key.")
         sys.exit(1)
@@ -428,8 +487,22 @@ def main():
     topics = read_topics(args.input_file)
     print(f"Found {len(topics)} topics in {args.input_file}")
     
+    journal = JobJournal(args.journal, 'generate')
+    resumed_jobs = []
+    pending_jobs = journal.pending(args.flow_id)
+    if args.resume:
+        resumed_jobs = pending_jobs
+        print(f"Resuming {len(resumed_jobs)} tasks scheduled by an interrupted run")
+    elif pending_jobs:
+        print(f"Warning: {len(pending_jobs)} tasks of an interrupted run are still scheduled, "
+              f"use --resume to collect their results (list them with: python job_journal.py)")
+
     # Process topics
-    process_topics(topics, args.flow_id, workspace_id, args.output_dir, allow_overwrite=not args.no_overwrite)
+    try:
+        process_topics(topics, args.flow_id, args.output_dir, allow_overwrite=not args.no_overwrite,
+                       check_interval=args.check_interval, journal=journal, resumed_jobs=resumed_jobs)
+    finally:
+        journal.close()
     
     print("\nContent generation completed!")
 
@@ -2,16 +2,37 @@
 """
 Generate Related Content YAML
 
-This script indexes content files in a specific language folder as vectors using FAISS
-and a sentence transformer model from Hugging Face. For each file, it finds
+This script indexes content files in a specific language folder as vectors using
+a sentence transformer model from Hugging Face. For each file, it finds
 the 3 most similar files and generates a YAML file with the related content structure.
+All files of a language are searched at once, small corpora with NumPy and large
+ones with FAISS, very large ones with approximate indexes (see --search-backend and
+ann_index.py).
+
+Embeddings are kept in an on-disk store keyed by the model and the hash of the
+extracted text (see embedding_store.py), so a rerun only encodes new or edited pages.
+
+With --incremental, only pages affected by files changed since the last run get
+their related content recomputed (see related_content_state.py).
+
+With --project-from en, neighbors are computed once on the English pages and
+projected to the other languages by relative path, since translations share the
+paths of their originals. Only pages without an English counterpart are encoded
+and searched per language.
 
 Usage:
     python generate_related_content.py --lang en
     python generate_related_content.py --lang en --path /path/to/content
+    python generate_related_content.py --no-embedding-cache
+    python generate_related_content.py --incremental
+    python generate_related_content.py --incremental --changed-since HEAD~1
+    python generate_related_content.py --project-from en
+    python generate_related_content.py --offline --profile-startup
+    python generate_related_content.py --encoder onnx --onnx-threads 4
+    python generate_related_content.py --max-memory 1800
 
 Requirements:
-    pip install sentence-transformers faiss-cpu pyyaml frontmatter markdown bs4 tqdm
+    pip install sentence-transformers faiss-cpu pyyaml frontmatter tqdm
     
     or install requirements.txt
     pip install -r requirements.txt
@@ -19,39 +40,168 @@ Requirements:
 """
 
 import os
-import re
+import sys
+import time
+from contextlib import contextmanager
+
+# (label, seconds) of imports and model loading, printed with --profile-startup
+STARTUP_TIMINGS = []
+_startup_time = time.perf_counter()
+
 import argparse
 import yaml
 import gc
+import importlib
+import tempfile
 import frontmatter
 from frontmatter import TOMLHandler # Changed import
-import markdown
-from bs4 import BeautifulSoup
-from tqdm import tqdm
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+from translation_cache import hash_content
+from markdown_text import markdown_to_text
+from embedding_store import EmbeddingStore
+from embedding_matrix import EmbeddingMatrix, PRECISIONS, normalize
+from ann_index import ANN_BACKENDS, HNSW_MIN_PAGES, IVFPQ_MIN_PAGES, load_or_build_ann_index
+from related_content_state import RelatedContentState, git_changed_files
+from memory_usage import MemoryGuard, format_bytes, peak_rss, reset_peak_rss
+
+STARTUP_TIMINGS.append(("module imports (numpy, yaml, frontmatter)", time.perf_counter() - _startup_time))
 
 # Constants
 MODEL_NAME = "Alibaba-NLP/gte-multilingual-base"  # Smaller model that works well with sentence-transformers
 MAX_TEXT_LENGTH = 1000  # Limit text length to avoid memory issues
 TOP_K = 3  # Number of related content items to find
+BATCH_TOKENS = 4096  # Padded tokens per encoding batch (rows x longest text in the batch)
+CHARS_PER_TOKEN = 4  # Estimate of the token length when the model has no tokenizer
+SEARCH_MARGIN = 5  # Extra neighbors searched since the file itself and files of the same path are filtered out
+NUMPY_SEARCH_MAX_PAGES = 5000  # Larger corpora are searched with FAISS, smaller ones with NumPy
+# From HNSW_MIN_PAGES and IVFPQ_MIN_PAGES pages approximate indexes are used, see ann_index.py
+SEARCH_BLOCK_SCORES = 16 * 1024 * 1024  # Scores computed at once by the NumPy search (64 MB of float32)
+SEARCH_BACKENDS = ("auto", "numpy", "faiss") + ANN_BACKENDS
+EXTRACT_WORKERS = max(1, (os.cpu_count() or 1) // 2)  # Leave the other cores to the model
+MIN_FILES_PER_WORKER = 32  # Smaller corpora are parsed in the main process
+STREAM_CHUNK_FILES = 256  # Extracted files handed to the encoder at once
+PROJECTION_CANDIDATES = 10  # Neighbors kept per source page, projected ones must exist in the target language
+
+ENCODERS = ("torch", "onnx")  # PyTorch SentenceTransformer or int8 quantized ONNX model, see onnx_encoder.py
 
 # Global variables for model
 _model = None
+# Encoder backend used by load_model(), set with configure_encoder()
+_encoder_config = {'encoder': 'torch', 'onnx_dir': None, 'threads': None}
+# Memory limit of the run and directory of memory mapped matrices, set with configure_memory()
+_memory_config = {'guard': None, 'spill_dir': None}
+# Process pool parsing content files of all languages, set with configure_extraction()
+_extraction_config = {'pool': None}
+
+@contextmanager
+def startup_timer(label):
+    """Record how long the block took in STARTUP_TIMINGS."""
+    start = time.perf_counter()
+    yield
+    STARTUP_TIMINGS.append((label, time.perf_counter() - start))
+
+def print_startup_profile():
+    """Print import and model load timings."""
+    print("\nStartup profile:")
+    for label, seconds in STARTUP_TIMINGS:
+        print(f"  {label:<45} {seconds:7.3f}s")
+    print(f"  {'total run time':<45} {time.perf_counter() - _startup_time:7.3f}s")
+
+def import_faiss():
+    """Import FAISS, timing the first import."""
+    if 'faiss' in sys.modules:
+        return sys.modules['faiss']
+    with startup_timer("import faiss"):
+        return importlib.import_module('faiss')
+
+def model_available_locally(model_name):
+    """Return whether the model is a local directory or fully downloaded in the Hugging Face cache."""
+    if os.path.isdir(model_name):
+        return True
+    try:
+        from huggingface_hub import snapshot_download
+        snapshot_download(model_name, local_files_only=True)
+        return True
+    except Exception:
+        return False
+
+def configure_encoder(encoder="torch", onnx_dir=None, threads=None):
+    """Choose the encoder backend loaded by load_model()."""
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder '{encoder}', expected one of {', '.join(ENCODERS)}")
+    _encoder_config.update(encoder=encoder, onnx_dir=onnx_dir, threads=threads)
+
+def configure_memory(max_memory=None, spill_dir=None):
+    """Set the memory limit in MB guarding the encoding batches and the embedding matrices."""
+    _memory_config.update(guard=MemoryGuard(max_memory * 1024 * 1024) if max_memory else None, spill_dir=spill_dir)
+
+def _worker_started():
+    return os.getpid()
+
+def configure_extraction(workers=1):
+    """
+    Start the process pool extract_files() parses content files in, reused by every language.
+
+    Call it before load_model(): forked workers would otherwise inherit the memory of
+    the loaded model, which the memory limit does not see as it measures this process.
+    """
+    shutdown_extraction()
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        # The first task forks all workers now, while the model is not loaded
+        pool.submit(_worker_started).result()
+        _extraction_config['pool'] = pool
+
+def shutdown_extraction():
+    """Stop the process pool started by configure_extraction()."""
+    pool = _extraction_config['pool']
+    if pool is not None:
+        pool.shutdown()
+        _extraction_config['pool'] = None
+
+def allocate_embeddings(rows, dimension):
+    """
+    Return a zeroed float32 matrix for the embeddings of rows pages.
+
+    When the matrix does not fit under the memory limit, it is memory mapped to a
+    temporary file in the spill directory, removed once the matrix is released.
+    """
+    size = rows * dimension * np.dtype(np.float32).itemsize
+    guard = _memory_config['guard']
+    if guard is None or guard.fits(size):
+        return np.zeros((rows, dimension), dtype=np.float32)
+    spill_dir = _memory_config['spill_dir']
+    if spill_dir:
+        os.makedirs(spill_dir, exist_ok=True)
+    print(f"Memory mapping the {format_bytes(size)} embedding matrix of {rows} pages")
+    return np.memmap(tempfile.TemporaryFile(dir=spill_dir), dtype=np.float32, mode='w+', shape=(rows, dimension))
+
+def encoder_model_name(model_name, encoder="torch"):
+    """Return the name embeddings of a model and encoder are stored under, quantized models give other vectors."""
+    return model_name if encoder == "torch" else f"{model_name}@{encoder}-int8"
 
 def load_model(model_name):
     """Load the model once."""
     global _model
     
     # Only load if not already loaded
-    if _model is None:
+    if _model is None and _encoder_config['encoder'] == "onnx":
+        print(f"Loading ONNX model: {model_name}")
+        with startup_timer("load ONNX model"):
+            from onnx_encoder import load_onnx_encoder
+            _model = load_onnx_encoder(model_name, _encoder_config['onnx_dir'], _encoder_config['threads'])
+    elif _model is None:
         print(f"Loading model: {model_name}")
         
         # Import here to delay loading these heavy libraries until needed
-        from sentence_transformers import SentenceTransformer
+        with startup_timer("import sentence_transformers (torch)"):
+            from sentence_transformers import SentenceTransformer
         
         # Load the model using sentence_transformers
-        _model = SentenceTransformer(model_name, trust_remote_code=True)
+        with startup_timer("load model"):
+            _model = SentenceTransformer(model_name, trust_remote_code=True)
     else:
         print("Using already loaded model")
     
@@ -79,43 +229,52 @@ def parse_args():
     parser.add_argument("--hugo-root", type=str, 
                         default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")),
                         help="Hugo root directory (default: two levels up from script location)")
+    parser.add_argument("--embedding-cache-dir", type=str, default=None,
+                        help="Directory of the embedding store (default: .embedding_cache in the Hugo root)")
+    parser.add_argument("--no-embedding-cache", action="store_true",
+                        help="Encode all pages without reading or updating the embedding store")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only recompute related content of pages affected by files changed since the last run")
+    parser.add_argument("--changed-since", type=str, default=None,
+                        help="With --incremental, also treat files changed since this git revision as changed")
+    parser.add_argument("--batch-tokens", type=int, default=BATCH_TOKENS,
+                        help=f"Token budget of an encoding batch, texts of similar length are batched together (default: {BATCH_TOKENS})")
+    parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS,
+                        help=f"Processes parsing markdown while the model encodes, 1 parses in the main process (default: {EXTRACT_WORKERS})")
+    parser.add_argument("--encoder", type=str, choices=ENCODERS, default="torch",
+                        help="Encoder backend, onnx runs an int8 quantized export of the model with onnxruntime (default: torch)")
+    parser.add_argument("--onnx-dir", type=str, default=None,
+                        help="Directory of exported ONNX models (default: onnx in the embedding cache directory)")
+    parser.add_argument("--onnx-threads", type=int, default=None,
+                        help="Threads used by onnxruntime (default: all cores)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Never download the model, fail at once when it is not available locally")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print import and model load timings at the end of the run")
+    parser.add_argument("--project-from", type=str, default=None,
+                        help="Compute neighbors once on this language (e.g. en) and project them to the other languages by relative path")
+    parser.add_argument("--embedding-precision", type=str, choices=PRECISIONS, default="float32",
+                        help="Precision of the normalized embeddings kept in memory for the search, float16 and int8 cut memory (default: float32)")
+    parser.add_argument("--search-backend", type=str, choices=SEARCH_BACKENDS, default="auto",
+                        help=f"Nearest neighbor search backend, auto uses exact search with NumPy up to {NUMPY_SEARCH_MAX_PAGES} pages "
+                             f"and FAISS above, approximate hnsw from {HNSW_MIN_PAGES} and ivfpq from {IVFPQ_MIN_PAGES} pages (default: auto)")
+    parser.add_argument("--max-memory", type=int, default=None,
+                        help="Memory limit in MB, encoding batches shrink when it gets close and larger embedding matrices "
+                             "are memory mapped (e.g. 1800 on 2 GB CI runners, default: no limit)")
     return parser.parse_args()
 
-def extract_text_from_markdown(content):
-    """Extract text content from markdown, removing HTML tags."""
+def extract_text_from_markdown(content, max_length=MAX_TEXT_LENGTH):
+    """Extract text content from markdown, removing markdown syntax, Hugo shortcodes and HTML tags."""
     try:
-        # Convert markdown to HTML
-        html = markdown.markdown(content)
-        # Parse HTML and extract text
-        soup = BeautifulSoup(html, 'html.parser')
-        # Get text and normalize whitespace
-        text = soup.get_text(separator=' ', strip=True)
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+        # Strip the syntax line by line, stopping once max_length characters are collected
+        return markdown_to_text(content, max_length)
     except Exception as e:
         print(f"Error extracting text from markdown: {e}")
         return ""
 
-def process_content_files(hugo_root=None, lang=None, content_dir=None, exclude_sections=None, path=None):
-    """Process content files and extract relevant information."""
-    # Determine the content directory
-    if path:
-        content_directory = path
-    elif content_dir:
-        content_directory = os.path.join(hugo_root, content_dir, lang)
-    else:
-        content_directory = os.path.join(hugo_root, "content", lang)
-    
-    print(f"Processing content files in: {content_directory}")
-    
-    # Check if the content directory exists
-    if not os.path.exists(content_directory):
-        print(f"Content directory not found: {content_directory}")
-        return []
-    
-    # Process content files
-    file_data = []
+def list_content_files(content_directory, exclude_sections=None):
+    """Return tuples (file_path, rel_path, stat) of the markdown files of a content directory."""
+    content_files = []
     
     # Walk through the content directory
     for root, _, files in os.walk(content_directory):
@@ -146,169 +305,446 @@ def process_content_files(hugo_root=None, lang=None, content_dir=None, exclude_s
                         # print(f"Skipping excluded item: {rel_path} due to rule: {exclusion_item}")
                         continue
 
-                # Extract section from path
-                path_parts = rel_path.split(os.sep)
-                section = path_parts[0] if len(path_parts) > 1 else ""
-                
-                # Check if this is an index file
-                is_index = file.lower() == "_index.md"
-                
-                try:
-                    # Parse frontmatter and content using TOMLHandler
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        post = frontmatter.load(f, handler=TOMLHandler())
-
-                    # Extract slug - handle index files differently
-                    if is_index:
-                        # For _index.md files, use the directory path as the slug
-                        parent_dir = os.path.dirname(rel_path)
-                        if parent_dir:
-                            # Get the last part of the directory path
-                            slug = os.path.basename(parent_dir)
-                        else:
-                            # If it's in the root, use the section
-                            slug = section if section else "index"
-                    else:
-                        # For regular files, use the slug from frontmatter or filename
-                        slug = post.get("slug", os.path.splitext(file)[0])
-                    
-                    # Extract title from frontmatter
-                    title = post.get("title", "")
-                    
-                    # Extract text from content
-                    text = extract_text_from_markdown(post.content)
-                    
-                    # Limit text length to avoid memory issues
-                    if len(text) > MAX_TEXT_LENGTH:
-                        text = text[:MAX_TEXT_LENGTH]
-                    
-                    # Add to file data
-                    file_data.append({
-                        "path": rel_path,
-                        "section": section,
-                        "slug": slug,
-                        "title": title,
-                        "text": text,
-                        "is_index": is_index
-                    })
-                except Exception as e:
-                    print(f"Error processing file {file_path}: {e}")
+                content_files.append((file_path, rel_path, os.stat(file_path)))
     
-    print(f"Found {len(file_data)} content files")
-    return file_data
+    return content_files
 
-def generate_embeddings(file_data, model_name):
-    """Generate embeddings for the file data using the specified model."""
-    # Load the model (will reuse if already loaded)
-    model = load_model(model_name)
+def extract_file_info(file_path, rel_path, stat=None):
+    """Extract section, slug, title and text of a content file, returns None on error."""
+    file = os.path.basename(file_path)
+    
+    # Extract section from path
+    path_parts = rel_path.split(os.sep)
+    section = path_parts[0] if len(path_parts) > 1 else ""
     
-    # Process files in batches to manage memory
-    embeddings = []
-    batch_size = 8  # Process multiple files at a time, adjust based on memory constraints
+    # Check if this is an index file
+    is_index = file.lower() == "_index.md"
     
-    for i in range(0, len(file_data), batch_size):
-        batch = file_data[i:i+batch_size]
-        texts = [item['text'] for item in batch]
+    try:
+        # Parse frontmatter and content using TOMLHandler
+        with open(file_path, "r", encoding="utf-8") as f:
+            post = frontmatter.load(f, handler=TOMLHandler())
+
+        # Extract slug - handle index files differently
+        if is_index:
+            # For _index.md files, use the directory path as the slug
+            parent_dir = os.path.dirname(rel_path)
+            if parent_dir:
+                # Get the last part of the directory path
+                slug = os.path.basename(parent_dir)
+            else:
+                # If it's in the root, use the section
+                slug = section if section else "index"
+        else:
+            # For regular files, use the slug from frontmatter or filename
+            slug = post.get("slug", os.path.splitext(file)[0])
+        
+        # Extract title from frontmatter
+        title = post.get("title", "")
         
-        print(f"Processing batch {i//batch_size + 1}/{(len(file_data) + batch_size - 1)//batch_size}")
+        # Extract text from content
+        text = extract_text_from_markdown(post.content)
         
-        # Generate embeddings using sentence_transformers
-        batch_embeddings = model.encode(texts, show_progress_bar=False)
+        # Limit text length to avoid memory issues
+        if len(text) > MAX_TEXT_LENGTH:
+            text = text[:MAX_TEXT_LENGTH]
         
-        embeddings.extend(batch_embeddings)
+        stat = stat or os.stat(file_path)
+        return {
+            "path": rel_path,
+            "section": section,
+            "slug": slug,
+            "title": title,
+            "text": text,
+            "text_hash": hash_content(text),
+            "is_index": is_index,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size
+        }
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        return None
+
+def extract_files(files, workers=1):
+    """
+    Yield extracted file info (or None on error) of (file_path, rel_path, stat) tuples, in order.
+
+    With more than one worker the files are parsed in a process pool, the one started
+    by configure_extraction() when there is one. All files are submitted at once, so
+    workers keep parsing while the caller consumes results.
+    """
+    workers = min(workers, len(files) // MIN_FILES_PER_WORKER)
+    if workers <= 1:
+        for file_path, rel_path, stat in files:
+            yield extract_file_info(file_path, rel_path, stat)
+        return
     
-    # Convert list to numpy array
-    embeddings = np.array(embeddings).astype('float32')
+    file_paths, rel_paths, stats = zip(*files)
+    chunksize = max(1, len(files) // (workers * 8))
+    if _extraction_config['pool'] is not None:
+        yield from _extraction_config['pool'].map(extract_file_info, file_paths, rel_paths, stats, chunksize=chunksize)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(extract_file_info, file_paths, rel_paths, stats, chunksize=chunksize)
+
+def process_content_files(hugo_root=None, lang=None, content_dir=None, exclude_sections=None, path=None, workers=1):
+    """Process content files and extract relevant information."""
+    # Determine the content directory
+    if path:
+        content_directory = path
+    elif content_dir:
+        content_directory = os.path.join(hugo_root, content_dir, lang)
+    else:
+        content_directory = os.path.join(hugo_root, "content", lang)
     
+    print(f"Processing content files in: {content_directory}")
+    
+    # Check if the content directory exists
+    if not os.path.exists(content_directory):
+        print(f"Content directory not found: {content_directory}")
+        return []
+    
+    # Process content files
+    file_data = []
+    for file_info in extract_files(list_content_files(content_directory, exclude_sections), workers):
+        if file_info:
+            # Add to file data
+            file_data.append(file_info)
+    
+    print(f"Found {len(file_data)} content files")
+    return file_data
+
+def count_tokens(model, texts):
+    """Return the token length of each text, capped at the maximum sequence length of the model."""
+    max_length = getattr(model, 'max_seq_length', None)
+    tokenizer = getattr(model, 'tokenizer', None)
+    if tokenizer is not None:
+        input_ids = tokenizer(texts, add_special_tokens=True, truncation=max_length is not None,
+                              max_length=max_length)['input_ids']
+        return [len(ids) for ids in input_ids]
+    lengths = [len(text) // CHARS_PER_TOKEN + 2 for text in texts]
+    return [min(length, max_length) for length in lengths] if max_length else lengths
+
+def plan_batches(lengths, batch_tokens=BATCH_TOKENS, memory_guard=None):
+    """
+    Group texts of similar token length into batches.
+
+    Texts are sorted by length, longest first, and a batch is closed once its padded
+    size (number of texts times the longest text) would exceed batch_tokens, so short
+    texts are encoded in large batches and long ones in small batches.
+
+    Batches are planned one at a time, with memory_guard the budget of each batch is
+    checked against the memory used after encoding the previous ones.
+
+    Yields:
+        list: Batches as lists of positions in lengths
+    """
+    budget = memory_guard.batch_tokens(batch_tokens) if memory_guard else batch_tokens
+    batch = []
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        # The first text of a batch is its longest one
+        if batch and (len(batch) + 1) * lengths[batch[0]] > budget:
+            yield batch
+            batch = []
+            if memory_guard:
+                budget = memory_guard.batch_tokens(batch_tokens)
+        batch.append(i)
+    if batch:
+        yield batch
+
+def encode_texts(model, texts, batch_tokens=BATCH_TOKENS, out=None, rows=None):
+    """
+    Encode texts in batches of similar length, returns a float32 matrix in the order of texts.
+
+    With out, the embedding of texts[i] is written to row rows[i] of out (row i when rows
+    is None) and out is returned, otherwise the matrix is allocated with the first batch.
+    """
+    from tqdm import tqdm
+    
+    rows = np.arange(len(texts)) if rows is None else np.asarray(rows)
+    batches = 0
+    
+    with tqdm(total=len(texts), desc="Encoding") as progress:
+        for batch in plan_batches(count_tokens(model, texts), batch_tokens, _memory_config['guard']):
+            batch_embeddings = model.encode([texts[i] for i in batch], batch_size=len(batch),
+                                            show_progress_bar=False)
+            if out is None:
+                out = allocate_embeddings(len(texts), batch_embeddings.shape[1])
+            # Restore the original order of the texts
+            out[rows[batch]] = batch_embeddings
+            batches += 1
+            progress.update(len(batch))
+    
+    print(f"Encoded {len(texts)} texts in {batches} batches")
+    return out
+
+def generate_embeddings(file_data, model_name, store=None, batch_tokens=BATCH_TOKENS, out=None):
+    """
+    Generate embeddings for the file data using the specified model.
+
+    Embeddings found in the store are reused, only the remaining texts are encoded
+    and added to the store. The model is only loaded when something needs encoding.
+    Embeddings are L2 normalized, so their inner product is the cosine similarity.
+
+    Embeddings are written in place into out (a float32 matrix with a row per file),
+    or into a matrix from allocate_embeddings() when out is None, which is returned.
+    """
+    if out is None and store is not None and store.dimension is not None:
+        out = allocate_embeddings(len(file_data), store.dimension)
+    if store is not None:
+        embeddings, missing = store.lookup([item['text_hash'] for item in file_data], out)
+        print(f"Embeddings found in store: {len(file_data) - len(missing)}/{len(file_data)}")
+    else:
+        embeddings, missing = out, list(range(len(file_data)))
+    if not missing:
+        # Normalizing again is harmless, stores written before normalization hold raw vectors
+        return normalize(embeddings, out=embeddings)
+
+    # Load the model (will reuse if already loaded)
+    model = load_model(model_name)
+    
+    # Encode texts in batches bounded by a token budget to manage memory
+    start_time = time.monotonic()
+    texts = [file_data[j]['text'] for j in missing]
+    embeddings = encode_texts(model, texts, batch_tokens, embeddings, missing)
+    normalize(embeddings, out=embeddings)
+    
+    if store is not None:
+        store.put(texts, embeddings[missing], time.monotonic() - start_time)
+    
+    return embeddings
+
+def embed_chunk(args, chunk, store, embeddings, start, total):
+    """
+    Generate the embeddings of a chunk of extracted files into rows start.. of embeddings.
+
+    The matrix of all total files is allocated once its dimension is known, with the
+    first chunk, and returned. Chunks are written into it in place.
+    """
+    if embeddings is None:
+        chunk_embeddings = generate_embeddings(chunk, args.model, store, args.batch_tokens)
+        embeddings = allocate_embeddings(total, chunk_embeddings.shape[1])
+        embeddings[start:start + len(chunk)] = chunk_embeddings
+    else:
+        generate_embeddings(chunk, args.model, store, args.batch_tokens, embeddings[start:start + len(chunk)])
     return embeddings
 
+def embed_content_files(args, content_directory, store=None):
+    """
+    Extract the content files of a directory and generate their embeddings.
+
+    Files are parsed by --extract-workers processes and their texts are encoded in
+    chunks of STREAM_CHUNK_FILES as soon as they are extracted, so the model works
+    while the remaining files are being parsed. Chunks are embedded in place into one
+    matrix preallocated for all files (memory mapped above --max-memory).
+
+    Returns:
+        tuple: (file_data, float32 embeddings or None when there are no files)
+    """
+    print(f"Processing content files in: {content_directory}")
+    
+    # Check if the content directory exists
+    if not os.path.exists(content_directory):
+        print(f"Content directory not found: {content_directory}")
+        return [], None
+    
+    files = list_content_files(content_directory, args.exclude_sections)
+    file_data = []
+    embeddings = None
+    chunk = []
+    for file_info in extract_files(files, args.extract_workers):
+        if file_info:
+            chunk.append(file_info)
+        if len(chunk) >= STREAM_CHUNK_FILES:
+            embeddings = embed_chunk(args, chunk, store, embeddings, len(file_data), len(files))
+            file_data.extend(chunk)
+            chunk = []
+    if chunk:
+        embeddings = embed_chunk(args, chunk, store, embeddings, len(file_data), len(files))
+        file_data.extend(chunk)
+    
+    print(f"Found {len(file_data)} content files")
+    # Files which could not be parsed leave unused rows at the end
+    return file_data, embeddings[:len(file_data)] if file_data else None
+
 def build_index(embeddings):
-    """Build a FAISS index for the embeddings."""
+    """Build a FAISS index for an EmbeddingMatrix, compressed like the matrix."""
     print("Building FAISS index...")
     
     # Import here to delay loading until needed
-    import faiss
+    faiss = import_faiss()
     
     # Get the dimension of the embeddings
-    dimension = embeddings.shape[1]
+    dimension = embeddings.dimension
     
-    # Create a flat index (exact search)
-    index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity with normalized vectors
+    # Inner product for cosine similarity with normalized vectors
+    if embeddings.precision == 'float16':
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif embeddings.precision == 'int8':
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        # The quantizer learns the range of each dimension
+        index.train(embeddings.rows(slice(0, 65536)))
+    else:
+        # Create a flat index (exact search)
+        index = faiss.IndexFlatIP(dimension)
     
-    # Add vectors to the index
-    index.add(embeddings)
+    # Add vectors to the index, decoded block by block
+    for _, block in embeddings.blocks():
+        index.add(np.ascontiguousarray(block))
     
     return index
 
-def find_related_content(file_data, embeddings, top_k=TOP_K):
-    """Find related content for each file using FAISS."""
-    print("Finding related content...")
+def related_file_path(rel_path, is_index):
+    """Return the path referencing a file in the related content YAML: section/file, or the directory of _index.md"""
+    # Convert path format: section/file.md -> section/file
+    related_path = rel_path[:-3] if rel_path.endswith('.md') else rel_path
     
-    # Build the index
-    index = build_index(embeddings)
+    # Special handling for _index.md files - use their directory
+    if is_index:
+        # Get the directory containing the _index.md file
+        related_dir = os.path.dirname(related_path)
+        if related_dir:
+            related_path = related_dir
+    return related_path
+
+def search_numpy(embeddings, queries, k):
+    """
+    Exact inner product search of an EmbeddingMatrix with blocked NumPy matrix products,
+    without importing FAISS.
+
+    Returns:
+        tuple: (scores, indices) of the k best matches of each query, best first
+    """
+    count = len(embeddings)
+    k = min(k, count)
+    block_rows = max(1, SEARCH_BLOCK_SCORES // max(count, 1))
+    scores = np.empty((len(queries), k), dtype=np.float32)
+    indices = np.empty((len(queries), k), dtype=np.int64)
     
-    # Find related content for each file
-    related_content = defaultdict(lambda: defaultdict(list))
+    for start in range(0, len(queries), block_rows):
+        block_scores = embeddings.inner_products(queries[start:start + block_rows])
+        if k < count:
+            # Unordered k best matches of each row, then sorted below
+            top = np.argpartition(-block_scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(count), block_scores.shape)
+        top_scores = np.take_along_axis(block_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        scores[start:start + block_rows] = np.take_along_axis(top_scores, order, axis=1)
+        indices[start:start + block_rows] = np.take_along_axis(top, order, axis=1)
     
-    for i, file_info in enumerate(tqdm(file_data)):
-        section = file_info['section']
-        slug = file_info['slug']
-        current_path = file_info['path']
-        is_index = file_info.get('is_index', False)
-        
-        # Normalize current path for comparison
-        current_normalized_path = current_path
-        if current_normalized_path.endswith('.md'):
-            current_normalized_path = current_normalized_path[:-3]
-        
-        # Skip if no section (like root _index.md)
-        if not section:
-            continue
-        
-        # Search for similar files
-        query_vector = embeddings[i].reshape(1, -1)
-        # Request more results than we need since we'll filter some out
-        search_k = top_k + 5  
-        distances, indices = index.search(query_vector, min(search_k, len(file_data)))
-        
-        # Add related content (excluding the file itself)
-        added_count = 0
-        for j in indices[0]:
-            if added_count >= top_k:
-                break
-                
-            if j < len(file_data):  # Check bounds
-                related_file = file_data[j]
-                related_path = related_file['path']
-                related_is_index = related_file.get('is_index', False)
-                
-                # Convert path format: section/file.md -> section/file
-                if related_path.endswith('.md'):
-                    related_path = related_path[:-3]
-                
-                # Special handling for _index.md files - use their directory
-                if related_is_index:
-                    # Get the directory containing the _index.md file
-                    related_dir = os.path.dirname(related_path)
-                    if related_dir:
-                        related_path = related_dir
-                
-                # Skip if this is the same file or if the path matches
-                if j == i or related_path == current_normalized_path:
-                    continue
-                
-                # Add to related content
-                related_content[section][slug].append({
-                    'file': related_path
-                })
-                added_count += 1
+    return scores, indices
+
+def search_faiss(embeddings, queries, k, index=None):
+    """Inner product search of all queries with one FAISS call, exact unless an approximate index is given, see search_numpy()."""
+    if index is None:
+        index = build_index(embeddings)
+    scores, indices = index.search(np.ascontiguousarray(queries), min(k, len(embeddings)))
     
     # Free memory
     index = None
     gc.collect()
     
+    return scores, indices
+
+def choose_search_backend(count, backend="auto"):
+    """Return the search backend for a corpus of count pages."""
+    if backend != "auto":
+        return backend
+    if count <= NUMPY_SEARCH_MAX_PAGES:
+        return "numpy"
+    if count < HNSW_MIN_PAGES:
+        return "faiss"
+    return "hnsw" if count < IVFPQ_MIN_PAGES else "ivfpq"
+
+def find_neighbors(file_data, embeddings, top_k=TOP_K, query_indices=None, backend="auto", index_prefix=None,
+                   model_name=None):
+    """
+    Find the most similar files of each file.
+
+    All files are searched at once, the file itself and files with the same path
+    in the related content YAML are filtered out of the results.
+
+    Args:
+        file_data (list): Extracted file data
+        embeddings (EmbeddingMatrix): Normalized embedding of each file, a float32 matrix is accepted too
+        top_k (int): Number of related files to find
+        query_indices (iterable): Positions of the files to find neighbors of (default: all files)
+        backend (str): Search backend, one of SEARCH_BACKENDS
+        index_prefix (str): Path prefix of persisted approximate index files, e.g. .embedding_cache/related/en
+        model_name (str): Model and encoder of the embeddings, part of the fingerprint of persisted indexes
+
+    Returns:
+        dict: {position: (positions of related files, score of the weakest one or None when fewer than top_k)},
+              files without a section are left out
+    """
+    if not isinstance(embeddings, EmbeddingMatrix):
+        embeddings = EmbeddingMatrix(embeddings)
+    if query_indices is None:
+        query_indices = range(len(file_data))
+    
+    # Skip files without section (like root _index.md)
+    queries = np.array([i for i in query_indices if file_data[i]['section']], dtype=np.int64)
+    if not len(queries):
+        return {}
+    
+    backend = choose_search_backend(len(file_data), backend)
+    print(f"Searching neighbors of {len(queries)} files with {backend}")
+    # Request more results than we need since we'll filter some out
+    search_k = top_k + SEARCH_MARGIN
+    if backend == "numpy":
+        scores, indices = search_numpy(embeddings, embeddings.rows(queries), search_k)
+    elif backend in ANN_BACKENDS:
+        index_path = f"{index_prefix}.{backend}.faiss" if index_prefix else None
+        import_faiss()
+        text_hashes = [file_info.get('text_hash') for file_info in file_data] if index_prefix else None
+        index = load_or_build_ann_index(embeddings, backend, index_path, text_hashes, model_name)
+        scores, indices = search_faiss(embeddings, embeddings.rows(queries), search_k, index)
+    else:
+        scores, indices = search_faiss(embeddings, embeddings.rows(queries), search_k)
+    
+    # A file is not related to itself or to a file with the same path, e.g. section.md and section/_index.md
+    path_keys = {}
+    related_keys = np.array([path_keys.setdefault(related_file_path(file_info['path'], file_info.get('is_index', False)),
+                                                  len(path_keys)) for file_info in file_data] + [-1])
+    own_keys = np.array([path_keys.get(file_data[i]['path'][:-3] if file_data[i]['path'].endswith('.md')
+                                       else file_data[i]['path'], -2) for i in queries])
+    # FAISS returns -1 for missing results, it maps to the extra key -1 which matches no file
+    valid = ((indices >= 0) & (indices != queries[:, None])
+             & (related_keys[indices] != own_keys[:, None]))
+    # Keep the first top_k valid results of each row
+    keep = valid & (np.cumsum(valid, axis=1) <= top_k)
+    
+    neighbors = {}
+    for row, i in enumerate(queries):
+        related = indices[row][keep[row]]
+        kth_score = float(scores[row][keep[row]][-1]) if len(related) >= top_k else None
+        neighbors[int(i)] = ([int(j) for j in related], kth_score)
+    
+    return neighbors
+
+def build_related_content(file_data, neighbors):
+    """Build the related content structure {section: {slug: [{'file': path}]}} from neighbors of files."""
+    related_content = defaultdict(lambda: defaultdict(list))
+    
+    for i, file_info in enumerate(file_data):
+        if i not in neighbors:
+            continue
+        
+        # Add to related content
+        for j in neighbors[i][0]:
+            related_file = file_data[j]
+            related_content[file_info['section']][file_info['slug']].append({
+                'file': related_file_path(related_file['path'], related_file.get('is_index', False))
+            })
+    
     return related_content
 
+def find_related_content(file_data, embeddings, top_k=TOP_K):
+    """Find related content for each file using FAISS."""
+    print("Finding related content...")
+    return build_related_content(file_data, find_neighbors(file_data, embeddings, top_k))
+
 def convert_defaultdict_to_dict(d):
     """Convert a defaultdict to a regular dictionary recursively."""
     if isinstance(d, defaultdict):
@@ -333,25 +769,210 @@ def generate_yaml(related_content, hugo_root, output_dir, lang):
         
     print(f"YAML file generated: {output_file}")
 
-def process_language(args, lang):
-    """Process a single language."""
+def related_signature(args):
+    """Return the settings related content depends on, state of runs with other settings is not reused"""
+    return {
+        'model': args.model,
+        'encoder': args.encoder,
+        'top_k': TOP_K,
+        'max_text_length': MAX_TEXT_LENGTH,
+        'text_extractor': 'markdown_text',
+        'similarity': 'cosine',
+        'precision': args.embedding_precision,
+        'search_backend': args.search_backend,
+        'exclude_sections': sorted(args.exclude_sections),
+    }
+
+def update_neighbors_incrementally(args, lang, content_dir, store, state):
+    """
+    Recompute neighbors only of pages affected by files changed since the last run.
+
+    A page is affected when it is new or its text changed, when one of its neighbors
+    changed or was deleted, or when a changed page is now more similar to it than its
+    weakest neighbor. Vectors of unchanged pages are read from the embedding store.
+
+    Returns:
+        tuple: (file_data, neighbors of all files, embeddings) or None when a full run is needed
+    """
+    forced = set()
+    if args.changed_since:
+        try:
+            forced = git_changed_files(content_dir, args.changed_since)
+        except (OSError, RuntimeError) as e:
+            print(f"Error listing files changed since {args.changed_since}, using modification times only: {e}")
+
+    files = list_content_files(content_dir, args.exclude_sections)
+    changed, deleted = state.changes(files, forced)
+
+    # Only changed files are parsed, unchanged pages are taken from the state
+    file_data = []
+    for file_path, rel_path, stat in files:
+        if rel_path in changed:
+            file_info = extract_file_info(file_path, rel_path, stat)
+            if file_info:
+                file_data.append(file_info)
+        elif state.pages[rel_path]['text_hash'] in store:
+            file_data.append(state.page_info(rel_path))
+        else:
+            print(f"Embedding of {rel_path} missing in the embedding store, rebuilding related content")
+            return None
+
+    if not file_data:
+        return None
+
+    positions = {file_info['path']: i for i, file_info in enumerate(file_data)}
+    moved = [i for i, file_info in enumerate(file_data) if file_info['path'] in changed
+             and state.pages.get(file_info['path'], {}).get('text_hash') != file_info['text_hash']]
+    # Changed files which could not be parsed are gone like deleted ones
+    stale = deleted | (changed - set(positions)) | {file_data[i]['path'] for i in moved}
+
+    embeddings = EmbeddingMatrix(generate_embeddings(file_data, args.model, store, args.batch_tokens),
+                                 args.embedding_precision)
+
+    affected = set(moved)
+    if moved:
+        # Highest similarity of every page to any changed page
+        best_scores = embeddings.inner_products(embeddings.rows(moved)).max(axis=0)
+    for i, file_info in enumerate(file_data):
+        if i in affected or not file_info['section']:
+            continue
+        page = state.pages[file_info['path']]
+        if stale.intersection(page['neighbors']):
+            affected.add(i)
+        elif moved and (page['kth_score'] is None or best_scores[i] >= page['kth_score']):
+            affected.add(i)
+
+    print(f"Incremental update of {lang}: {len(changed)} changed or added, {len(deleted)} deleted, "
+          f"recomputing related content of {len(affected)} of {len(file_data)} pages")
+
+    neighbors = (find_neighbors(file_data, embeddings, query_indices=sorted(affected), backend=args.search_backend,
+                                index_prefix=os.path.join(os.path.dirname(state.path), lang),
+                                model_name=encoder_model_name(args.model, args.encoder))
+                 if affected else {})
+    for i, file_info in enumerate(file_data):
+        if i not in affected and file_info['section']:
+            page = state.pages[file_info['path']]
+            neighbors[i] = ([positions[path] for path in page['neighbors']], page['kth_score'])
+
+    return file_data, neighbors, embeddings
+
+def project_neighbors(args, lang, content_dir, source, store=None):
+    """
+    Build neighbors of a translated language from the neighbors of the source language.
+
+    A page gets the source neighbors of the page with the same relative path, skipping
+    neighbors not translated to this language. Pages without a counterpart in the source
+    language, or left with fewer than TOP_K neighbors, are searched among all pages of the
+    language, with the source vectors standing in for pages that have a counterpart.
+
+    Args:
+        source (tuple): (file_data, embeddings, candidates) of the source language, candidates
+                        are the neighbors of each source page up to TOP_K + PROJECTION_CANDIDATES
+
+    Returns:
+        tuple: (file_data, neighbors) or None when the language has no content files
+    """
+    source_data, source_embeddings, candidates = source
+    source_positions = {file_info['path']: i for i, file_info in enumerate(source_data)}
+    
+    file_data = process_content_files(hugo_root=args.hugo_root, path=content_dir, exclude_sections=args.exclude_sections,
+                                      workers=args.extract_workers)
+    if not file_data:
+        return None
+    positions = {file_info['path']: i for i, file_info in enumerate(file_data)}
+    
+    neighbors = {}
+    fallback = []
+    for i, file_info in enumerate(file_data):
+        if not file_info['section']:
+            continue
+        source_i = source_positions.get(file_info['path'])
+        related = []
+        if source_i in candidates:
+            related = [positions[source_data[j]['path']] for j in candidates[source_i][0]
+                       if source_data[j]['path'] in positions][:TOP_K]
+        if len(related) < TOP_K:
+            fallback.append(i)
+        else:
+            neighbors[i] = (related, None)
+    
+    own = [i for i, file_info in enumerate(file_data) if file_info['path'] not in source_positions]
+    if fallback:
+        # Only pages without a source counterpart are encoded, the model is multilingual
+        embeddings = allocate_embeddings(len(file_data), source_embeddings.dimension)
+        own_set = set(own)
+        counterparts = [i for i in range(len(file_data)) if i not in own_set]
+        if counterparts:
+            embeddings[counterparts] = source_embeddings.rows([source_positions[file_data[i]['path']] for i in counterparts])
+        if own:
+            embeddings[own] = generate_embeddings([file_data[i] for i in own], args.model, store, args.batch_tokens)
+        embeddings = EmbeddingMatrix(embeddings, args.embedding_precision)
+        neighbors.update(find_neighbors(file_data, embeddings, query_indices=fallback, backend=args.search_backend))
+    
+    print(f"Projected related content of {len(neighbors) - len(fallback)} {lang} pages from {args.project_from}, "
+          f"searched {len(fallback)}, encoded {len(own)}")
+    return file_data, neighbors
+
+def process_language(args, lang, store=None, state_dir=None, source=None):
+    """
+    Process a single language.
+
+    With source, the neighbors of the source language are projected to this one,
+    see project_neighbors().
+
+    Returns:
+        tuple: (file_data, embeddings) of the language, embeddings are None for projected
+               languages, or None when there are no content files
+    """
     print(f"\nProcessing language: {lang}")
     
     # Determine the content directory for this language
     content_dir = os.path.join(args.path, lang) if args.path else os.path.join(args.hugo_root, "content", lang)
     
-    # Process content files
-    file_data = process_content_files(hugo_root=args.hugo_root, path=content_dir, exclude_sections=args.exclude_sections)
+    state = None
+    if state_dir and source is None:
+        # Projected neighbors are not recorded, the state of the last search of this language stays valid
+        state = RelatedContentState(os.path.join(state_dir, f"{lang}.json"), related_signature(args))
     
-    if not file_data:
-        print(f"No content files found for language: {lang}")
-        return
+    result = None
+    embeddings = None
+    if source is not None:
+        result = project_neighbors(args, lang, content_dir, source, store)
+        if not result:
+            print(f"No content files found for language: {lang}")
+            return None
+    elif args.incremental and state is not None and state.valid:
+        result = update_neighbors_incrementally(args, lang, content_dir, store, state)
+        if result:
+            result, embeddings = result[:2], result[2]
+    
+    if result:
+        file_data, neighbors = result
+    else:
+        # Process content files and generate embeddings while they are being parsed
+        file_data, embeddings = embed_content_files(args, content_dir, store)
+        
+        if not file_data:
+            print(f"No content files found for language: {lang}")
+            return None
+        
+        embeddings = EmbeddingMatrix(embeddings, args.embedding_precision)
+        
+        # Find related content
+        print("Finding related content...")
+        index_prefix = os.path.join(state_dir, lang) if state_dir else None
+        neighbors = find_neighbors(file_data, embeddings, backend=args.search_backend, index_prefix=index_prefix,
+                                   model_name=encoder_model_name(args.model, args.encoder))
     
-    # Generate embeddings
-    embeddings = generate_embeddings(file_data, args.model)
+    # Remember pages and their neighbors for the next incremental run
+    if state is not None:
+        state.replace_pages({file_info['path'] for file_info in file_data})
+        for i, file_info in enumerate(file_data):
+            related, kth_score = neighbors.get(i, ([], None))
+            state.record(file_info, [file_data[j]['path'] for j in related], kth_score)
+        state.save()
     
-    # Find related content
-    related_content = find_related_content(file_data, embeddings)
+    related_content = build_related_content(file_data, neighbors)
     
     # Convert defaultdict to regular dict for clean YAML output
     related_content_dict = convert_defaultdict_to_dict(related_content)
@@ -369,6 +990,20 @@ def process_language(args, lang):
     
     # Clean up memory for this language
     gc.collect()
+    
+    return file_data, embeddings
+
+def print_resource_usage(usage):
+    """Print wall time and peak resident memory of each processed language."""
+    if not usage:
+        return
+    print("\nResource usage:")
+    print(f"  {'language':<10} {'pages':>8} {'wall time':>10} {'peak RSS':>12}")
+    for lang, pages, seconds, peak in usage:
+        print(f"  {lang:<10} {pages:>8} {seconds:>9.1f}s {format_bytes(peak):>12}")
+    guard = _memory_config['guard']
+    if guard is not None:
+        print(f"  memory limit {format_bytes(guard.max_bytes)}")
 
 def main():
     """Main function to run the script."""
@@ -391,9 +1026,71 @@ def main():
     
     print(f"Found languages: {', '.join(languages)}")
     
+    cache_dir = args.embedding_cache_dir or os.path.join(args.hugo_root, ".embedding_cache")
+    onnx_dir = args.onnx_dir or os.path.join(cache_dir, "onnx")
+    configure_encoder(args.encoder, onnx_dir, args.onnx_threads)
+    configure_memory(args.max_memory, os.path.join(cache_dir, "spill"))
+    
+    if args.offline:
+        # Hugging Face libraries read these when they are imported
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+        with startup_timer("check model cache"):
+            # An exported ONNX model needs nothing else, otherwise the model is exported from the cache
+            from onnx_encoder import is_exported, onnx_model_dir
+            available = ((args.encoder == "onnx" and is_exported(onnx_model_dir(onnx_dir, args.model)))
+                         or model_available_locally(args.model))
+        if not available:
+            print(f"Error: --offline but model {args.model} is not available locally, "
+                  f"download it first or run without --offline")
+            sys.exit(1)
+    
+    if args.incremental and args.no_embedding_cache:
+        print("Error: --incremental requires the embedding store, remove --no-embedding-cache")
+        return
+    
+    if args.project_from:
+        if args.project_from not in languages:
+            print(f"Error: language to project from not found: {args.project_from}")
+            return
+        # The source language is processed first
+        languages.remove(args.project_from)
+        languages.insert(0, args.project_from)
+    
+    # Workers are forked before the model is loaded
+    configure_extraction(args.extract_workers)
+    store = None
+    state_dir = None
+    if not args.no_embedding_cache:
+        store_dir = cache_dir
+        store = EmbeddingStore(store_dir, encoder_model_name(args.model, args.encoder))
+        state_dir = os.path.join(store_dir, "related")
+        print(f"Using embedding store: {store_dir} ({len(store)} embeddings)")
+
     # Process each language
-    for lang in languages:
-        process_language(args, lang)
+    usage = []
+    try:
+        source = None
+        for lang in languages:
+            reset_peak_rss()
+            start_time = time.monotonic()
+            result = process_language(args, lang, store, state_dir, source)
+            if lang == args.project_from and result:
+                file_data, embeddings = result
+                print(f"Finding {TOP_K + PROJECTION_CANDIDATES} neighbors of {lang} pages to project to other languages")
+                candidates = find_neighbors(file_data, embeddings, top_k=TOP_K + PROJECTION_CANDIDATES,
+                                            backend=args.search_backend)
+                source = (file_data, embeddings, candidates)
+            usage.append((lang, len(result[0]) if result else 0, time.monotonic() - start_time, peak_rss()))
+    finally:
+        shutdown_extraction()
+        if store is not None:
+            store.save()
+            store.print_report()
+        print_resource_usage(usage)
+    
+    if args.profile_startup:
+        print_startup_profile()
     
     # Clean up global model resources at the end
     if '_model' in globals() and _model is not None:
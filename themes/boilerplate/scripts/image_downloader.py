@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+image_downloader.py
+
+Concurrent image downloader used by offload_replicate_images.py.
+
+Images are fetched by a thread pool over one pooled requests.Session, which:
+    - keeps HTTP connections alive, one pool per host sized for the workers
+    - limits the number of concurrent downloads per host (per_host)
+    - applies connect and read timeouts to every request
+    - retries connection errors, 429 and 5xx responses with exponential backoff
+
+Downloads are streamed in chunks of CHUNK_SIZE to a temporary file and hashed on
+the way, checked against the Content-Length and the magic bytes of image formats,
+and only then moved into the content-addressed ImageStore (see image_store.py).
+An interrupted run leaves no partial images that a rerun would take for downloaded
+ones.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_WORKERS = 16
+DEFAULT_PER_HOST = 4
+DEFAULT_TIMEOUT = (10, 60)  # Connect and read timeout in seconds
+DEFAULT_MAX_RETRIES = 3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of image formats, (offset, bytes, extension)
+IMAGE_SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', '.png'),
+    (0, b'\xff\xd8\xff', '.jpg'),
+    (0, b'GIF87a', '.gif'),
+    (0, b'GIF89a', '.gif'),
+    (8, b'WEBP', '.webp'),  # After RIFF and the size
+    (4, b'ftypavi', '.avif'),  # avif and avis brands
+    (4, b'ftyphei', '.heic'),  # heic and heix brands
+    (4, b'ftypmif1', '.heic'),
+    (0, b'BM', '.bmp'),
+    (0, b'II*\x00', '.tiff'),
+    (0, b'MM\x00*', '.tiff'),
+    (0, b'\x00\x00\x01\x00', '.ico'),
+]
+SIGNATURE_BYTES = 16
+
+class DownloadError(Exception):
+    """Raised when a downloaded file is incomplete or not an image"""
+
+def image_extension(header, content_type=''):
+    """Return the extension of the image format of a file by its leading bytes (SVG by its Content-Type), or None"""
+    if 'svg' in content_type:
+        return '.svg' if header.lstrip().startswith(b'<') else None
+    for offset, signature, ext in IMAGE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return ext
+    return None
+
+class ImageDownloader:
+    """
+    Downloads images concurrently with per-host concurrency limits and timeouts
+
+    Args:
+        workers (int): Maximum number of downloads in flight at once
+        per_host (int): Maximum number of downloads in flight to one host
+        timeout (tuple): (connect, read) timeout of each request in seconds
+        max_retries (int): Retries of connection errors and transient responses
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES):
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(['GET']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        self.host_slots = {}
+        self.downloaded = 0
+        self.existing = 0
+        self.failed = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_slots[host]
+
+    def _count(self, counter, amount=1):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _save(self, url, resp, store):
+        """Stream a response to a temporary file and add it to the store, returns (public path, bytes)"""
+        temp_path = store.temp_path()
+        try:
+            size = 0
+            header = b''
+            digest = hashlib.sha256()
+            with open(temp_path, 'wb') as imgf:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    if len(header) < SIGNATURE_BYTES:
+                        header += chunk[:SIGNATURE_BYTES - len(header)]
+                    digest.update(chunk)
+                    imgf.write(chunk)
+                    size += len(chunk)
+            # Bytes read over the wire, the body may be compressed
+            expected = resp.headers.get('Content-Length')
+            if expected is not None and expected.isdigit() and resp.raw.tell() != int(expected):
+                raise DownloadError(f"incomplete download, {resp.raw.tell()} of {expected} bytes")
+            ext = image_extension(header, resp.headers.get('Content-Type', ''))
+            if ext is None:
+                raise DownloadError(f"not an image, starts with {header[:8]!r}")
+            return store.add(url, temp_path, digest.hexdigest(), ext, size), size
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def download(self, url, store):
+        """
+        Download an image into an ImageStore, unless the store already has the URL
+
+        Args:
+            url (str): Image URL
+            store (ImageStore): Store of the downloaded images
+
+        Returns:
+            str: Public path of the image, or None when the download failed
+        """
+        path = store.path(url)
+        if path:
+            self._count('existing')
+            return path
+        try:
+            with self._host_slot(url), self.session.get(url, timeout=self.timeout, stream=True) as resp:
+                resp.raise_for_status()
+                path, size = self._save(url, resp, store)
+        except Exception as e:
+            print(f"!!! ERROR downloading image from {url}: {e}")
+            self._count('failed')
+            return None
+        self._count('downloaded')
+        self._count('bytes', size)
+        return path
+
+    def download_all(self, urls, store):
+        """
+        Download images concurrently into an ImageStore
+
+        Args:
+            urls (list): Distinct image URLs
+            store (ImageStore): Store of the downloaded images
+
+        Returns:
+            dict: {url: public path of the image or None when the download failed}
+        """
+        start_time = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = dict(zip(urls, executor.map(lambda url: self.download(url, store), urls)))
+        self.seconds += time.monotonic() - start_time
+        return results
+
+    def print_report(self):
+        """Print the download counters and throughput"""
+        print(f"Images downloaded: {self.downloaded}, already stored: {self.existing}, failed: {self.failed}")
+        if self.downloaded:
+            rate = self.bytes / self.seconds if self.seconds else 0.0
+            print(f"Downloaded {self.bytes / 1024 / 1024:.2f} MB in {self.seconds:.1f}s ({rate / 1024 / 1024:.2f} MB/s)")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+image_store.py
+
+Content-addressed store of the images offloaded by offload_replicate_images.py.
+
+Every image is stored once under the sha256 of its bytes, whichever pages and
+languages reference it, and a manifest maps the remote URLs to the stored images.
+A URL in the manifest is never downloaded again while its blob exists.
+
+Layout:
+    <blob dir>/<sha256[:2]>/<sha256><ext>  - image, published as <public prefix>/<sha256[:2]>/<sha256><ext>
+    <manifest>                             - {url: {"sha256": ..., "path": public path, "size": bytes}}
+
+The extension is derived from the image bytes (see image_downloader.image_extension),
+so identical bytes always get the same public path.
+"""
+
+import os
+import json
+import threading
+from pathlib import Path
+from translation_cache import write_file_atomic
+
+MANIFEST_VERSION = 1
+
+class ImageStore:
+    """
+    Content-addressed image store with a URL manifest
+
+    Args:
+        blob_dir (str or Path): Directory of the stored images, served by Hugo (e.g. static/images/blobs)
+        public_prefix (str): URL path blob_dir is published under (e.g. /images/blobs)
+        manifest_path (str or Path): JSON manifest of the stored URLs
+    """
+
+    def __init__(self, blob_dir, public_prefix, manifest_path):
+        self.blob_dir = Path(blob_dir)
+        self.public_prefix = public_prefix.rstrip('/')
+        self.manifest_path = Path(manifest_path)
+        self.lock = threading.Lock()
+        self.urls = {}
+        self.stored = 0
+        self.deduplicated = 0
+        self._load()
+
+    def _load(self):
+        if not self.manifest_path.exists():
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"!!! ERROR reading image manifest {self.manifest_path}, starting empty: {e}")
+            return
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.urls = manifest.get('urls', {})
+
+    def blob_path(self, digest, ext):
+        """Return the file of the blob with the given sha256 and extension"""
+        return self.blob_dir / digest[:2] / f"{digest}{ext}"
+
+    def path(self, url):
+        """Return the public path of a stored URL, or None when the URL is unknown or its blob is gone"""
+        entry = self.urls.get(url)
+        if entry is None:
+            return None
+        ext = os.path.splitext(entry['path'])[1]
+        return entry['path'] if self.blob_path(entry['sha256'], ext).exists() else None
+
+    def temp_path(self):
+        """Return a temporary file for a download in progress, on the file system of the blobs"""
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        return self.blob_dir / f".{os.getpid()}.{threading.get_ident()}.part"
+
+    def add(self, url, temp_path, digest, ext, size):
+        """
+        Store a downloaded image, moving temp_path into place unless the same bytes are already stored
+
+        Returns:
+            str: Public path of the image
+        """
+        blob = self.blob_path(digest, ext)
+        public_path = f"{self.public_prefix}/{digest[:2]}/{blob.name}"
+        with self.lock:
+            if blob.exists():
+                os.remove(temp_path)
+                self.deduplicated += 1
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp_path, blob)
+                self.stored += 1
+            self.urls[url] = {'sha256': digest, 'path': public_path, 'size': size}
+        return public_path
+
+    def save(self):
+        """Write the manifest"""
+        with self.lock:
+            manifest = {'version': MANIFEST_VERSION, 'urls': dict(sorted(self.urls.items()))}
+        write_file_atomic(str(self.manifest_path), json.dumps(manifest, indent=1))
+
+    def print_report(self):
+        """Print the store counters"""
+        blobs = len({entry['sha256'] for entry in self.urls.values()})
+        print(f"Image store: {len(self.urls)} URLs, {blobs} images, "
+              f"{self.stored} stored this run, {self.deduplicated} downloads matched stored bytes")
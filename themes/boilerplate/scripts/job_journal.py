@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+job_journal.py
+
+Durable journal of FlowHunt jobs scheduled by translate_with_flowhunt.py and generate_content.py.
+
+Every job is recorded in a SQLite database together with its inputs, the ID of the
+FlowHunt task processing it and its status (scheduled, completed or failed). Each
+change is committed immediately, so when a run is interrupted, the next run started
+with --resume re-attaches to the FlowHunt tasks that are still scheduled and collects
+their results instead of invoking (and paying for) the flows again.
+
+Usage:
+    python job_journal.py                      # list orphaned (scheduled) and failed jobs
+    python job_journal.py --status failed      # list failed jobs only
+    python job_journal.py --kind translate     # list jobs of the translation script only
+    python job_journal.py --purge-completed    # remove completed jobs from the journal
+"""
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+
+# Kept with the translation cache in the Hugo root, outside the source tree
+DEFAULT_JOURNAL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..',
+                                                    '.translation_cache', '.flowhunt_jobs.sqlite'))
+
+STATUS_SCHEDULED = 'scheduled'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+# FlowHunt keeps the results of a task for a limited time, older scheduled jobs are not resumed
+DEFAULT_MAX_AGE = 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    job_key TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    task_id TEXT,
+    inputs TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (kind, flow_id, status);
+'''
+
+class JobJournal:
+    """
+    SQLite journal of FlowHunt jobs
+
+    Args:
+        path (str): Path of the SQLite database
+        kind (str): Kind of jobs recorded by the calling script, e.g. 'translate' or 'generate'
+    """
+
+    def __init__(self, path, kind):
+        self.path = str(path)
+        self.kind = kind
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the database connection"""
+        self.connection.close()
+
+    def _execute(self, sql, params=()):
+        cursor = self.connection.execute(sql, params)
+        self.connection.commit()
+        return cursor
+
+    def scheduled(self, job_key, flow_id, task_id, inputs, job_id=None):
+        """
+        Record that a FlowHunt task was invoked for a job
+
+        Args:
+            job_key (str): Identifier of the job output, e.g. the target file
+            flow_id (str): FlowHunt flow ID
+            task_id (str): ID of the invoked FlowHunt task
+            inputs (dict): JSON serializable inputs needed to process the task result
+            job_id (int): ID of an existing job to update, e.g. when a job invokes another flow
+
+        Returns:
+            int: Job ID
+        """
+        now = time.time()
+        if job_id is not None:
+            self._execute(
+                'UPDATE jobs SET task_id = ?, inputs = ?, status = ?, error = NULL, updated_at = ? WHERE id = ?',
+                (task_id, json.dumps(inputs), STATUS_SCHEDULED, now, job_id)
+            )
+            return job_id
+        # A new task for the same output supersedes tasks left over by earlier runs
+        self.connection.execute(
+            'UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE kind = ? AND job_key = ? AND status = ?',
+            (STATUS_FAILED, 'superseded by a later run', now, self.kind, job_key, STATUS_SCHEDULED)
+        )
+        cursor = self._execute(
+            'INSERT INTO jobs (kind, job_key, flow_id, task_id, inputs, status, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.kind, job_key, flow_id, task_id, json.dumps(inputs), STATUS_SCHEDULED, now, now)
+        )
+        return cursor.lastrowid
+
+    def completed(self, job_id):
+        """Record that the result of a job was saved"""
+        self._execute('UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE id = ?',
+                      (STATUS_COMPLETED, time.time(), job_id))
+
+    def failed(self, job_id, error, job_key=None, flow_id=None, inputs=None):
+        """
+        Record that a job failed
+
+        When job_id is None (the flow could not even be invoked), a new failed job is recorded.
+        """
+        now = time.time()
+        if job_id is None:
+            self._execute(
+                'INSERT INTO jobs (kind, job_key, flow_id, inputs, status, error, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.kind, job_key, flow_id, json.dumps(inputs or {}), STATUS_FAILED, error, now, now)
+            )
+        else:
+            self._execute('UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+                          (STATUS_FAILED, error, now, job_id))
+
+    def pending(self, flow_id, max_age=DEFAULT_MAX_AGE):
+        """
+        Return jobs still scheduled on FlowHunt, e.g. left over by an interrupted run
+
+        Args:
+            flow_id (str): FlowHunt flow ID
+            max_age (float): Jobs scheduled more than max_age seconds ago are left out
+
+        Returns:
+            list: List of dicts with id, job_key, task_id and inputs
+        """
+        rows = self.connection.execute(
+            'SELECT id, job_key, task_id, inputs FROM jobs '
+            'WHERE kind = ? AND flow_id = ? AND status = ? AND updated_at >= ? ORDER BY id',
+            (self.kind, flow_id, STATUS_SCHEDULED, time.time() - max_age)
+        ).fetchall()
+        return [{'id': row['id'], 'job_key': row['job_key'], 'task_id': row['task_id'],
+                 'inputs': json.loads(row['inputs'])} for row in rows]
+
+def list_jobs(path, statuses, kind=None):
+    """Return journal rows with one of the given statuses, newest first"""
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        sql = f"SELECT * FROM jobs WHERE status IN ({', '.join('?' * len(statuses))})"
+        params = list(statuses)
+        if kind:
+            sql += ' AND kind = ?'
+            params.append(kind)
+        return connection.execute(sql + ' ORDER BY updated_at DESC', params).fetchall()
+    finally:
+        connection.close()
+
+def main():
+    """List orphaned and failed jobs of the journal"""
+    parser = argparse.ArgumentParser(description="List orphaned and failed FlowHunt jobs")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL_PATH,
+                        help="Path of the job journal (default: %(default)s)")
+    parser.add_argument("--status", nargs="+", default=[STATUS_SCHEDULED, STATUS_FAILED],
+                        choices=[STATUS_SCHEDULED, STATUS_COMPLETED, STATUS_FAILED],
+                        help="Statuses of jobs to list (default: scheduled failed)")
+    parser.add_argument("--kind", choices=['translate', 'generate'],
+                        help="Only list jobs of one script")
+    parser.add_argument("--purge-completed", action="store_true",
+                        help="Remove completed jobs from the journal")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.journal):
+        print(f"Job journal not found: {args.journal}")
+        return
+
+    if args.purge_completed:
+        connection = sqlite3.connect(args.journal)
+        with connection:
+            removed = connection.execute('DELETE FROM jobs WHERE status = ?', (STATUS_COMPLETED,)).rowcount
+        connection.close()
+        print(f"Removed {removed} completed jobs")
+        return
+
+    rows = list_jobs(args.journal, args.status, args.kind)
+    for row in rows:
+        updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['updated_at']))
+        status = 'orphaned' if row['status'] == STATUS_SCHEDULED else row['status']
+        line = f"{updated} {status:<9} {row['kind']:<9} {row['job_key']} (task {row['task_id'] or '-'})"
+        if row['error']:
+            line += f": {row['error']}"
+        print(line)
+    print(f"{len(rows)} jobs listed, use --resume in the scripts to collect results of orphaned jobs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+markdown_text.py
+
+Plain text of markdown content for generate_related_content.py.
+
+Only the beginning of a page is embedded, so instead of rendering the whole page
+to HTML and parsing the HTML again, the markdown is read line by line and its
+syntax stripped directly, until enough text has been collected:
+    - Hugo shortcodes ({{< lazyimg ... >}}, {{% ... %}}), also spanning lines, are
+      removed, text between paired shortcodes is kept
+    - HTML tags and comments, images and link reference definitions are removed
+    - headings, quotes, list markers, emphasis, inline code and table pipes are
+      stripped, link texts are kept
+    - fence lines and horizontal rules are skipped, code in fences is kept
+"""
+
+import re
+import html
+
+# Constructs which can span lines: (opening, closing)
+MULTILINE_BLOCKS = (('{{<', '>}}'), ('{{%', '%}}'), ('<!--', '-->'))
+
+SHORTCODE = re.compile(r'\{\{[<%].*?[%>]\}\}')
+HTML_COMMENT = re.compile(r'<!--.*?-->')
+FENCE = re.compile(r'^\s*(```|~~~)')
+RULE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+SETEXT_UNDERLINE = re.compile(r'^\s*(=+|-+)\s*$')
+REFERENCE_DEFINITION = re.compile(r'^\s{0,3}\[[^\]]+\]:\s*\S')
+TABLE_SEPARATOR = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+LINE_PREFIX = re.compile(r'^\s*(>\s*)*(#{1,6}\s+|[-*+]\s+|\d+[.)]\s+)?')
+CLOSING_HASHES = re.compile(r'\s+#+\s*$')
+IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)|!\[[^\]]*\]\[[^\]]*\]')
+LINK = re.compile(r'\[([^\]]*)\](\([^)]*\)|\[[^\]]*\])')
+AUTOLINK = re.compile(r'<((?:https?|ftp|mailto):[^>\s]+)>')
+HTML_TAG = re.compile(r'</?[A-Za-z][^>]*>')
+INLINE_CODE = re.compile(r'`+([^`]*)`+')
+EMPHASIS = re.compile(r'(\*{1,3}|(?<!\w)_{1,3})(\S(?:.*?\S)?)\1(?!\w)')
+ESCAPE = re.compile(r'\\([\\`*_{}\[\]()#+\-.!|>])')
+WHITESPACE = re.compile(r'\s+')
+
+def strip_inline(line):
+    """Return the text of one line of markdown without inline syntax"""
+    line = SHORTCODE.sub(' ', line)
+    line = HTML_COMMENT.sub(' ', line)
+    line = IMAGE.sub(' ', line)
+    line = LINK.sub(r'\1', line)
+    line = AUTOLINK.sub(r'\1', line)
+    line = HTML_TAG.sub(' ', line)
+    line = INLINE_CODE.sub(r'\1', line)
+    line = EMPHASIS.sub(r'\2', line)
+    line = EMPHASIS.sub(r'\2', line)
+    line = ESCAPE.sub(r'\1', line)
+    if '|' in line:
+        line = line.strip().strip('|').replace('|', ' ')
+    return html.unescape(line)
+
+def iter_lines(content):
+    """Yield lines of content, joining constructs that span lines (shortcodes, comments) into one line"""
+    pending = None
+    closing = None
+    for line in content.splitlines():
+        if pending is not None:
+            pending += ' ' + line
+            if closing in line:
+                line, pending = pending, None
+            else:
+                continue
+        for opening, closing in MULTILINE_BLOCKS:
+            if line.rfind(opening) > line.rfind(closing):
+                pending = line
+                break
+        if pending is None:
+            yield line
+    if pending is not None:
+        yield pending
+
+def markdown_to_text(content, max_length=None):
+    """
+    Extract the plain text of markdown content
+
+    Args:
+        content (str): Markdown without front matter
+        max_length (int): Stop once this many characters were collected, the result is truncated to it
+
+    Returns:
+        str: Text with normalized whitespace
+    """
+    parts = []
+    length = 0
+    in_fence = False
+    for line in iter_lines(content):
+        if FENCE.match(line):
+            in_fence = not in_fence
+            continue
+        if in_fence:
+            text = line
+        elif (RULE.match(line) or SETEXT_UNDERLINE.match(line) or REFERENCE_DEFINITION.match(line)
+              or TABLE_SEPARATOR.match(line) and '-' in line and '|' in line):
+            continue
+        else:
+            line = LINE_PREFIX.sub('', line, count=1)
+            text = strip_inline(CLOSING_HASHES.sub('', line))
+        text = WHITESPACE.sub(' ', text).strip()
+        if not text:
+            continue
+        parts.append(text)
+        length += len(text) + 1
+        if max_length is not None and length > max_length:
+            break
+    text = ' '.join(parts)
+    return text[:max_length] if max_length is not None else text
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+memory_usage.py
+
+Resident memory of the running process for generate_related_content.py: per-language
+peak reporting and a guard shrinking encoding batches before a memory limit is hit.
+
+Current and peak resident set sizes are read from /proc/self/status (VmRSS, VmHWM).
+The peak is reset between languages through /proc/self/clear_refs. Where /proc is
+not available, the lifetime peak from resource.getrusage() is used instead.
+"""
+
+import sys
+import resource
+
+# Share of the memory limit above which encoding batches are halved
+HIGH_WATER = 0.85
+# Encoding batches are never shrunk below this many tokens
+MIN_BATCH_TOKENS = 256
+
+def _status_bytes(field):
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def _lifetime_peak():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def current_rss():
+    """Return the resident memory of the process in bytes"""
+    rss = _status_bytes('VmRSS')
+    return rss if rss is not None else _lifetime_peak()
+
+def peak_rss():
+    """Return the peak resident memory in bytes since the last reset_peak_rss()"""
+    peak = _status_bytes('VmHWM')
+    return peak if peak is not None else _lifetime_peak()
+
+def reset_peak_rss():
+    """Reset the peak resident memory to the current one, where the kernel supports it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def format_bytes(size):
+    """Return size in MB with one decimal"""
+    return f"{size / 1024 / 1024:.1f} MB"
+
+class MemoryGuard:
+    """
+    Memory limit of the process
+
+    Halves the token budget of encoding batches whenever the resident memory is
+    above HIGH_WATER of the limit, and tells when matrices should be memory mapped
+    instead of held in memory.
+
+    Args:
+        max_bytes (int): Memory limit in bytes
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.factor = 1.0
+
+    def batch_tokens(self, batch_tokens):
+        """Return the token budget of the next batch"""
+        rss = current_rss()
+        if rss > HIGH_WATER * self.max_bytes and batch_tokens * self.factor > MIN_BATCH_TOKENS:
+            self.factor /= 2
+            print(f"Memory {format_bytes(rss)} close to the limit of {format_bytes(self.max_bytes)}, "
+                  f"encoding batches shrunk to {max(int(batch_tokens * self.factor), MIN_BATCH_TOKENS)} tokens")
+        return max(int(batch_tokens * self.factor), MIN_BATCH_TOKENS)
+
+    def fits(self, size):
+        """Return whether size more bytes fit under the limit, keeping room for the model and batches"""
+        return current_rss() + size <= HIGH_WATER * self.max_bytes
@@ -1,13 +1,39 @@
+#!/usr/bin/env python3
+"""
+offload_replicate_images.py
+
+Download remote images referenced by content files (front matter attributes,
+markdown images and lazyimg shortcodes) to static/images/blobs/ and replace
+their URLs with the local paths.
+
+Images are stored by the sha256 of their bytes (see image_store.py), so an image
+referenced from the pages of several languages is downloaded and stored once, and
+a manifest of downloaded URLs lets reruns skip known URLs without any request.
+
+The run has three phases:
+    1. scan all content files and collect the remote image URLs
+    2. download the URLs missing in the manifest concurrently (see image_downloader.py)
+    3. rewrite the content files referencing downloaded images
+
+Usage:
+    python offload_replicate_images.py
+    python offload_replicate_images.py --workers 32 --per-host 8 --timeout 120
+    python offload_replicate_images.py --manifest /path/to/manifest.json
+"""
+
 import os
 import re
-import requests
+import argparse
 import toml
 from pathlib import Path
-from urllib.parse import urlparse
-import random
+from image_downloader import ImageDownloader, DEFAULT_WORKERS, DEFAULT_PER_HOST, DEFAULT_TIMEOUT
+from image_store import ImageStore
 
 CONTENT_DIR = Path(__file__).parents[3] / 'content'
 STATIC_IMAGES_DIR = Path(__file__).parents[3] / 'static' / 'images'
+# Content-addressed images, published under /images/blobs
+BLOB_DIR_NAME = 'blobs'
+MANIFEST_PATH = Path(__file__).parents[3] / '.image_cache' / 'manifest.json'
 
 IMG_URL_PREFIXES = [
     'http://',
@@ -31,14 +57,6 @@ IMAGE_ATTRIBUTES = [
 def url_matches_prefix(url):
     return any(url.startswith(prefix) for prefix in IMG_URL_PREFIXES)
 
-def get_effective_rel_folder(md_path):
-    rel_folder = md_path.parent.relative_to(CONTENT_DIR)
-    parts = list(rel_folder.parts)
-    # Remove language directory if present (e.g., 'en')
-    if parts and len(parts[0]) == 2:  # crude check for language code
-        parts = parts[1:]
-    return Path(*parts)
-
 def find_title_near_line(lines, idx):
     # Search upwards for a title attribute
     for i in range(idx, -1, -1):
@@ -47,37 +65,15 @@ def find_title_near_line(lines, idx):
             return match.group(1)
     return 'untitled'
 
-def process_image_url(url, out_dir, out_filename):
-    ext = os.path.splitext(urlparse(url).path)[1]
-    if not ext:
-        try:
-            resp = requests.head(url, allow_redirects=True)
-            content_type = resp.headers.get('Content-Type', '')
-            if 'image/' in content_type:
-                ext = '.' + content_type.split('image/')[1].split(';')[0].strip().split('+')[0]
-            else:
-                ext = '.jpg'  # fallback
-        except Exception as e:
-            print(f"!!! ERROR getting extension for image {url}: {e}")
-            ext = '.jpg'
-        out_filename = os.path.splitext(out_filename)[0] + ext
-    if not out_filename.endswith(ext):
-        out_filename += ext
-    out_path = out_dir / out_filename
-    if not out_path.exists():
-        try:
-            resp = requests.get(url)
-            resp.raise_for_status()
-            with open(out_path, 'wb') as imgf:
-                imgf.write(resp.content)
-        except Exception as e:
-            print(f"!!! ERROR downloading image from {url}: {e}")
-            return None
-    return out_filename
+def process_md_file(md_path, resolve, write=True):
+    """
+    Replace the remote images of a content file with local paths
 
-def process_md_file(md_path):
-    rel_folder = get_effective_rel_folder(md_path)
-    md_stem = md_path.stem  # Get the name of the md file without extension
+    Args:
+        md_path (Path): Content file
+        resolve (callable): resolve(url) returns the local path of the image, or None to leave it remote
+        write (bool): Write the file when an image was replaced
+    """
     with open(md_path, 'r', encoding='utf-8') as f:
         content = f.read()
     # Split TOML frontmatter and body
@@ -107,16 +103,8 @@ def process_md_file(md_path):
             if isinstance(attr, str):
                 # Simple attribute
                 if attr in data and isinstance(data[attr], str) and url_matches_prefix(data[attr]):
-                    url = data[attr]
-                    orig_title = data.get('title') or attr
-                    base_title = orig_title if orig_title and orig_title.strip() else attr
-                    safe_title = re.sub(r'[^a-zA-Z0-9_-]', '_', base_title)
-                    out_dir = STATIC_IMAGES_DIR / rel_folder
-                    out_dir.mkdir(parents=True, exist_ok=True)
-                    out_filename = f"{md_stem}_{safe_title}"
-                    out_filename_result = process_image_url(url, out_dir, out_filename)
-                    if out_filename_result:
-                        local_url = f"/images/{rel_folder}/{out_filename_result}".replace('\\', '/')
+                    local_url = resolve(data[attr])
+                    if local_url:
                         data[attr] = local_url
                         toml_changed = True
                         changed = True
@@ -124,34 +112,18 @@ def process_md_file(md_path):
                 # Array or dict attribute
                 for arr_name, img_key in attr.items():
                     if arr_name in data and isinstance(data[arr_name], list):
-                        for idx_entry, entry in enumerate(data[arr_name]):
+                        for entry in data[arr_name]:
                             if img_key in entry and isinstance(entry[img_key], str) and url_matches_prefix(entry[img_key]):
-                                url = entry[img_key]
-                                entry_title = entry.get('title') or img_key
-                                base_title = entry_title if entry_title and entry_title.strip() else img_key
-                                safe_title = re.sub(r'[^a-zA-Z0-9_-]', '_', base_title)
-                                out_dir = STATIC_IMAGES_DIR / rel_folder
-                                out_dir.mkdir(parents=True, exist_ok=True)
-                                out_filename = f"{md_stem}_{safe_title}_{idx_entry}"
-                                out_filename_result = process_image_url(url, out_dir, out_filename)
-                                if out_filename_result:
-                                    local_url = f"/images/{rel_folder}/{out_filename_result}".replace('\\', '/')
+                                local_url = resolve(entry[img_key])
+                                if local_url:
                                     entry[img_key] = local_url
                                     toml_changed = True
                                     changed = True
                     elif arr_name in data and isinstance(data[arr_name], dict):
                         entry = data[arr_name]
                         if img_key in entry and isinstance(entry[img_key], str) and url_matches_prefix(entry[img_key]):
-                            url = entry[img_key]
-                            entry_title = entry.get('title') or img_key
-                            base_title = entry_title if entry_title and entry_title.strip() else img_key
-                            safe_title = re.sub(r'[^a-zA-Z0-9_-]', '_', base_title)
-                            out_dir = STATIC_IMAGES_DIR / rel_folder
-                            out_dir.mkdir(parents=True, exist_ok=True)
-                            out_filename = f"{md_stem}_{safe_title}"
-                            out_filename_result = process_image_url(url, out_dir, out_filename)
-                            if out_filename_result:
-                                local_url = f"/images/{rel_folder}/{out_filename_result}".replace('\\', '/')
+                            local_url = resolve(entry[img_key])
+                            if local_url:
                                 entry[img_key] = local_url
                                 toml_changed = True
                                 changed = True
@@ -178,22 +150,9 @@ def process_md_file(md_path):
             if not title or title.strip() == '':
                 title = 'untitled'
                 
-            ext = os.path.splitext(urlparse(url).path)[1]
-            out_dir = STATIC_IMAGES_DIR / rel_folder
-            out_dir.mkdir(parents=True, exist_ok=True)
-            safe_title = re.sub(r'[^a-zA-Z0-9_-]', '_', title)
-            out_filename = f"{md_stem}_{safe_title}{ext}"
-            out_path = out_dir / out_filename
-            if not out_path.exists():
-                try:
-                    resp = requests.get(url)
-                    resp.raise_for_status()
-                    with open(out_path, 'wb') as imgf:
-                        imgf.write(resp.content)
-                except Exception as e:
-                    print(f"!!! ERROR downloading image from {url}: {e}")
-                    continue
-            local_url = f"/images/{rel_folder}/{out_filename}".replace('\\', '/')
+            local_url = resolve(url)
+            if not local_url:
+                continue
             new_img_md = f'![{alt_text}]({local_url} "{title}")'
             line = line.replace(match.group(0), new_img_md)
             body_changed = True
@@ -204,37 +163,9 @@ def process_md_file(md_path):
         if lazyimg_match:
             url = lazyimg_match.group(1)
             if url_matches_prefix(url):
-                # Extract alt attribute if it exists in the shortcode
-                alt_match = re.search(r'alt="([^"]+)"', line)
-                alt_text = alt_match.group(1) if alt_match else f"lazyimg_{idx}"
-                
-                ext = os.path.splitext(urlparse(url).path)[1]
-                if not ext:
-                    try:
-                        resp = requests.head(url, allow_redirects=True)
-                        content_type = resp.headers.get('Content-Type', '')
-                        if 'image/' in content_type:
-                            ext = '.' + content_type.split('image/')[1].split(';')[0].strip().split('+')[0]
-                        else:
-                            ext = '.jpg'  # fallback
-                    except Exception as e:
-                        print(f"!!! ERROR getting extension for image {url}: {e}")
-                        ext = '.jpg'
-                out_dir = STATIC_IMAGES_DIR / rel_folder
-                out_dir.mkdir(parents=True, exist_ok=True)
-                safe_title = re.sub(r'[^a-zA-Z0-9_-]', '_', alt_text)
-                out_filename = f"{md_stem}_{safe_title}{ext}"
-                out_path = out_dir / out_filename
-                if not out_path.exists():
-                    try:
-                        resp = requests.get(url)
-                        resp.raise_for_status()
-                        with open(out_path, 'wb') as imgf:
-                            imgf.write(resp.content)
-                    except Exception as e:
-                        print(f"!!! ERROR downloading image from {url}: {e}")
-                        continue
-                local_url = f"/images/{rel_folder}/{out_filename}".replace('\\', '/')
+                local_url = resolve(url)
+                if not local_url:
+                    continue
                 line = re.sub(r'(src=")([^"]+)(")', f'\\1{local_url}\\3', line)
                 body_changed = True
                 changed = True
@@ -247,27 +178,10 @@ def process_md_file(md_path):
         url = match.group(1)
         if url_matches_prefix(url):
             try:
-                # Extract alt attribute if it exists in the shortcode
                 shortcode = match.group(0)
-                alt_match = re.search(r'alt="([^"]+)"', shortcode)
-                alt_text = alt_match.group(1) if alt_match else "lazyimg_multi"
-                
-                ext = os.path.splitext(urlparse(url).path)[1]
-                out_dir = STATIC_IMAGES_DIR / rel_folder
-                out_dir.mkdir(parents=True, exist_ok=True)
-                safe_title = re.sub(r'[^a-zA-Z0-9_-]', '_', alt_text)
-                out_filename = f"{md_stem}_{safe_title}{ext}"
-                out_path = out_dir / out_filename
-                if not out_path.exists():
-                    try:
-                        resp = requests.get(url)
-                        resp.raise_for_status()
-                        with open(out_path, 'wb') as imgf:
-                            imgf.write(resp.content)
-                    except Exception as e:
-                        print(f"!!! ERROR downloading image from {url}: {e}")
-                        continue
-                local_url = f"/images/{rel_folder}/{out_filename}".replace('\\', '/')
+                local_url = resolve(url)
+                if not local_url:
+                    continue
                 # Replace just the src attribute value
                 new_shortcode = re.sub(r'(src=")([^"]+)(")', f'\\1{local_url}\\3', shortcode)
                 full_content = full_content.replace(shortcode, new_shortcode)
@@ -280,16 +194,67 @@ def process_md_file(md_path):
     if body_changed:
         body = full_content
         
-    if changed:
+    if changed and write:
         # Write both TOML and body together, always
         with open(md_path, 'w', encoding='utf-8') as f:
             f.write(f"+++\n{new_toml}\n+++\n{body}")
 
+def collect_image_urls(md_paths):
+    """
+    Scan content files for remote images without downloading anything
+
+    Returns:
+        dict: {md_path: list of remote image URLs of the file}, files without remote images are left out
+    """
+    image_urls = {}
+    for md_path in md_paths:
+        page_urls = []
+
+        def collect(url):
+            page_urls.append(url)
+            # Leave the image remote, the file is not written
+            return None
+
+        process_md_file(md_path, collect, write=False)
+        if page_urls:
+            image_urls[md_path] = page_urls
+    return image_urls
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Download remote images of content files to static/images/blobs")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Maximum number of concurrent downloads (default: %(default)s)")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST,
+                        help="Maximum number of concurrent downloads from one host (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT[1],
+                        help="Read timeout of a download in seconds (default: %(default)s)")
+    parser.add_argument("--manifest", type=str, default=str(MANIFEST_PATH),
+                        help="Manifest of downloaded URLs (default: %(default)s)")
+    return parser.parse_args()
+
 def main():
-    for root, _, files in os.walk(CONTENT_DIR):
-        for file in files:
-            if file.endswith('.md'):
-                process_md_file(Path(root) / file)
+    args = parse_args()
+    md_paths = [Path(root) / file for root, _, files in os.walk(CONTENT_DIR) for file in files if file.endswith('.md')]
+
+    image_urls = collect_image_urls(md_paths)
+    urls = list(dict.fromkeys(url for page_urls in image_urls.values() for url in page_urls))
+    print(f"Found {len(urls)} remote images in {len(image_urls)} of {len(md_paths)} content files")
+    if not urls:
+        return
+
+    store = ImageStore(STATIC_IMAGES_DIR / BLOB_DIR_NAME, f"/images/{BLOB_DIR_NAME}", args.manifest)
+    downloader = ImageDownloader(workers=args.workers, per_host=args.per_host,
+                                 timeout=(DEFAULT_TIMEOUT[0], args.timeout))
+    try:
+        results = downloader.download_all(urls, store)
+    finally:
+        store.save()
+    downloader.print_report()
+    store.print_report()
+
+    for md_path in image_urls:
+        process_md_file(md_path, results.get)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+onnx_encoder.py
+
+Int8 quantized ONNX encoder of sentence transformer models for generate_related_content.py.
+
+The PyTorch model is exported to ONNX once, its weights are quantized to int8 with
+dynamic quantization and the result is run with onnxruntime. Encoding then needs
+neither torch nor the full precision weights in memory, which makes the related
+content step faster and much smaller on CPU-only build machines.
+
+Layout of an exported model directory:
+    model.onnx       - int8 quantized model, outputs the hidden states of the tokens
+    tokenizer files  - the tokenizer of the sentence transformer
+    encoder.json     - {"model": name, "pooling": "cls" or "mean", "max_seq_length": ...}
+
+Exporting needs torch, sentence-transformers and onnx, encoding only onnxruntime
+and transformers (for the tokenizer):
+    pip install onnxruntime onnx
+
+Usage:
+    python onnx_encoder.py                                  # export the default model to .embedding_cache/onnx
+    python onnx_encoder.py --hugo-root /path/to/site        # where generate_related_content.py --hugo-root looks
+    python onnx_encoder.py --model Alibaba-NLP/gte-multilingual-base --output-dir /path/to/onnx
+"""
+
+import os
+import re
+import json
+import argparse
+import numpy as np
+
+ENCODER_CONFIG = 'encoder.json'
+MODEL_FILE = 'model.onnx'
+OPSET_VERSION = 17
+POOLING_MODES = ('cls', 'mean')
+
+def default_onnx_dir(hugo_root):
+    """Return the directory of exported models generate_related_content.py uses for a Hugo root by default"""
+    return os.path.join(str(hugo_root), ".embedding_cache", "onnx")
+
+def onnx_model_dir(base_dir, model_name):
+    """Return the directory of the exported model under base_dir"""
+    return os.path.join(str(base_dir), re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+
+def is_exported(model_dir):
+    """Return whether model_dir holds an exported model"""
+    return (os.path.exists(os.path.join(model_dir, ENCODER_CONFIG))
+            and os.path.exists(os.path.join(model_dir, MODEL_FILE)))
+
+def export_onnx_model(model_name, model_dir):
+    """
+    Export a sentence transformer model to an int8 quantized ONNX model
+
+    Args:
+        model_name (str): Name or path of the sentence transformer model
+        model_dir (str): Output directory
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"Exporting {model_name} to ONNX: {model_dir}")
+    model = SentenceTransformer(model_name, trust_remote_code=True, device='cpu')
+    pooling = next((module for module in model if hasattr(module, 'get_pooling_mode_str')), None)
+    pooling_mode = pooling.get_pooling_mode_str() if pooling is not None else 'mean'
+    if pooling_mode not in POOLING_MODES:
+        raise ValueError(f"Unsupported pooling '{pooling_mode}' of {model_name}, expected one of {', '.join(POOLING_MODES)}")
+
+    class HiddenStates(torch.nn.Module):
+        """Transformer returning only the hidden states of the tokens"""
+
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask):
+            return self.transformer(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    os.makedirs(model_dir, exist_ok=True)
+    sample = model.tokenizer(["Parking sensors detect vehicles."], return_tensors='pt')
+    float_path = os.path.join(model_dir, 'model.float32.onnx')
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in ('input_ids', 'attention_mask', 'hidden_states')}
+    with torch.no_grad():
+        torch.onnx.export(HiddenStates(model[0].auto_model).eval(),
+                          (sample['input_ids'], sample['attention_mask']), float_path,
+                          input_names=['input_ids', 'attention_mask'], output_names=['hidden_states'],
+                          dynamic_axes=dynamic_axes, opset_version=OPSET_VERSION)
+
+    print("Quantizing weights to int8...")
+    quantize_dynamic(float_path, os.path.join(model_dir, MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(float_path)
+
+    model.tokenizer.save_pretrained(model_dir)
+    config = {'model': model_name, 'pooling': pooling_mode, 'max_seq_length': model.max_seq_length}
+    with open(os.path.join(model_dir, ENCODER_CONFIG), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+class OnnxEncoder:
+    """
+    Sentence encoder running an exported model with onnxruntime
+
+    Has the parts of the SentenceTransformer interface used by generate_related_content.py:
+    encode(), tokenizer and max_seq_length.
+
+    Args:
+        model_dir (str): Directory of the exported model
+        threads (int): Threads used by onnxruntime (default: onnxruntime decides)
+    """
+
+    def __init__(self, model_dir, threads=None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, ENCODER_CONFIG), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.model_name = config['model']
+        self.pooling = config['pooling']
+        self.max_seq_length = config['max_seq_length']
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, MODEL_FILE), options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def pool(self, hidden_states, attention_mask):
+        """Return sentence embeddings from the hidden states of the tokens"""
+        if self.pooling == 'cls':
+            return hidden_states[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        """Encode texts like SentenceTransformer.encode(), returns a float32 matrix"""
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(list(texts[start:start + batch_size]), padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors='np')
+            inputs = {name: tokens[name].astype(np.int64) for name in self.input_names}
+            hidden_states = self.session.run(None, inputs)[0]
+            embeddings.append(self.pool(hidden_states, tokens['attention_mask']).astype(np.float32))
+        if not embeddings:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(embeddings)
+
+def load_onnx_encoder(model_name, base_dir, threads=None):
+    """Return the ONNX encoder of a model, exporting the model first when needed"""
+    model_dir = onnx_model_dir(base_dir, model_name)
+    if not is_exported(model_dir):
+        export_onnx_model(model_name, model_dir)
+    return OnnxEncoder(model_dir, threads)
+
+def main():
+    """Export a model to an int8 quantized ONNX model"""
+    parser = argparse.ArgumentParser(description="Export a sentence transformer model to int8 quantized ONNX")
+    parser.add_argument("--model", type=str, default="Alibaba-NLP/gte-multilingual-base",
+                        help="Model name to export (default: %(default)s)")
+    parser.add_argument("--hugo-root", type=str,
+                        default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")),
+                        help="Hugo root directory, as given to generate_related_content.py (default: two levels up from script location)")
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="Directory of exported models (default: .embedding_cache/onnx in the Hugo root)")
+    parser.add_argument("--force", action="store_true", help="Export again even if the model was already exported")
+    args = parser.parse_args()
+
+    model_dir = onnx_model_dir(args.output_dir or default_onnx_dir(args.hugo_root), args.model)
+    if is_exported(model_dir) and not args.force:
+        print(f"Model already exported: {model_dir}")
+        return
+    export_onnx_model(args.model, model_dir)
+    print(f"Exported model: {model_dir}")
+
+if __name__ == "__main__":
+    main()
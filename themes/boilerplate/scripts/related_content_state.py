@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+related_content_state.py
+
+State of the last related content run of a language, used by the incremental
+mode of generate_related_content.py.
+
+For every page the state records the mtime and size of its file, the hash of
+its extracted text (the key of its vector in the embedding store), the page
+metadata written to the YAML file and its neighbors with the score of the
+weakest one. Comparing the state with the content directory gives the changed,
+added and deleted pages, and the neighbor scores tell which other pages could
+see their top-K change.
+
+The state is only reused when it was produced with the same settings
+(model, number of neighbors, excluded sections, text length).
+"""
+
+import os
+import json
+import subprocess
+from translation_cache import write_file_atomic
+
+STATE_VERSION = 1
+
+# Page fields kept in the state besides the neighbors
+PAGE_FIELDS = ('path', 'section', 'slug', 'title', 'is_index', 'text_hash', 'mtime', 'size')
+
+class RelatedContentState:
+    """
+    Pages and neighbors of the last related content run of one language
+
+    Args:
+        path (str): Path of the state file
+        signature (dict): Settings the neighbors depend on, a state with other settings is discarded
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        # {relative path: {page fields, 'neighbors': [relative paths], 'kth_score': float or None}}
+        self.pages = {}
+        self.valid = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable related content state {self.path}: {e}")
+            return
+        if state.get('version') != STATE_VERSION or state.get('signature') != self.signature:
+            print(f"Related content settings changed since the last run, ignoring state: {self.path}")
+            return
+        self.pages = state['pages']
+        self.valid = True
+
+    def save(self):
+        """Write the state file"""
+        state = {'version': STATE_VERSION, 'signature': self.signature, 'pages': self.pages}
+        write_file_atomic(self.path, json.dumps(state))
+
+    def changes(self, files, forced=()):
+        """
+        Compare the state with the current content files
+
+        Args:
+            files (list): Tuples (file_path, rel_path, stat) of the current content files
+            forced (iterable): Relative paths to treat as changed, e.g. from git diff
+
+        Returns:
+            tuple: (set of changed or added relative paths, set of deleted relative paths)
+        """
+        forced = set(forced)
+        changed = set()
+        for _, rel_path, stat in files:
+            page = self.pages.get(rel_path)
+            if (page is None or rel_path in forced or page['mtime'] != stat.st_mtime
+                    or page['size'] != stat.st_size):
+                changed.add(rel_path)
+        current = {rel_path for _, rel_path, _ in files}
+        deleted = set(self.pages) - current
+        return changed, deleted
+
+    def page_info(self, rel_path):
+        """Return the stored metadata of a page, in the format of extracted file data"""
+        page = self.pages[rel_path]
+        return {field: page[field] for field in PAGE_FIELDS}
+
+    def record(self, file_info, neighbors, kth_score):
+        """Record a page with its neighbors (relative paths) and the score of the weakest neighbor"""
+        page = {field: file_info[field] for field in PAGE_FIELDS}
+        page['neighbors'] = neighbors
+        page['kth_score'] = kth_score
+        self.pages[file_info['path']] = page
+
+    def replace_pages(self, paths):
+        """Drop pages not in paths, e.g. deleted files"""
+        self.pages = {path: page for path, page in self.pages.items() if path in paths}
+
+def git_changed_files(content_dir, since):
+    """
+    Return paths relative to content_dir of files changed since a git revision,
+    including uncommitted and untracked files
+    """
+    commands = [
+        ['git', 'diff', '--name-only', '--relative', since, '--', '.'],
+        ['git', 'ls-files', '--others', '--exclude-standard', '--', '.'],
+    ]
+    changed = set()
+    for command in commands:
+        result = subprocess.run(command, cwd=content_dir, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+        changed.update(os.path.normpath(line) for line in result.stdout.splitlines() if line)
+    return changed
@@ -0,0 +1,41 @@
+import os
+import sys
+import importlib
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+import fake_flowhunt
+
+# The scripts are run from their directory and import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def http_server():
+    """Start a local HTTP server with a given handler class, returns its base URL"""
+    servers = []
+
+    def start(handler):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def flowhunt_api(monkeypatch, http_server):
+    """Serve a FakeFlowHunt API, returns flowhunt_client imported against it with the stub SDK"""
+    def start(fake):
+        monkeypatch.setenv('FLOWHUNT_API_HOST', http_server(fake.handler()))
+        monkeypatch.setenv('FLOWHUNT_API_KEY', 'test-key')
+        monkeypatch.setitem(sys.modules, 'flowhunt', fake_flowhunt)
+        # API_HOST and the shared client are set when the modules are imported
+        for name in ('flowhunt_client', 'translate_with_flowhunt'):
+            monkeypatch.delitem(sys.modules, name, raising=False)
+        return importlib.import_module('flowhunt_client')
+
+    return start
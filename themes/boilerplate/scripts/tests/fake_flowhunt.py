@@ -0,0 +1,185 @@
+"""
+Stub of the FlowHunt SDK and a fake FlowHunt API for tests of flowhunt_client.py
+
+The stub covers the part of the flowhunt package used by flowhunt_client.py and
+sends its requests over HTTP to the host of its Configuration, so tests run the
+pooled client against FakeFlowHunt served by the http_server fixture (see conftest.py).
+"""
+
+import json
+import time
+import uuid
+import threading
+from types import SimpleNamespace
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler
+import urllib3
+
+class ApiException(Exception):
+    def __init__(self, status=None, reason=None, headers=None):
+        super().__init__(f"({status}) {reason}")
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+class Configuration:
+    def __init__(self, host):
+        self.host = host
+        self.api_key = {}
+        self.connection_pool_maxsize = 1
+
+class ApiClient:
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.pool = urllib3.PoolManager(maxsize=configuration.connection_pool_maxsize, retries=False)
+
+    def request(self, method, path, body=None):
+        resp = self.pool.request(method, self.configuration.host + path,
+                                 body=json.dumps(body) if body is not None else None,
+                                 headers={'Api-Key': self.configuration.api_key.get('APIKeyHeader', ''),
+                                          'Content-Type': 'application/json'})
+        if resp.status >= 400:
+            raise ApiException(resp.status, resp.reason, dict(resp.headers))
+        return SimpleNamespace(**json.loads(resp.data))
+
+    def close(self):
+        self.pool.clear()
+
+class FlowInvokeRequest:
+    def __init__(self, variables=None, human_input=None):
+        self.variables = variables
+        self.human_input = human_input
+
+class AuthApi:
+    def __init__(self, api_client):
+        self.api_client = api_client
+
+    def get_user(self):
+        return self.api_client.request('GET', '/v2/auth/me')
+
+class FlowsApi:
+    def __init__(self, api_client):
+        self.api_client = api_client
+
+    def invoke_flow_singleton(self, flow_id, workspace_id, flow_invoke_request):
+        body = {'variables': flow_invoke_request.variables, 'human_input': flow_invoke_request.human_input}
+        return self.api_client.request('POST', f'/v2/flows/{flow_id}/invoke?workspace_id={workspace_id}', body)
+
+    def get_invoked_flow_results(self, flow_id, task_id, workspace_id):
+        return self.api_client.request('GET', f'/v2/flows/{flow_id}/{task_id}?workspace_id={workspace_id}')
+
+def flow_result(text):
+    """Return the result JSON of a flow whose output message is text"""
+    return json.dumps({'outputs': [{'outputs': [{'results': {'message': {'result': text}}}]}]})
+
+class FakeFlowHunt:
+    """
+    Fake FlowHunt API recording how many requests and tasks were in flight at once
+
+    Args:
+        translate (callable): translate(human_input, variables) returns the output of a flow
+        pending_polls (int): Number of status checks answered as pending before a task succeeds
+        request_delay (float): Seconds each request takes
+        failures (list): HTTP statuses answered to the first invoke requests, e.g. [503, 429]
+    """
+
+    def __init__(self, translate=lambda human_input, variables: human_input.upper(), pending_polls=1,
+                 request_delay=0.05, failures=()):
+        self.translate = translate
+        self.pending_polls = pending_polls
+        self.request_delay = request_delay
+        self.failures = list(failures)
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.invoke_requests = 0
+        self.status_requests = 0
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.running_tasks = 0
+        self.max_running_tasks = 0
+
+    def add_task(self, status):
+        """Add a task answering status (e.g. FAILURE) to every check, returns its ID"""
+        task_id = str(uuid.uuid4())
+        with self.lock:
+            self.tasks[task_id] = {'input': None, 'polls': 0, 'status': status}
+        return task_id
+
+    def handler(self):
+        """Return the request handler class serving this fake API"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body=None, headers=()):
+                data = json.dumps(body).encode('utf-8') if body is not None else b''
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                fake.serve(self)
+
+            def do_POST(self):
+                fake.serve(self)
+
+        return Handler
+
+    def serve(self, request):
+        with self.lock:
+            self.active_requests += 1
+            self.max_active_requests = max(self.max_active_requests, self.active_requests)
+        try:
+            time.sleep(self.request_delay)
+            path = urlparse(request.path).path.strip('/').split('/')
+            if path == ['v2', 'auth', 'me']:
+                request.reply(200, {'api_key_workspace_id': 'workspace'})
+            elif request.command == 'POST' and path[-1] == 'invoke':
+                length = int(request.headers.get('Content-Length', 0))
+                self.invoke(request, json.loads(request.rfile.read(length)))
+            else:
+                self.status(request, path[-1])
+        finally:
+            with self.lock:
+                self.active_requests -= 1
+
+    def invoke(self, request, body):
+        with self.lock:
+            self.invoke_requests += 1
+            status = self.failures.pop(0) if self.failures else None
+            if status is None:
+                task_id = str(uuid.uuid4())
+                self.tasks[task_id] = {'input': body, 'polls': 0}
+                self.running_tasks += 1
+                self.max_running_tasks = max(self.max_running_tasks, self.running_tasks)
+        if status is not None:
+            request.reply(status, {'detail': 'failure'}, [('Retry-After', '0')] if status == 429 else ())
+        else:
+            request.reply(200, {'id': task_id})
+
+    def status(self, request, task_id):
+        with self.lock:
+            self.status_requests += 1
+            task = self.tasks.get(task_id)
+            if task is None:
+                request.reply(404, {'detail': 'unknown task'})
+                return
+            task['polls'] += 1
+            if 'status' in task:
+                request.reply(200, {'status': task['status'], 'result': None})
+                return
+            done = task['polls'] > self.pending_polls
+            if done and not task.get('done'):
+                task['done'] = True
+                self.running_tasks -= 1
+        if not done:
+            request.reply(200, {'status': 'PENDING', 'result': None})
+            return
+        result = self.translate(task['input']['human_input'], task['input']['variables'])
+        request.reply(200, {'status': 'SUCCESS', 'result': flow_result(result)})
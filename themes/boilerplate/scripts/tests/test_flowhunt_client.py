@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fake_flowhunt import FakeFlowHunt, ApiException
+
+def result_message(result):
+    return result['outputs'][0]['outputs'][0]['results']['message']['result']
+
+def test_invoke_and_poll_concurrently(flowhunt_api):
+    fake = FakeFlowHunt()
+    flowhunt_client = flowhunt_api(fake)
+    client = flowhunt_client.FlowHuntClient('test-key', pool_size=8, rate_limit=1000, max_concurrent=4)
+    with client, ThreadPoolExecutor(max_workers=16) as executor:
+        task_ids = list(executor.map(lambda i: client.invoke_flow('flow', f'text {i}', {}), range(20)))
+        pending = client.check_many('flow', task_ids)
+        ready = client.check_many('flow', task_ids)
+
+    assert len(set(task_ids)) == 20
+    assert set(pending.values()) == {(False, None)}
+    assert [result_message(ready[task_id][1]) for task_id in task_ids] == [f'TEXT {i}' for i in range(20)]
+    # Requests overlap, up to max_concurrent of them
+    assert 1 < fake.max_active_requests <= 4
+
+def test_retries_transient_errors(flowhunt_api):
+    fake = FakeFlowHunt(failures=[503, 429, 502])
+    flowhunt_client = flowhunt_api(fake)
+    with flowhunt_client.FlowHuntClient('test-key', retry_backoff=0.01, rate_limit=1000) as client:
+        task_id = client.invoke_flow('flow', 'text', {})
+
+    assert task_id in fake.tasks
+    assert fake.invoke_requests == 4
+    assert client.limiter.throttle_events == 1
+
+def test_does_not_retry_client_errors(flowhunt_api):
+    fake = FakeFlowHunt(failures=[400])
+    flowhunt_client = flowhunt_api(fake)
+    with flowhunt_client.FlowHuntClient('test-key', retry_backoff=0.01, rate_limit=1000) as client:
+        with pytest.raises(ApiException):
+            client.invoke_flow('flow', 'text', {})
+
+    assert fake.invoke_requests == 1
+
+def test_failed_and_unknown_tasks_are_finished_without_result(flowhunt_api):
+    fake = FakeFlowHunt()
+    flowhunt_client = flowhunt_api(fake)
+    failed_id = fake.add_task('FAILURE')
+    with flowhunt_client.FlowHuntClient('test-key', rate_limit=1000) as client:
+        results = client.check_many('flow', [failed_id, 'unknown-task'])
+        with pytest.raises(flowhunt_client.FlowTaskError):
+            client.check('flow', failed_id)
+
+    assert results == {failed_id: (True, None), 'unknown-task': (True, None)}
@@ -0,0 +1,36 @@
+import pytest
+from flowhunt_polling import AdaptivePoller
+
+def test_check_interval_below_a_second_is_the_floor():
+    poller = AdaptivePoller(0.2, jitter=0)
+    poller.start('task', 'flow', now=0)
+    assert poller.delay('task', now=0) == 0.2
+    poller.checked('task', False, now=0.2)
+    assert poller.delay('task', now=0.2) == pytest.approx(0.2 * 1.5)
+
+def test_check_interval_must_be_positive():
+    with pytest.raises(ValueError):
+        AdaptivePoller(0)
+
+def test_deadline_scales_with_the_learned_completion_time():
+    poller = AdaptivePoller(1, timeout=100, timeout_factor=3, min_timeout=10)
+    poller.start('first', 'flow', now=0)
+    assert poller.deadline('first') == 100
+    assert not poller.timed_out('first', now=100)
+    assert poller.timed_out('first', now=101)
+    poller.checked('first', True, now=20)
+
+    poller.start('second', 'flow', now=20)
+    assert poller.deadline('second') == 60
+    assert poller.timed_out('second', now=81)
+    poller.start('other', 'other flow', now=20)
+    assert poller.deadline('other') == 100
+
+def test_failed_tasks_are_no_longer_polled():
+    poller = AdaptivePoller(1)
+    poller.start('task', 'flow', now=0)
+    poller.failed('task')
+    poller.failed('task')
+    assert poller.next_due() == (None, None)
+    assert poller.failed_tasks == 1
+    assert poller.estimator.expected('flow') is None
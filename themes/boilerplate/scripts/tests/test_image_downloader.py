@@ -0,0 +1,122 @@
+import json
+import time
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler
+import pytest
+from image_downloader import ImageDownloader, DownloadError
+from image_store import ImageStore
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+def image_handler(counters, failures):
+    """
+    Return a handler serving PNG images
+
+    /flaky/ paths answer 503 their first failures[path] times, /short/ paths send less
+    than their Content-Length and /html/ paths send an HTML page instead of an image.
+    """
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                counters['requests'][self.path] = counters['requests'].get(self.path, 0) + 1
+                counters['active'] += 1
+                counters['max_active'] = max(counters['max_active'], counters['active'])
+                failing = failures.get(self.path, 0) >= counters['requests'][self.path]
+            try:
+                time.sleep(0.05)
+                body = PNG + self.path.encode('utf-8')
+                content_type = 'image/png'
+                if self.path.startswith('/html/'):
+                    body, content_type = b'<!DOCTYPE html><html><body>Not found</body></html>', 'text/html'
+                self.send_response(503 if failing else 200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.path.startswith('/short/'):
+                    # The connection closes after half of the announced body
+                    body = body[:len(body) // 2]
+                self.wfile.write(body)
+            finally:
+                with lock:
+                    counters['active'] -= 1
+
+    return Handler
+
+def make_store(tmp_path):
+    return ImageStore(tmp_path / 'blobs', '/images/blobs', tmp_path / 'manifest.json')
+
+def test_downloads_concurrently_and_retries_server_errors(http_server, tmp_path):
+    counters = {'requests': {}, 'active': 0, 'max_active': 0}
+    base_url = http_server(image_handler(counters, {'/flaky/0.png': 1, '/flaky/1.png': 2}))
+    urls = [f"{base_url}/image/{i}.png" for i in range(12)] + [f"{base_url}/flaky/{i}.png" for i in range(2)]
+
+    store = make_store(tmp_path)
+    downloader = ImageDownloader(workers=8, per_host=4)
+    results = downloader.download_all(urls, store)
+    store.save()
+
+    assert all(results[url] and results[url].startswith('/images/blobs/') for url in urls)
+    assert downloader.downloaded == len(urls) and downloader.failed == 0
+    # Downloads overlap, up to per_host of them on the single host
+    assert 1 < counters['max_active'] <= 4
+    assert counters['requests']['/flaky/0.png'] == 2
+    assert counters['requests']['/flaky/1.png'] == 3
+
+    blob = tmp_path / 'blobs' / results[urls[0]][len('/images/blobs/'):]
+    assert blob.read_bytes() == PNG + b'/image/0.png'
+    manifest = json.loads((tmp_path / 'manifest.json').read_text(encoding='utf-8'))
+    assert set(manifest['urls']) == set(urls)
+
+def test_gives_up_after_retries_and_skips_stored_urls(http_server, tmp_path):
+    counters = {'requests': {}, 'active': 0, 'max_active': 0}
+    base_url = http_server(image_handler(counters, {'/flaky/down.png': 100}))
+    good, down = f"{base_url}/image/good.png", f"{base_url}/flaky/down.png"
+
+    store = make_store(tmp_path)
+    downloader = ImageDownloader(workers=2, max_retries=2)
+    results = downloader.download_all([good, down], store)
+    assert results[good] and results[down] is None
+    assert downloader.failed == 1
+    assert counters['requests']['/flaky/down.png'] == 3
+    assert not list((tmp_path / 'blobs').glob('.*.part'))
+    store.save()
+
+    # A rerun finds the image in the manifest and sends no request for it
+    downloader = ImageDownloader(workers=2, max_retries=0)
+    assert downloader.download_all([good], make_store(tmp_path)) == {good: results[good]}
+    assert counters['requests']['/image/good.png'] == 1
+    assert downloader.existing == 1
+
+def test_rejects_truncated_and_non_image_downloads(http_server, tmp_path):
+    counters = {'requests': {}, 'active': 0, 'max_active': 0}
+    base_url = http_server(image_handler(counters, {}))
+    urls = [f"{base_url}/short/0.png", f"{base_url}/html/1.png"]
+
+    store = make_store(tmp_path)
+    downloader = ImageDownloader(workers=2, max_retries=0)
+    results = downloader.download_all(urls, store)
+    store.save()
+
+    assert all(results[url] is None for url in urls)
+    assert downloader.failed == 2 and downloader.downloaded == 0
+    # Neither a blob nor a partial download is left behind, and the manifest stays empty
+    assert not [path for path in (tmp_path / 'blobs').rglob('*') if path.is_file()]
+    assert json.loads((tmp_path / 'manifest.json').read_text(encoding='utf-8'))['urls'] == {}
+
+def test_save_checks_the_content_length(tmp_path):
+    # A response cut short without a connection error, e.g. by a proxy closing a keep-alive connection cleanly
+    body = PNG[:40]
+    resp = SimpleNamespace(headers={'Content-Length': str(len(PNG)), 'Content-Type': 'image/png'},
+                           iter_content=lambda chunk_size: iter([body]), raw=SimpleNamespace(tell=lambda: len(body)))
+
+    store = make_store(tmp_path)
+    with pytest.raises(DownloadError, match='incomplete download'):
+        ImageDownloader()._save('http://example.com/cut.png', resp, store)
+    assert not [path for path in (tmp_path / 'blobs').rglob('*') if path.is_file()]
+    assert not store.urls
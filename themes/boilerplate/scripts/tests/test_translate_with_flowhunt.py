@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import importlib
+from fake_flowhunt import FakeFlowHunt
+
+def test_translations_run_concurrently(flowhunt_api, tmp_path):
+    fake = FakeFlowHunt(translate=lambda text, variables: f"{variables['target_language']}: {text}")
+    flowhunt_api(fake).get_client(rate_limit=1000)
+    translate = importlib.import_module('translate_with_flowhunt')
+
+    content_dir = tmp_path / 'content'
+    (content_dir / 'en').mkdir(parents=True)
+    for i in range(4):
+        (content_dir / 'en' / f'page{i}.md').write_text(f'Page {i}', encoding='utf-8')
+    tasks = translate.TranslationTasks(content_dir, ['de', 'fr'])
+    stats = asyncio.run(translate.process_translations_async(tasks, 'flow', max_scheduled_tasks=4, check_interval=0.05))
+
+    assert len(stats['completed']) == 8 and not stats['failed']
+    assert (content_dir / 'de' / 'page0.md').read_text(encoding='utf-8') == 'German: Page 0'
+    assert (content_dir / 'fr' / 'page3.md').read_text(encoding='utf-8') == 'French: Page 3'
+    # Workers keep several flows running at once, never more than max_scheduled_tasks
+    assert 1 < fake.max_running_tasks <= 4
+
+def first_language_only(text, variables):
+    """Translate to the first language only when asked for several, to one language otherwise"""
+    if 'target_languages' in variables:
+        return f"<!-- translation:{variables['target_languages'].split(',')[0]} -->\n{text} in one call"
+    return f"{variables['target_language']}: {text}"
+
+def test_group_fallback_runs_languages_concurrently(flowhunt_api, tmp_path, monkeypatch):
+    fake = FakeFlowHunt(translate=first_language_only)
+    flowhunt_api(fake).get_client(rate_limit=1000)
+    translate = importlib.import_module('translate_with_flowhunt')
+    journal = translate.JobJournal(tmp_path / 'journal.sqlite', 'translate')
+
+    # The group job stays scheduled in the journal until its translations are written
+    pending_at_save = []
+    save_translation = translate.save_translation
+
+    def recording_save(target_file, translated_text):
+        pending_at_save.append([job['job_key'] for job in journal.pending('flow')])
+        return save_translation(target_file, translated_text)
+
+    monkeypatch.setattr(translate, 'save_translation', recording_save)
+
+    content_dir = tmp_path / 'content'
+    (content_dir / 'en').mkdir(parents=True)
+    (content_dir / 'en' / 'page.md').write_text('Page', encoding='utf-8')
+    tasks = translate.TranslationTasks(content_dir, ['de', 'fr', 'es', 'it'], group_size=4)
+    stats = asyncio.run(translate.process_translations_async(tasks, 'flow', max_scheduled_tasks=4,
+                                                             check_interval=0.05, journal=journal))
+
+    assert len(stats['completed']) == 4 and not stats['failed']
+    assert (content_dir / 'de' / 'page.md').read_text(encoding='utf-8') == 'Page in one call'
+    assert (content_dir / 'it' / 'page.md').read_text(encoding='utf-8') == 'Italian: Page'
+    assert pending_at_save[0] == [f"de+fr+es+it:{content_dir / 'en' / 'page.md'}"]
+    assert journal.pending('flow') == []
+    # The three missed languages are translated at the same time
+    assert fake.max_running_tasks == 3
+    journal.close()
+
+def test_task_that_never_finishes_is_given_up(flowhunt_api, tmp_path, monkeypatch):
+    fake = FakeFlowHunt(pending_polls=10 ** 6)
+    flowhunt_api(fake).get_client(rate_limit=1000)
+    translate = importlib.import_module('translate_with_flowhunt')
+    monkeypatch.setattr(translate, 'AdaptivePoller', functools.partial(translate.AdaptivePoller, timeout=0.5))
+
+    content_dir = tmp_path / 'content'
+    (content_dir / 'en').mkdir(parents=True)
+    (content_dir / 'en' / 'page.md').write_text('Page', encoding='utf-8')
+    tasks = translate.TranslationTasks(content_dir, ['de'])
+    stats = asyncio.run(translate.process_translations_async(tasks, 'flow', max_scheduled_tasks=4, check_interval=0.05))
+
+    assert not stats['completed'] and len(stats['failed']) == 1
+    assert not (content_dir / 'de' / 'page.md').exists()
+
+def test_failed_and_unknown_resumed_tasks_are_translated_again(flowhunt_api, tmp_path):
+    fake = FakeFlowHunt(translate=lambda text, variables: f"{variables['target_language']}: {text}")
+    flowhunt_api(fake).get_client(rate_limit=1000)
+    translate = importlib.import_module('translate_with_flowhunt')
+    journal = translate.JobJournal(tmp_path / 'journal.sqlite', 'translate')
+
+    content_dir = tmp_path / 'content'
+    (content_dir / 'en').mkdir(parents=True)
+    # An interrupted run left a task that failed on FlowHunt and one FlowHunt no longer knows
+    for name, task_id in (('failed', fake.add_task('FAILURE')), ('unknown', 'expired-task')):
+        source_file, target_file = content_dir / 'en' / f'{name}.md', content_dir / 'de' / f'{name}.md'
+        source_file.write_text(name, encoding='utf-8')
+        inputs = {'file_path': str(source_file), 'target_lang': 'de', 'target_file': str(target_file),
+                  'source_hash': translate.hash_content(name), 'content': name}
+        journal.scheduled(f"de:{target_file}", 'flow', task_id, inputs)
+
+    resumed_jobs = journal.pending('flow')
+    resumed_targets = [job['inputs']['target_file'] for job in resumed_jobs]
+    tasks = translate.TranslationTasks(content_dir, ['de'], skip_targets=resumed_targets)
+    stats = asyncio.run(translate.process_translations_async(tasks, 'flow', max_scheduled_tasks=4, check_interval=0.05,
+                                                             journal=journal, resumed_jobs=resumed_jobs))
+
+    assert len(stats['completed']) == 2 and not stats['failed']
+    assert (content_dir / 'de' / 'failed.md').read_text(encoding='utf-8') == 'German: failed'
+    assert (content_dir / 'de' / 'unknown.md').read_text(encoding='utf-8') == 'German: unknown'
+    assert fake.invoke_requests == 2
+    assert journal.pending('flow') == []
+    journal.close()
@@ -0,0 +1,118 @@
+import os
+from translation_chunks import (split_document, hash_chunk, build_payload, parse_payload,
+                                assemble_document, align_document, CHUNK_MARKER_PATTERN)
+
+CONTENT_INDEX = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'content', 'en', '_index.md')
+
+NESTED_YAML = """---
+title: Hello world again
+hero:
+  title: Hello world again
+  cta:
+    title: Hello world again
+---
+Body text.
+"""
+
+def fake_translate(payload):
+    """Upper-case every line of a payload except the chunk markers"""
+    return '\n'.join(line if CHUNK_MARKER_PATTERN.match(line) else line.upper() for line in payload.split('\n'))
+
+def translate_incrementally(content, cache):
+    """Translate the chunks missing in cache, returns the assembled document"""
+    chunks = split_document(content)
+    missing = [chunk for chunk in chunks if chunk.translatable and hash_chunk(chunk.text) not in cache]
+    # Identical chunks are sent once, like translate_with_flowhunt.py does
+    missing = list({hash_chunk(chunk.text): chunk for chunk in missing}.values())
+    if missing:
+        cache.update(parse_payload(fake_translate(build_payload(missing)), missing))
+    return assemble_document(chunks, cache)
+
+TRANSLATED_NESTED_YAML = """---
+TITLE: HELLO WORLD AGAIN
+hero:
+  TITLE: HELLO WORLD AGAIN
+  cta:
+    TITLE: HELLO WORLD AGAIN
+---
+BODY TEXT.
+"""
+
+def test_nested_identical_yaml_values_keep_their_indentation():
+    assert translate_incrementally(NESTED_YAML, {}) == TRANSLATED_NESTED_YAML
+
+def test_cached_translation_is_reindented_for_the_source_chunk():
+    # A translation cached from the nested chunk is reused for a chunk at another level
+    nested = split_document("---\nhero:\n  title: Hello world again\n---\n")[2]
+    cache = parse_payload(fake_translate(build_payload([nested])), [nested])
+    top_level = split_document("---\ntitle: Hello world again\n---\n")
+    cache[hash_chunk(top_level[1].text)] = cache[hash_chunk(nested.text)]
+    assert assemble_document(top_level, cache) == "---\nTITLE: HELLO WORLD AGAIN\n---\n"
+
+def test_chunks_differing_in_whitespace_do_not_share_a_cache_entry():
+    assert hash_chunk("desc: long-range comms. \n") != hash_chunk("desc: long-range comms.\n")
+    assert hash_chunk("  title: Hello world\n") != hash_chunk("title: Hello world\n")
+    assert hash_chunk("title: Hello world\r\n") == hash_chunk("title: Hello world\n")
+
+def test_identity_translation_round_trips_the_content():
+    with open(CONTENT_INDEX, 'r', encoding='utf-8') as f:
+        content = f.read()
+    chunks = split_document(content)
+    translatable = [chunk for chunk in chunks if chunk.translatable]
+    cache = parse_payload(build_payload(translatable), translatable)
+    assert assemble_document(chunks, cache) == content
+
+def test_aligned_whole_file_translation_seeds_indented_chunks():
+    # Keys without text (hero:, cta:) are not translatable and are kept from the source
+    chunks = split_document(NESTED_YAML)
+    aligned = align_document(chunks, fake_translate(NESTED_YAML))
+    assert assemble_document(chunks, aligned) == TRANSLATED_NESTED_YAML
+
+TOML_PAGE = '''+++
+title = "Smart parking sensors"
+description = "Sensors for every parking lot"
+layout = "single"
+type = "product"
+slug = "smart-parking-sensors"
+url = "/products/smart-parking-sensors/"
+image = "/images/sensor.webp"
+date = "2024-05-01"
+draft = false
+CTA = ["Learn More", "Download Brochure"]
+
+[[features]]
+title = "Long battery life"
+image = "/images/battery.webp"
++++
+Body text.
+'''
+
+YAML_PAGE = '''---
+title: Hardware
+layout: product
+technology:
+  a:
+    title: On-surface sensor
+    url: https://www.fleximodo.com/datasheet.pdf
+  - dt: Battery Life
+    image: https://placehold.co/600x400
+---
+'''
+
+def test_only_text_fields_are_sent_for_translation():
+    for page in (TOML_PAGE, YAML_PAGE):
+        chunks = split_document(page)
+        payload = build_payload([chunk for chunk in chunks if chunk.translatable])
+        for key in ('layout', 'type', 'slug', 'url', 'image', 'date', 'draft'):
+            assert f'{key} =' not in payload and f'{key}:' not in payload
+        # Other fields come out of the translation verbatim
+        translated = translate_incrementally(page, {}).splitlines()
+        for line in page.splitlines():
+            if any(key in line for key in ('layout', 'url', 'image')):
+                assert line in translated
+
+    sent = [chunk.text.strip() for chunk in split_document(TOML_PAGE) if chunk.translatable and chunk.kind == 'field']
+    assert sent == ['title = "Smart parking sensors"', 'description = "Sensors for every parking lot"',
+                    'CTA = ["Learn More", "Download Brochure"]', 'title = "Long battery life"']
+    sent = [chunk.text.strip() for chunk in split_document(YAML_PAGE) if chunk.translatable]
+    assert sent == ['title: Hardware', 'title: On-surface sensor', '- dt: Battery Life']
@@ -5,11 +5,14 @@ translate_with_flowhunt.py
 This script translates files from /content/en/* to all language variations defined in /content/[lang]/
 that don't already exist in the target language directories using FlowHunt API.
 
+Translations are cached by the hash of the English source (see translation_cache.py), so
+files whose English source changed are retranslated and unchanged sources are never sent twice.
+
 Usage:
-    python translate_with_flowhunt.py [--path /path/to/content] [--check-interval 60] [--flow-id FLOW_ID] [--max-scheduled-tasks LIMIT]
+    python translate_with_flowhunt.py [--path /path/to/content] [--check-interval 10] [--flow-id FLOW_ID] [--max-scheduled-tasks LIMIT]
 
 Prerequisites:
-    - Python 3.6 or higher
+    - Python 3.9 or higher
     - FlowHunt API key (set in .env file or as environment variable API_KEY)
     - Required packages: flowhunt, tqdm, python-dotenv
 
@@ -25,39 +28,63 @@ Examples:
     
     # With maximum batch size of 100 scheduled tasks
     python translate_with_flowhunt.py --max-scheduled-tasks 100
+
+    # Only retranslate files whose English source changed since the last run
+    python translate_with_flowhunt.py --stale-only
+
+    # Send only the changed parts of edited files (see translation_chunks.py)
+    python translate_with_flowhunt.py --incremental
+
+    # Collect results of tasks scheduled by an interrupted run (see job_journal.py)
+    python translate_with_flowhunt.py --resume
+
+    # Translate each file to 8 languages per flow call, languages missing in the result are retried one by one
+    python translate_with_flowhunt.py --languages-per-call 8
+
+    # Translate the most visited pages and the most important sections first (see translation_priority.py)
+    python translate_with_flowhunt.py --section-weights hardware=5,solutions=3 --traffic-csv traffic.csv
     
     # With API key as environment variable
     export FLOWHUNT_API_KEY="your-api-key"
     python translate_with_flowhunt.py
+
+    # Against a local fake FlowHunt server
+    FLOWHUNT_API_HOST="http://localhost:8080" python translate_with_flowhunt.py
 """
 
 import os
+import re
 import sys
+import json
 import argparse
+import asyncio
 import time
-import json
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
-from dotenv import load_dotenv
-import flowhunt
-from pprint import pprint
+from flowhunt_client import get_client, load_api_key, is_transient_error, DEFAULT_RATE_LIMIT
+from flowhunt_polling import AdaptivePoller
+from translation_cache import TranslationCache, hash_content
+from job_journal import JobJournal, DEFAULT_JOURNAL_PATH
+from translation_priority import (TranslationPriority, TaskQueue, parse_section_weights,
+                                  load_language_weights, load_traffic)
+from translation_chunks import split_document, hash_chunk, build_payload, parse_payload, assemble_document, align_document
 
-# Load environment variables from .env file
 script_dir = os.path.dirname(os.path.abspath(__file__))
 hugo_root = os.path.dirname(os.path.dirname(os.path.dirname(script_dir)))  # Adjusted to point to the correct root
-env_path = os.path.join(script_dir, '.env')
-if os.path.exists(env_path):
-    print(f"Loading environment variables from {env_path}")
-    load_dotenv(env_path)
-else:
-    print("No .env file found, using environment variables if available")
-
-# Get API key from environment variable
-api_key = os.getenv("FLOWHUNT_API_KEY")
-if not api_key:
-    print("Error: FLOWHUNT_API_KEY not found in environment variables or .env file")
-    print("Please set the FLOWHUNT_API_KEY environment variable or add it to the .env file")
-    sys.exit(1)
+
+# Get API key from .env file or environment variable
+api_key = load_api_key()
+
+# Number of English source files kept in memory while their languages are scheduled
+SOURCE_CACHE_SIZE = 64
+
+# Output format requested from the flow when it translates to several languages at once
+MULTI_LANGUAGE_FORMAT = ("Translate the input to every target language. Start each translation with "
+                         "a line <!-- translation:CODE --> where CODE is the target language code.")
+MULTI_LANGUAGE_MARKER = re.compile(r'^<!-- translation:([A-Za-z_-]+) -->[ \t]*$', re.MULTILINE)
 
 # Default FlowHunt flow ID and workspace ID for translation service
 DEFAULT_FLOW_ID = '7389730a-fbaf-48a2-bb77-3b6814c23b20'
@@ -131,20 +158,6 @@ LANGUAGE_MAP = {
 
 
 
-def get_workspace_id():
-    api_client = initialize_api_client()
-    # Create an instance of the API class
-    api_instance = flowhunt.AuthApi(api_client)
-
-    try:
-        # Get User
-        api_response = api_instance.get_user()
-        return api_response.api_key_workspace_id
-    except flowhunt.ApiException as e:
-        print("Exception when calling AuthApi->get_user: %s\n" % e)
-        return None
-    
-
 def is_translatable_file(file_path):
     """Check if a file should be translated based on extension"""
     return file_path.suffix.lower() in ['.md', '.markdown', '.yaml', '.yml', '.html', '.txt']
@@ -167,302 +180,651 @@ def get_target_languages(content_dir):
             
     return target_langs
 
-def initialize_api_client():
-    """Initialize and return a FlowHunt API client"""
-    configuration = flowhunt.Configuration(
-        host="https://api.flowhunt.io"
-    )
-    configuration.api_key['APIKeyHeader'] = api_key
-    
-    return flowhunt.ApiClient(configuration)
-
-def invoke_flow_for_translation(api_instance, content, target_lang, flow_id, workspace_id):
+def invoke_flow_for_translation(client, content, target_lang, flow_id):
     """
     Invoke a FlowHunt flow to translate content to the target language
     
     Args:
-        api_instance: FlowHunt API instance
+        client (FlowHuntClient): FlowHunt API client
         content (str): Content to translate
-        target_lang (str): Target language code
+        target_lang (str or list): Target language code, or a list of codes to translate to at once
         flow_id (str): FlowHunt flow ID
-        workspace_id (str): FlowHunt workspace ID
         
     Returns:
         str: Process ID or None if failed
     """
     try:
-        # Get the full language name from the map, fallback to the code if not found
-        language_name = LANGUAGE_MAP.get(target_lang.lower(), target_lang)
-        
-        # Prepare the request payload
-        flow_invoke_request = flowhunt.FlowInvokeRequest(
-            variables={
-                "source_language": "English",
-                "target_language": language_name,
-                "today": time.strftime("%Y-%m-%d %H:00:00"),
-            }, 
-            human_input=content
-        )
-        
-        # Invoke the flow
-        response = api_instance.invoke_flow_singleton(
-            flow_id=flow_id,
-            workspace_id=workspace_id,
-            flow_invoke_request=flow_invoke_request
-        )
+        variables = {
+            "source_language": "English",
+            "today": time.strftime("%Y-%m-%d %H:00:00"),
+        }
+        if isinstance(target_lang, str):
+            # Get the full language name from the map, fallback to the code if not found
+            variables["target_language"] = LANGUAGE_MAP.get(target_lang.lower(), target_lang)
+        else:
+            variables["target_language"] = ", ".join(LANGUAGE_MAP.get(lang.lower(), lang) for lang in target_lang)
+            variables["target_languages"] = ",".join(target_lang)
+            variables["output_format"] = MULTI_LANGUAGE_FORMAT
         
-        # Return the process ID for checking status later
-        return response.id
+        # Invoke the flow and return the process ID for checking status later
+        return client.invoke_flow(flow_id, content, variables)
         
     except Exception as e:
         print(f"Error invoking flow for {target_lang}: {str(e)}")
         return None
 
-def check_flow_results(api_instance, process_id, flow_id, workspace_id):
+def check_flow_results(client, process_id, flow_id):
     """
     Check if a flow has completed and get the results
     
     Args:
-        api_instance: FlowHunt API instance
+        client (FlowHuntClient): FlowHunt API client
         process_id (str): Process ID to check
         flow_id (str): FlowHunt flow ID
-        workspace_id (str): FlowHunt workspace ID
         
     Returns:
-        tuple: (is_ready, result_text)
+        tuple: (is_ready, result_text), (True, None) when the task failed, is unknown or expired
+               or its result is malformed, so checking it again will not help
     """
     try:
-        # Get the results of the invoked flow
-        response = api_instance.get_invoked_flow_results(
-            flow_id=flow_id, task_id=process_id, workspace_id=workspace_id
-        )
-        
-        # Check if the flow has completed
-        if response.status == "SUCCESS":
+        is_ready, result = client.check(flow_id, process_id)
+        if is_ready:
             # Extract the translated text from the response
-            translated_text = json.loads(response.result)
-            translated_text = translated_text['outputs'][0]['outputs'][0]['results']['message']['result']
-            return True, translated_text
-        else:
-            # Flow is still processing
-            return False, None
+            return True, result['outputs'][0]['outputs'][0]['results']['message']['result']
+        # Flow is still processing
+        return False, None
             
     except Exception as e:
         print(f"Error checking flow results for process {process_id}: {str(e)}")
-        return False, None
+        if is_transient_error(e):
+            return False, None
+        return True, None
+
+@functools.lru_cache(maxsize=SOURCE_CACHE_SIZE)
+def read_source(file_path):
+    """Return (content, hash) of an English source file, recently read files are kept in memory"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return content, hash_content(content)
 
-def find_files_for_translation(content_dir, target_langs):
+class TranslationTasks:
     """
-    Find all files that need translation
-    
+    Lazily produced translation tasks
+
+    Discovery only walks the English directory and queues the paths of the
+    target files by priority. A source file is read and checked against its
+    target file and the cache only when a worker asks for its next task, so
+    memory is bounded by the number of tasks in flight rather than by the size
+    of the site, and the first request is sent right after the directory walk.
+
+    Without a cache, a file needs translation when the target file does not exist.
+    With a cache, a target file also needs translation when the English source
+    changed since the target was produced; translations of an unchanged source
+    found in the cache are restored instead of being scheduled again.
+
+    With group_size above 1, the target languages of a file are grouped, so one
+    flow call can translate the file to the whole group (see --languages-per-call).
+
+    Iterating yields tuples (file_path, content, target_lang, target_file), most
+    valuable first. For a group of languages, target_lang and target_file are
+    tuples of the languages and target files still needing translation.
+
     Args:
         content_dir (Path): Path to the content directory
         target_langs (list): List of target language codes
-        
+        cache (TranslationCache): Optional translation cache
+        stale_only (bool): Only retranslate existing files whose source changed
+        priority (TranslationPriority): Priority function ordering the tasks
+        skip_targets (iterable): Target files not to translate, e.g. produced by resumed jobs
+        group_size (int): Maximum number of target languages of a file translated at once
+    """
+
+    def __init__(self, content_dir, target_langs, cache=None, stale_only=False, priority=None, skip_targets=(),
+                 group_size=1):
+        self.en_dir = content_dir / "en"
+        self.cache = cache
+        self.stale_only = stale_only
+        self.candidates = TaskQueue(priority)
+        self.translatable_files = 0
+        self.produced = 0
+        self.queued_targets = 0
+        self.files_already_exist = 0
+
+        # Group languages of similar priority, a group is due when its first language is
+        languages = sorted(target_langs, key=self.candidates.priority.language_factor, reverse=True)
+        groups = [languages[i:i + group_size] for i in range(0, len(languages), max(group_size, 1))]
+
+        skip_targets = {str(target_file) for target_file in skip_targets}
+        for root, _, files in os.walk(self.en_dir):
+            for file in files:
+                file_path = Path(root) / file
+                if not is_translatable_file(file_path):
+                    continue
+                self.translatable_files += 1
+
+                # Get the relative path from the English directory
+                rel_path = file_path.relative_to(self.en_dir)
+                for group in groups:
+                    targets = [(target_lang, content_dir / target_lang / rel_path) for target_lang in group]
+                    targets = [target for target in targets if str(target[1]) not in skip_targets]
+                    if targets:
+                        self.candidates.push((file_path, targets), rel_path, targets[0][0])
+                        self.queued_targets += len(targets)
+
+    def __len__(self):
+        """Return the number of queued target files, an upper bound of the tasks still to be produced"""
+        return self.queued_targets
+
+    def expected(self):
+        """Return an upper bound of the number of target files translated by the whole run"""
+        return self.produced + self.queued_targets
+
+    def peek(self, count=1):
+        """Return (file_path, [(target_lang, target_file), ...]) of the first queued candidates"""
+        return self.candidates.peek(count)
+
+    def needs_translation(self, source_hash, target_lang, target_file):
+        """Check if a target file needs translation, restoring it from the cache when possible"""
+        cache = self.cache
+        if target_file.exists():
+            if not cache:
+                self.files_already_exist += 1
+                return False
+
+            recorded_hash = cache.recorded_hash(target_file)
+            if recorded_hash is None:
+                # Translated before the cache existed, track it from now on
+                cache.record(target_file, source_hash)
+            if recorded_hash is None or recorded_hash == source_hash:
+                cache.count(target_lang, 'fresh')
+                self.files_already_exist += 1
+                return False
+        elif self.stale_only:
+            return False
+
+        if cache:
+            cached_text = cache.get(source_hash, target_lang)
+            if cached_text is not None:
+                # Reuse the translation produced for the same source earlier
+                save_translation(target_file, cached_text)
+                cache.record(target_file, source_hash)
+                cache.count(target_lang, 'hit')
+                print(f"Restored from cache: {target_file}")
+                return False
+            cache.count(target_lang, 'miss')
+        return True
+
+    def __iter__(self):
+        for file_path, targets in self.candidates:
+            self.queued_targets -= len(targets)
+            content, source_hash = read_source(file_path)
+            targets = [(target_lang, target_file) for target_lang, target_file in targets
+                       if self.needs_translation(source_hash, target_lang, target_file)]
+            self.produced += len(targets)
+            if len(targets) == 1:
+                yield file_path, content, targets[0][0], targets[0][1]
+            elif targets:
+                target_langs, target_files = zip(*targets)
+                yield file_path, content, target_langs, target_files
+
+def strip_code_fences(translated_text):
+    """Remove code fences the flow sometimes wraps its output in"""
+    if translated_text.startswith("```"):
+        translated_text = translated_text[3:]
+    if translated_text.endswith("```"):
+        translated_text = translated_text[:-3]
+    return translated_text
+
+def parse_multi_language_result(translated_text, target_langs):
+    """
+    Split the result of a multi-language translation into the translations of each language
+
+    The result is either a JSON object mapping language codes to translations, or
+    translations each preceded by a <!-- translation:CODE --> line (MULTI_LANGUAGE_FORMAT).
+
+    Args:
+        translated_text (str): Result of the flow
+        target_langs (list): Requested target language codes
+
     Returns:
-        list: List of tuples (file_path, content, target_lang, target_file)
+        dict: {target_lang: translated_text} of the requested languages found in the result,
+              or None if no translation could be parsed
     """
-    en_dir = content_dir / "en"
-    translation_tasks = []
-    files_already_exist = 0
-    
-    # Find all translatable files in the English directory
-    translatable_files = []
-    for root, _, files in os.walk(en_dir):
-        for file in files:
-            file_path = Path(root) / file
-            if is_translatable_file(file_path):
-                translatable_files.append(file_path)
-    
-    print(f"Found {len(translatable_files)} translatable files in the English directory")
-    
-    if len(translatable_files) == 0:
-        print("No translatable files found in the English directory")
-        return [], 0
-    
-    # Create the list of translation tasks
-    for file_path in translatable_files:
-        # Read the content of the file
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Get the relative path from the English directory
-        rel_path = file_path.relative_to(en_dir)
-        
-        # For each target language, check if translation is needed
-        for target_lang in target_langs:
-            target_dir = content_dir / target_lang
-            target_file = target_dir / rel_path
-            
-            # Skip if the target file already exists
-            if target_file.exists():
-                files_already_exist += 1
+    translations = {}
+    unfenced = re.sub(r'^```(?:json)?\s*|\s*```$', '', translated_text.strip())
+    try:
+        data = json.loads(unfenced)
+        if isinstance(data, dict):
+            translations = {str(code).lower(): text for code, text in data.items() if isinstance(text, str)}
+    except ValueError:
+        parts = MULTI_LANGUAGE_MARKER.split(translated_text)
+        # parts alternate between the text before a marker and the language code of the marker
+        for code, text in zip(parts[1::2], parts[2::2]):
+            translations[code.lower()] = text
+
+    result = {}
+    for target_lang in target_langs:
+        text = translations.get(target_lang.lower(), '').strip()
+        if text:
+            result[target_lang] = text
+    return result or None
+
+def save_translation(target_file, translated_text):
+    """
+    Write translated text to the target file, stripping surrounding code fences
+
+    Args:
+        target_file (Path): Path of the translated file
+        translated_text (str): Translated content returned by the flow
+
+    Returns:
+        str: Content written to the target file
+    """
+    # Ensure the target directory exists
+    os.makedirs(target_file.parent, exist_ok=True)
+
+    translated_text = strip_code_fences(translated_text)
+    with open(target_file, 'w', encoding='utf-8') as f:
+        f.write(translated_text)
+
+    return translated_text
+
+async def process_translations_async(translation_tasks, flow_id, max_scheduled_tasks=500, cache=None,
+                                     incremental=False, check_interval=10, journal=None, resumed_jobs=()):
+    """
+    Process translation tasks concurrently using FlowHunt API
+
+    Each of up to max_scheduled_tasks workers invokes a flow, polls it until it
+    finishes and saves the result, then immediately picks up the next task, so a
+    free slot is refilled as soon as a translation completes. The blocking
+    FlowHunt SDK calls run in a thread pool sized to the shared client's
+    connection pool. Each task is polled on its own schedule derived from
+    learned completion times (see flowhunt_polling.py).
+
+    In incremental mode, files are split into chunks (see translation_chunks.py)
+    and only chunks missing in the cache are sent to FlowHunt. Files without any
+    cached chunk are translated whole and their translation is split to seed the
+    chunk cache.
+
+    Language groups produced by TranslationTasks are translated with one flow call
+    returning all languages of the group. Languages missing in its result are
+    translated one by one. In incremental mode, languages with cached chunks of
+    the file leave the group, sending their missing chunks is cheaper.
+
+    Every invoked flow is recorded in the job journal. Jobs resumed from the
+    journal are processed first, by waiting for the results of their already
+    running FlowHunt tasks.
+
+    Args:
+        translation_tasks (TranslationTasks): Translation tasks, produced lazily as workers free up
+        flow_id (str): FlowHunt flow ID
+        max_scheduled_tasks (int): Maximum number of translation tasks in flight at once
+        cache (TranslationCache): Optional cache receiving the produced translations
+        incremental (bool): Translate only changed chunks of files, requires cache
+        check_interval (int): Minimum interval in seconds between two status checks of a task
+        journal (JobJournal): Optional journal recording the invoked flows
+        resumed_jobs (list): Scheduled jobs of an interrupted run, as returned by JobJournal.pending
+
+    Returns:
+        dict: Run statistics (completed, failed, elapsed seconds, tasks per minute, chunk counts)
+    """
+    poller = AdaptivePoller(check_interval)
+    start_time = time.monotonic()
+
+    completed_tasks = []
+    failed_tasks = []
+    in_flight = set()
+    chunk_stats = {'reused': 0, 'sent': 0}
+
+    def total_tasks():
+        return len(resumed_jobs) + translation_tasks.expected()
+
+    def single_job(file_path, content, target_lang, target_file):
+        """Create the job translating a file to one language"""
+        inputs = {
+            'file_path': str(file_path),
+            'target_lang': target_lang,
+            'target_file': str(target_file),
+            'source_hash': hash_content(content),
+            'content': content,
+        }
+        return {'id': None, 'key': f"{target_lang}:{target_file}", 'inputs': inputs}
+
+    def iterate_jobs():
+        for resumed_job in resumed_jobs:
+            yield {'id': resumed_job['id'], 'key': resumed_job['job_key'], 'inputs': resumed_job['inputs']}, \
+                resumed_job['task_id']
+        for file_path, content, target_lang, target_file in translation_tasks:
+            # Skipped candidates shrink the expected number of tasks
+            scheduling_progress.total = processing_progress.total = total_tasks()
+            if isinstance(target_lang, str):
+                yield single_job(file_path, content, target_lang, target_file), None
                 continue
-            
-            # Add to translation tasks
-            translation_tasks.append((file_path, content, target_lang, target_file))
-    
-    return translation_tasks, files_already_exist
+            inputs = {
+                'file_path': str(file_path),
+                'target_langs': list(target_lang),
+                'target_files': [str(path) for path in target_file],
+                'source_hash': hash_content(content),
+                'content': content,
+            }
+            yield {'id': None, 'key': f"{'+'.join(target_lang)}:{file_path}", 'inputs': inputs}, None
+
+    remaining_jobs = iterate_jobs()
+    # Languages of groups translated one by one after their multi-language translation missed them
+    single_language_jobs = deque()
+    groups_in_progress = set()
+    jobs_added = asyncio.Condition()
+
+    print(f"\nStarting translation of up to {total_tasks()} files")
+    if resumed_jobs:
+        print(f"Collecting results of {len(resumed_jobs)} tasks scheduled by an interrupted run first")
+    print(f"Maintaining up to {max_scheduled_tasks} tasks in flight at all times")
+
+    scheduling_progress = tqdm(total=total_tasks(), desc="Scheduling translations")
+    processing_progress = tqdm(total=total_tasks(), desc="Processing translations")
+
+    def tasks_per_minute():
+        elapsed = time.monotonic() - start_time
+        return len(completed_tasks) / (elapsed / 60) if elapsed > 0 else 0.0
+
+    client = get_client()
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=min(max_scheduled_tasks, client.pool_size)))
+
+    async def wait_for_flow(process_id):
+        """Poll a flow until it finishes, returns its trimmed result or None on failure"""
+        in_flight.add(process_id)
+        poller.start(process_id, flow_id)
+        try:
+            while True:
+                await asyncio.sleep(poller.delay(process_id))
+                is_ready, translated_text = await asyncio.to_thread(
+                    check_flow_results, client, process_id, flow_id
+                )
+                if is_ready and translated_text is None:
+                    poller.failed(process_id)
+                    return None
+                poller.checked(process_id, is_ready)
+                if is_ready:
+                    break
+                if poller.timed_out(process_id):
+                    print(f"Flow task {process_id} did not finish within {poller.deadline(process_id):.0f}s, giving up")
+                    poller.failed(process_id)
+                    return None
+        finally:
+            in_flight.discard(process_id)
+            poller.forget(process_id)
+
+        # Trim all whitespace from the translated text
+        return translated_text.strip() if translated_text else None
 
-def process_translations(translation_tasks, flow_id, workspace_id, max_scheduled_tasks=500):
+    async def run_flow(payload, job, mode, chunk_hashes=None):
+        """Invoke the flow, record it in the journal and wait for its result"""
+        target = job['inputs'].get('target_langs') or job['inputs']['target_lang']
+        process_id = await asyncio.to_thread(invoke_flow_for_translation, client, payload, target, flow_id)
+        if not process_id:
+            return None
+
+        if journal:
+            job['inputs']['mode'] = mode
+            job['inputs']['chunk_hashes'] = chunk_hashes
+            job['id'] = journal.scheduled(job['key'], flow_id, process_id, job['inputs'], job['id'])
+        return await wait_for_flow(process_id)
+
+    def finish_chunks(target_lang, chunks, translations, sent_chunks, translated_text):
+        """Assemble a file from cached chunks and a translated payload, returns None on failure"""
+        parsed = parse_payload(strip_code_fences(translated_text), sent_chunks) if translated_text else None
+        if not parsed:
+            return None
+        cache.put_chunks(parsed, target_lang)
+        chunk_stats['reused'] += len(translations)
+        chunk_stats['sent'] += len(sent_chunks)
+        translations.update(parsed)
+        if any(chunk.translatable and hash_chunk(chunk.text) not in translations for chunk in chunks):
+            return None
+        return assemble_document(chunks, translations)
+
+    def finish_full(target_lang, chunks, translated_text):
+        """Seed the chunk cache from a whole-file translation"""
+        if translated_text and chunks is not None:
+            chunk_stats['sent'] += sum(1 for chunk in chunks if chunk.translatable)
+            aligned = align_document(chunks, strip_code_fences(translated_text))
+            if aligned:
+                cache.put_chunks(aligned, target_lang)
+        return translated_text
+
+    async def translate_file(job, resume_task_id=None):
+        """Translate the file of a job, returns the translated text or None on failure"""
+        inputs = job['inputs']
+        content, target_lang, file_path = inputs['content'], inputs['target_lang'], inputs['file_path']
+
+        chunks, translations, missing_chunks = None, {}, []
+        if cache and (incremental or inputs.get('mode') == 'chunks'):
+            chunks = split_document(content)
+            translatable = {hash_chunk(chunk.text): chunk for chunk in chunks if chunk.translatable}
+            translations = cache.get_chunks(list(translatable), target_lang)
+            missing_chunks = [chunk for chunk_hash, chunk in translatable.items() if chunk_hash not in translations]
+
+        translated_text = await wait_for_flow(resume_task_id) if resume_task_id else None
+        if resume_task_id and translated_text is None:
+            # The resumed task failed, expired or timed out, the file is translated by a new flow
+            print(f"Resumed task {resume_task_id} of {file_path} to {target_lang} failed, invoking the flow again")
+            if journal:
+                journal.failed(job['id'], "resumed task failed")
+            resume_task_id = None
+
+        if resume_task_id:
+            if inputs.get('mode') != 'chunks':
+                return finish_full(target_lang, chunks, translated_text)
+            if chunks is not None:
+                sent_chunks = [translatable[chunk_hash] for chunk_hash in inputs['chunk_hashes']]
+                assembled = finish_chunks(target_lang, chunks, translations, sent_chunks, translated_text)
+                if assembled:
+                    return assembled
+        elif chunks is not None and not missing_chunks:
+            chunk_stats['reused'] += len(translations)
+            return assemble_document(chunks, translations)
+        elif chunks is not None and translations:
+            translated_text = await run_flow(
+                build_payload(missing_chunks), job, 'chunks', [hash_chunk(chunk.text) for chunk in missing_chunks]
+            )
+            assembled = finish_chunks(target_lang, chunks, translations, missing_chunks, translated_text)
+            if assembled:
+                return assembled
+        else:
+            return finish_full(target_lang, chunks, await run_flow(content, job, 'full'))
+
+        print(f"Chunked translation of {file_path} to {target_lang} failed, translating the whole file")
+        return finish_full(target_lang, chunks, await run_flow(content, job, 'full'))
+
+    def save_result(file_path, target_lang, target_file, source_hash, translated_text):
+        """Save a translation, returns an error message or None"""
+        if not translated_text:
+            failed_tasks.append((file_path, target_lang, target_file))
+            print(f"Failed to translate {file_path} to {target_lang}")
+            return "translation failed"
+
+        try:
+            written_text = save_translation(target_file, translated_text)
+            if cache:
+                cache.put(source_hash, target_lang, target_file, written_text)
+            completed_tasks.append((file_path, target_lang, target_file))
+            print(f"Translated: {target_file}")
+            return None
+        except Exception as e:
+            print(f"Error saving translation to {target_file}: {str(e)}")
+            failed_tasks.append((file_path, target_lang, target_file))
+            return f"error saving translation: {e}"
+
+    async def process_job(job, resume_task_id=None):
+        """Translate a file to one language and save it"""
+        inputs = job['inputs']
+        translated_text = await translate_file(job, resume_task_id)
+        processing_progress.update(1)
+
+        error = save_result(Path(inputs['file_path']), inputs['target_lang'], Path(inputs['target_file']),
+                            inputs['source_hash'], translated_text)
+        if journal:
+            if error:
+                journal.failed(job['id'], error, job['key'], flow_id, inputs)
+            elif job['id'] is not None:
+                journal.completed(job['id'])
+
+    async def process_group(job, resume_task_id=None):
+        """Translate a file to a group of languages with one flow call, falling back to single languages"""
+        inputs = job['inputs']
+        file_path, content = Path(inputs['file_path']), inputs['content']
+        targets = dict(zip(inputs['target_langs'], inputs['target_files']))
+        chunks = split_document(content) if cache and incremental else None
+
+        single_jobs = []
+        if chunks is not None and not resume_task_id:
+            # Languages with cached chunks of the file only need their missing chunks translated
+            chunk_hashes = [hash_chunk(chunk.text) for chunk in chunks if chunk.translatable]
+            for target_lang in list(targets):
+                if cache.get_chunks(chunk_hashes, target_lang):
+                    single_jobs.append(single_job(file_path, content, target_lang, targets.pop(target_lang)))
+
+        translations = {}
+        if resume_task_id or len(targets) > 1:
+            if resume_task_id:
+                translated_text = await wait_for_flow(resume_task_id)
+            else:
+                inputs['target_langs'], inputs['target_files'] = list(targets), list(targets.values())
+                translated_text = await run_flow(content, job, 'languages')
+            if translated_text:
+                translations = parse_multi_language_result(translated_text, list(targets)) or {}
+            if journal and job['id'] is not None and not translations:
+                # The languages are translated one by one below
+                journal.failed(job['id'], "multi-language result could not be parsed" if translated_text
+                               else "flow task failed")
+
+        for target_lang, target_file in targets.items():
+            if target_lang not in translations:
+                single_jobs.append(single_job(file_path, content, target_lang, target_file))
+                continue
+            translated_text = finish_full(target_lang, chunks, translations[target_lang])
+            processing_progress.update(1)
+            error = save_result(file_path, target_lang, Path(target_file), inputs['source_hash'], translated_text)
+            if journal and error:
+                failed_job = single_job(file_path, content, target_lang, target_file)
+                journal.failed(None, error, failed_job['key'], flow_id, failed_job['inputs'])
+        # The result is only lost once all its languages are written
+        if journal and job['id'] is not None and translations:
+            journal.completed(job['id'])
+
+        if len(targets) > 1 and len(translations) < len(targets):
+            missing = [target_lang for target_lang in targets if target_lang not in translations]
+            print(f"Multi-language translation of {file_path} missed {', '.join(missing)}, translating one by one")
+        # Free workers pick the single languages up before any new file, see translation_worker()
+        single_language_jobs.extend(single_jobs)
+
+    async def next_job():
+        """Return (job, resume task ID, scheduled before) of the next job, or None when no job is left"""
+        async with jobs_added:
+            while True:
+                if single_language_jobs:
+                    return single_language_jobs.popleft(), None, True
+                next_item = next(remaining_jobs, None)
+                if next_item is not None:
+                    return next_item[0], next_item[1], False
+                if not groups_in_progress:
+                    return None
+                # A group still running may hand over the languages it missed
+                await jobs_added.wait()
+
+    async def translation_worker():
+        while (next_item := await next_job()) is not None:
+            job, resume_task_id, scheduled_before = next_item
+            if 'target_langs' in job['inputs']:
+                scheduling_progress.update(len(job['inputs']['target_langs']))
+                groups_in_progress.add(id(job))
+                try:
+                    await process_group(job, resume_task_id)
+                finally:
+                    async with jobs_added:
+                        groups_in_progress.discard(id(job))
+                        jobs_added.notify_all()
+            else:
+                if not scheduled_before:
+                    scheduling_progress.update(1)
+                await process_job(job, resume_task_id)
+
+    async def report_status():
+        while True:
+            await asyncio.sleep(max(check_interval, 1))
+            etas = [eta for eta in (poller.eta(task_id) for task_id in list(poller.tasks)) if eta is not None]
+            next_eta = f"{min(etas):.0f}s" if etas else "unknown"
+            print(f"Tasks in flight: {len(in_flight)} | "
+                  f"Completed: {len(completed_tasks)}/{total_tasks()} | "
+                  f"Failed: {len(failed_tasks)} | "
+                  f"Throughput: {tasks_per_minute():.1f} tasks/min | "
+                  f"Next expected completion: {next_eta} | "
+                  f"{client.limiter.status()}")
+
+    reporter = asyncio.create_task(report_status())
+    try:
+        workers = min(max_scheduled_tasks, total_tasks())
+        await asyncio.gather(*(translation_worker() for _ in range(workers)))
+    finally:
+        reporter.cancel()
+        scheduling_progress.close()
+        processing_progress.close()
+
+    elapsed = time.monotonic() - start_time
+    return {
+        'completed': completed_tasks,
+        'failed': failed_tasks,
+        'elapsed': elapsed,
+        'tasks_per_minute': tasks_per_minute(),
+        'chunks_reused': chunk_stats['reused'],
+        'chunks_sent': chunk_stats['sent'],
+        'polling': poller.summary(),
+        'rate': client.limiter.status(),
+    }
+
+def process_translations(translation_tasks, flow_id, max_scheduled_tasks=500, cache=None,
+                         incremental=False, check_interval=10, journal=None, resumed_jobs=()):
     """
-    Process translation tasks using FlowHunt API, maintaining a constant queue size
-    
+    Process translation tasks using FlowHunt API, maintaining a constant number of tasks in flight
+
+    Synchronous wrapper around process_translations_async.
+
     Args:
-        translation_tasks (list): List of translation tasks
+        translation_tasks (TranslationTasks): Translation tasks, produced lazily as workers free up
         flow_id (str): FlowHunt flow ID
-        workspace_id (str): FlowHunt workspace ID
         max_scheduled_tasks (int): Maximum number of translation tasks to schedule at once
+        cache (TranslationCache): Optional cache receiving the produced translations
+        incremental (bool): Translate only changed chunks of files, requires cache
+        check_interval (int): Minimum interval in seconds between two status checks of a task
+        journal (JobJournal): Optional journal recording the invoked flows
+        resumed_jobs (list): Scheduled jobs of an interrupted run to collect first
     """
-    if not translation_tasks:
+    if not translation_tasks and not resumed_jobs:
         print("No files need translation (all files already exist in target languages)")
         return
-    
-    print(f"Translating {len(translation_tasks)} files with maximum {max_scheduled_tasks} tasks at a time")
-    check_interval = 10
-    # Initialize the API client
-    with initialize_api_client() as api_client:
-        api_instance = flowhunt.FlowsApi(api_client)
-        
-        # Lists to track completed and failed tasks across all batches
-        all_completed_tasks = []
-        all_failed_tasks = []
-        
-        # Process translations while maintaining max_scheduled_tasks in queue
-        remaining_tasks = translation_tasks.copy()
-        pending_tasks = {}  # {process_id: (file_path, target_lang, target_file, content)}
-        completed_tasks = []
-        failed_tasks = []
-        total_scheduled = 0
-        total_completed = 0
-        
-        print(f"\nStarting translation of {len(translation_tasks)} files")
-        print(f"Maintaining up to {max_scheduled_tasks} tasks in the queue at all times")
-        
-        # Initial progress bar for scheduling
-        scheduling_progress = tqdm(total=len(translation_tasks), desc="Scheduling translations")
-        processing_progress = tqdm(total=len(translation_tasks), desc="Processing translations")
-        
-        # Initial scheduling of tasks up to max_scheduled_tasks
-        initial_batch = remaining_tasks[:max_scheduled_tasks]
-        remaining_tasks = remaining_tasks[max_scheduled_tasks:]
-        
-        # Schedule initial batch of tasks
-        for file_path, content, target_lang, target_file in initial_batch:
-            process_id = invoke_flow_for_translation(api_instance, content, target_lang, flow_id, workspace_id)
-            
-            if process_id:
-                # Add to pending tasks
-                pending_tasks[process_id] = (file_path, target_lang, target_file, content)
-                total_scheduled += 1
-            else:
-                # Failed to invoke flow
-                failed_tasks.append((file_path, target_lang, target_file))
-                all_failed_tasks.append((file_path, target_lang, target_file))
-            
-            scheduling_progress.update(1)
-        
-        print(f"Initially scheduled {len(pending_tasks)} tasks, now processing and scheduling more as needed...")
-        
-        # Continue processing and scheduling until all tasks are completed
-        while pending_tasks or remaining_tasks:
-            # Wait for the check interval before checking results
-            time.sleep(check_interval)
-            
-            # Check for completed tasks
-            process_ids = list(pending_tasks.keys())
-            completed_in_batch = 0
-            newly_scheduled = 0
-            
-            for process_id in process_ids:
-                file_path, target_lang, target_file, content = pending_tasks[process_id]
-                
-                is_ready, translated_text = check_flow_results(api_instance, process_id, flow_id, workspace_id)
-                
-                # Trim all whitespace from the translated text
-                if translated_text:
-                    translated_text = translated_text.strip()
 
-                if is_ready:
-                    # Remove from pending tasks
-                    del pending_tasks[process_id]
-                    completed_in_batch += 1
-                    total_completed += 1
-                    
-                    if translated_text:
-                        try:
-                            # Ensure the target directory exists
-                            os.makedirs(target_file.parent, exist_ok=True)
-                            
-                            # Write the translated content to the target file
-                            with open(target_file, 'w', encoding='utf-8') as f:
-                                # If translated text starts or ends with ```, remove it
-                                if translated_text.startswith("```"):
-                                    translated_text = translated_text[3:]
-                                if translated_text.endswith("```"):
-                                    translated_text = translated_text[:-3]
-                                f.write(translated_text)
-                            
-                            # Add to completed tasks
-                            completed_tasks.append((file_path, target_lang, target_file))
-                            all_completed_tasks.append((file_path, target_lang, target_file))
-                            print(f"Translated: {target_file}")
-                            
-                        except Exception as e:
-                            print(f"Error saving translation to {target_file}: {str(e)}")
-                            failed_tasks.append((file_path, target_lang, target_file))
-                            all_failed_tasks.append((file_path, target_lang, target_file))
-                    else:
-                        # Translation failed
-                        failed_tasks.append((file_path, target_lang, target_file))
-                        all_failed_tasks.append((file_path, target_lang, target_file))
-                        print(f"Failed to translate {file_path} to {target_lang}")
-            
-            # Schedule new tasks to replace completed ones, maintaining max_scheduled_tasks
-            tasks_to_schedule = min(completed_in_batch, len(remaining_tasks))
-            
-            for i in range(tasks_to_schedule):
-                file_path, content, target_lang, target_file = remaining_tasks.pop(0)
-                process_id = invoke_flow_for_translation(api_instance, content, target_lang, flow_id, workspace_id)
-                
-                if process_id:
-                    # Add to pending tasks
-                    pending_tasks[process_id] = (file_path, target_lang, target_file, content)
-                    newly_scheduled += 1
-                    total_scheduled += 1
-                else:
-                    # Failed to invoke flow
-                    failed_tasks.append((file_path, target_lang, target_file))
-                    all_failed_tasks.append((file_path, target_lang, target_file))
-                
-                scheduling_progress.update(1)
-            
-            # Update progress
-            processing_progress.update(completed_in_batch)
-            
-            # Print status update
-            if pending_tasks:
-                print(f"Tasks in queue: {len(pending_tasks)} | "
-                      f"Completed: {total_completed}/{len(translation_tasks)} | "
-                      f"Remaining to schedule: {len(remaining_tasks)} | "
-                      f"Just completed: {completed_in_batch} | "
-                      f"Just scheduled: {newly_scheduled}")
-        
-        # Close the progress bars
-        scheduling_progress.close()
-        processing_progress.close()
-        
-        # Print summary
-        print(f"\nTranslation Summary:")
-        print(f"Files translated successfully: {len(all_completed_tasks)}")
-        print(f"Files failed: {len(all_failed_tasks)}")
-        print(f"Total files processed: {len(all_completed_tasks) + len(all_failed_tasks)}")
-    
+    print(f"Translating up to {len(translation_tasks) + len(resumed_jobs)} files with maximum {max_scheduled_tasks} tasks at a time")
+    stats = asyncio.run(
+        process_translations_async(
+            translation_tasks, flow_id, max_scheduled_tasks, cache, incremental, check_interval,
+            journal, resumed_jobs
+        )
+    )
+
     # Print overall summary
     print("\nOverall Translation Summary:")
-    print(f"Files translated successfully: {len(all_completed_tasks)}")
-    print(f"Files failed: {len(all_failed_tasks)}")
-    print(f"Total files processed: {len(all_completed_tasks) + len(all_failed_tasks)}")
+    print(f"Files translated successfully: {len(stats['completed'])}")
+    print(f"Files failed: {len(stats['failed'])}")
+    print(f"Files skipped (up to date): {translation_tasks.files_already_exist}")
+    print(f"Total files processed: {len(stats['completed']) + len(stats['failed'])}")
+    print(f"Elapsed time: {stats['elapsed']:.1f}s")
+    print(f"Throughput: {stats['tasks_per_minute']:.1f} tasks/min")
+    print(stats['polling'])
+    print(stats['rate'])
+    if incremental:
+        print(f"Chunks reused from cache: {stats['chunks_reused']}")
+        print(f"Chunks sent for translation: {stats['chunks_sent']}")
 
 def main():
     """Main function to parse arguments and process files"""
@@ -475,6 +837,11 @@ Examples:
   python translate_with_flowhunt.py --check-interval 30
   python translate_with_flowhunt.py --flow-id "custom-flow-id"
   python translate_with_flowhunt.py --max-scheduled-tasks 100
+  python translate_with_flowhunt.py --stale-only
+  python translate_with_flowhunt.py --incremental
+  python translate_with_flowhunt.py --resume
+  python translate_with_flowhunt.py --languages-per-call 8
+  python translate_with_flowhunt.py --section-weights hardware=5,solutions=3 --traffic-csv traffic.csv
         """,
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
@@ -489,9 +856,9 @@ Examples:
     )
     parser.add_argument(
         "--check-interval",
-        help="Interval in seconds to check for completed translation tasks (default: %(default)s)",
+        help="Minimum interval in seconds between two status checks of a translation task, at least 1 (default: %(default)s)",
         type=int,
-        default=60
+        default=10
     )
     parser.add_argument(
         "--max-scheduled-tasks",
@@ -504,13 +871,88 @@ Examples:
         help="FlowHunt flow ID for translation service (default: %(default)s)",
         default=DEFAULT_FLOW_ID
     )
+    parser.add_argument(
+        "--rate-limit",
+        help="Maximum number of FlowHunt API requests per second, lowered automatically when throttled (default: %(default)s)",
+        type=float,
+        default=DEFAULT_RATE_LIMIT
+    )
+    parser.add_argument(
+        "--max-concurrent-requests",
+        help="Maximum number of FlowHunt API requests in flight at once (default: size of the connection pool)",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory of the translation cache (default: .translation_cache next to the content directory)",
+        default=None
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the translation cache, translate only files missing in the target languages"
+    )
+    parser.add_argument(
+        "--stale-only",
+        action="store_true",
+        help="Only retranslate existing files whose English source changed since they were translated"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Send only changed front matter fields, headings, paragraphs and shortcodes of a file for translation"
+    )
+    parser.add_argument(
+        "--languages-per-call",
+        help="Translate a file to up to this many languages with one flow call, the flow must support "
+             "the target_languages and output_format variables (default: %(default)s)",
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        "--section-weights",
+        help="Priority weights of content sections, e.g. 'hardware=5,solutions=3,blog=0.5' (default weight: 1)",
+        default=None
+    )
+    parser.add_argument(
+        "--traffic-csv",
+        help="CSV with page traffic (path and views columns), busier pages are translated first",
+        default=None
+    )
+    parser.add_argument(
+        "--languages-config",
+        help="Hugo languages config, languages with a lower weight are translated first (default: %(default)s)",
+        default=os.path.join(hugo_root, "config", "_default", "languages.toml")
+    )
+    parser.add_argument(
+        "--journal",
+        help="Path of the job journal recording invoked FlowHunt tasks (default: %(default)s)",
+        default=DEFAULT_JOURNAL_PATH
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Collect results of tasks scheduled by an interrupted run instead of invoking the flow again"
+    )
     
     args = parser.parse_args()
+
+    if args.languages_per_call < 1:
+        print("Error: --languages-per-call must be at least 1")
+        sys.exit(1)
+    if args.check_interval < 1:
+        print("Error: --check-interval must be at least 1")
+        sys.exit(1)
+
+    if (args.stale_only or args.incremental) and args.no_cache:
+        print("Error: --stale-only and --incremental require the translation cache, remove --no-cache")
+        sys.exit(1)
     
     # Convert to Path object
     content_dir = Path(args.path)
 
-    workspace_id = get_workspace_id()
+    workspace_id = get_client(api_key, args.rate_limit, args.max_concurrent_requests).workspace_id()
     if not workspace_id:
         print("Error: Unable to retrieve workspace ID. Please check your API key.")
         sys.exit(1)
@@ -540,14 +982,59 @@ Examples:
     print(f"Target languages: {', '.join(target_langs)}")
     print(f"Using FlowHunt flow ID: {args.flow_id}")
     
-    # Find files that need translation
-    translation_tasks, files_already_exist = find_files_for_translation(content_dir, target_langs)
-    
-    print(f"Found {len(translation_tasks)} files that need translation")
-    print(f"Files skipped (already exist): {files_already_exist}")
-    
-    # Process translations with max-scheduled-tasks parameter
-    process_translations(translation_tasks, args.flow_id, workspace_id, args.max_scheduled_tasks)
+    try:
+        section_weights = parse_section_weights(args.section_weights)
+        traffic = load_traffic(args.traffic_csv, target_langs + ['en']) if args.traffic_csv else {}
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    priority = TranslationPriority(section_weights, load_language_weights(args.languages_config), traffic)
+    if traffic:
+        print(f"Prioritizing by traffic of {len(traffic)} pages from {args.traffic_csv}")
+
+    cache = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or content_dir.parent / ".translation_cache"
+        cache = TranslationCache(cache_dir, args.flow_id, content_dir)
+        print(f"Using translation cache: {cache_dir}")
+
+    journal = JobJournal(args.journal, 'translate')
+    resumed_jobs = []
+    pending_jobs = journal.pending(args.flow_id)
+    if args.resume:
+        resumed_jobs = pending_jobs
+        print(f"Resuming {len(resumed_jobs)} tasks scheduled by an interrupted run")
+    elif pending_jobs:
+        print(f"Warning: {len(pending_jobs)} tasks of an interrupted run are still scheduled, "
+              f"use --resume to collect their results (list them with: python job_journal.py)")
+
+    try:
+        # Find files that may need translation, resumed jobs already produce their target files
+        resumed_targets = []
+        for job in resumed_jobs:
+            resumed_targets.extend(job['inputs'].get('target_files') or [job['inputs']['target_file']])
+        translation_tasks = TranslationTasks(
+            content_dir, target_langs, cache, args.stale_only, priority, resumed_targets,
+            group_size=args.languages_per_call
+        )
+
+        print(f"Found {translation_tasks.translatable_files} translatable files in the English directory")
+        print(f"Checking {len(translation_tasks)} target files while translating")
+        if translation_tasks:
+            first_tasks = ', '.join(f"{'+'.join(target[0] for target in targets)}/{file_path.relative_to(en_dir)}"
+                                    for file_path, targets in translation_tasks.peek(5))
+            print(f"Checking first: {first_tasks}")
+
+        # Process translations with max-scheduled-tasks parameter
+        process_translations(
+            translation_tasks, args.flow_id, args.max_scheduled_tasks, cache, args.incremental,
+            args.check_interval, journal, resumed_jobs
+        )
+    finally:
+        journal.close()
+        if cache:
+            cache.save()
+            cache.print_report()
     
     print("\nTranslation completed!")
 
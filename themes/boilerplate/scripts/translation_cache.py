@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+translation_cache.py
+
+Persistent on-disk cache of FlowHunt translations used by translate_with_flowhunt.py.
+
+Translations are stored under a key derived from (sha256 of the English source,
+target language, flow id), so an unchanged source is never sent for translation
+twice. An index additionally records, for every translated file, the hash of the
+English source it was produced from, which makes it possible to detect target
+files that became stale after the English page was edited.
+
+Translated chunks of documents (see translation_chunks.py) are cached per flow and
+language, keyed by the hash of the English chunk.
+
+Layout of the cache directory:
+    index.json                  - {target path: {"source_hash": ..., "flow_id": ...}}
+    translations/<key>.txt      - translated content for one (source hash, language, flow id)
+    chunks/<flow id>/<lang>.json - {chunk hash: translated chunk}
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from collections import defaultdict
+
+CACHE_VERSION = 1
+
+def hash_content(content):
+    """Return the sha256 hex digest of a text content"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def write_file_atomic(path, content):
+    """Write text content to a temporary file and atomically move it to path"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class TranslationCache:
+    """
+    Content-hash cache of translations
+
+    Args:
+        cache_dir (str or Path): Directory holding the cache
+        flow_id (str): FlowHunt flow ID the translations are produced with
+        content_dir (str or Path): Content directory target files are recorded relative to
+    """
+
+    def __init__(self, cache_dir, flow_id, content_dir):
+        self.cache_dir = str(cache_dir)
+        self.flow_id = flow_id
+        self.content_dir = str(content_dir)
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.targets = {}
+        # {target_lang: {chunk hash: translated chunk}}, loaded lazily
+        self.chunks = {}
+        self.dirty_chunk_langs = set()
+        # {target_lang: {'hit': n, 'miss': n, 'fresh': n}}
+        self.stats = defaultdict(lambda: defaultdict(int))
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == CACHE_VERSION:
+                self.targets = index.get('targets', {})
+            else:
+                print(f"Ignoring translation cache index with unsupported version: {self.index_path}")
+        except (OSError, ValueError) as e:
+            print(f"Error loading translation cache index {self.index_path}: {e}")
+
+    def save(self):
+        """Persist the index to disk"""
+        index = {'version': CACHE_VERSION, 'targets': self.targets}
+        write_file_atomic(self.index_path, json.dumps(index, indent=1, sort_keys=True))
+        for target_lang in self.dirty_chunk_langs:
+            write_file_atomic(self._chunks_path(target_lang), json.dumps(self.chunks[target_lang], ensure_ascii=False))
+        self.dirty_chunk_langs.clear()
+
+    def _entry_path(self, source_hash, target_lang):
+        key = hash_content(f"{source_hash}:{target_lang}:{self.flow_id}")
+        return os.path.join(self.cache_dir, 'translations', f"{key}.txt")
+
+    def get(self, source_hash, target_lang):
+        """Return the cached translation of a source in a target language or None"""
+        path = self._entry_path(source_hash, target_lang)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def put(self, source_hash, target_lang, target_file, translated_text):
+        """
+        Store a translation and record which source the target file was produced from
+
+        Args:
+            source_hash (str): sha256 of the English source content
+            target_lang (str): Target language code
+            target_file (Path): Translated file
+            translated_text (str): Translation written to the target file
+        """
+        write_file_atomic(self._entry_path(source_hash, target_lang), translated_text)
+        self.record(target_file, source_hash)
+
+    def _target_key(self, target_file):
+        return os.path.relpath(target_file, self.content_dir).replace(os.sep, '/')
+
+    def record(self, target_file, source_hash):
+        """Record that a target file corresponds to the given source hash"""
+        self.targets[self._target_key(target_file)] = {'source_hash': source_hash, 'flow_id': self.flow_id}
+
+    def recorded_hash(self, target_file):
+        """Return the source hash a target file was produced from, or None if unknown"""
+        entry = self.targets.get(self._target_key(target_file))
+        return entry['source_hash'] if entry else None
+
+    def _chunks_path(self, target_lang):
+        return os.path.join(self.cache_dir, 'chunks', self.flow_id, f"{target_lang}.json")
+
+    def _chunk_store(self, target_lang):
+        if target_lang not in self.chunks:
+            store = {}
+            path = self._chunks_path(target_lang)
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        store = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Error loading translated chunks {path}: {e}")
+            self.chunks[target_lang] = store
+        return self.chunks[target_lang]
+
+    def get_chunks(self, chunk_hashes, target_lang):
+        """Return {chunk hash: translated chunk} for the chunk hashes found in the cache"""
+        store = self._chunk_store(target_lang)
+        return {chunk_hash: store[chunk_hash] for chunk_hash in chunk_hashes if chunk_hash in store}
+
+    def put_chunks(self, translations, target_lang):
+        """Store translated chunks given as {chunk hash: translated chunk}"""
+        self._chunk_store(target_lang).update(translations)
+        self.dirty_chunk_langs.add(target_lang)
+
+    def count(self, target_lang, outcome):
+        """Count a cache lookup outcome ('hit', 'miss' or 'fresh') for a language"""
+        self.stats[target_lang][outcome] += 1
+
+    def print_report(self):
+        """Print cache hits and misses per language"""
+        if not self.stats:
+            return
+        print("\nTranslation cache report:")
+        print(f"{'Language':<10} {'Up to date':>10} {'Hits':>6} {'Misses':>7}")
+        totals = defaultdict(int)
+        for lang in sorted(self.stats):
+            lang_stats = self.stats[lang]
+            print(f"{lang:<10} {lang_stats['fresh']:>10} {lang_stats['hit']:>6} {lang_stats['miss']:>7}")
+            for outcome, value in lang_stats.items():
+                totals[outcome] += value
+        print(f"{'Total':<10} {totals['fresh']:>10} {totals['hit']:>6} {totals['miss']:>7}")
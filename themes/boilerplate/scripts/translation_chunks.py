@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+translation_chunks.py
+
+Splits content files into stable chunks for incremental translation in translate_with_flowhunt.py.
+
+A document is split losslessly (joining the chunk texts gives back the original) into:
+    - front matter delimiters (+++ or ---), kept verbatim
+    - front matter fields, one chunk per field line (multi-line strings and YAML block
+      scalars stay together); only text fields (TRANSLATABLE_KEYS, at any nesting level)
+      are translatable, layouts, URLs, slugs, images and dates are kept verbatim
+    - headings, paragraphs and shortcode blocks of the body, which are translatable
+    - fenced code blocks and blank lines, kept verbatim
+
+Only translatable chunks whose hash is not in the chunk cache are sent to FlowHunt.
+They are joined with numbered markers and the response is split on the same markers.
+"""
+
+import re
+import hashlib
+from collections import namedtuple
+
+# text: exact text of the chunk including line endings
+# translatable: whether the chunk is sent for translation
+Chunk = namedtuple('Chunk', ['kind', 'text', 'translatable'])
+
+CHUNK_MARKER = '<!-- chunk:{} -->'
+CHUNK_MARKER_PATTERN = re.compile(r'^[ \t]*<!--\s*chunk:(\d+)\s*-->[ \t]*$', re.MULTILINE)
+
+FRONT_MATTER_DELIMITERS = ('+++', '---')
+# Front matter keys whose values are text to translate, compared in lower case. Fields are sent
+# to the flow one by one without the rest of the page, so any other field is kept verbatim.
+TRANSLATABLE_KEYS = {
+    'title', 'linktitle', 'subtitle', 'heading', 'tagline', 'description', 'shortdescription', 'desc',
+    'summary', 'excerpt', 'keywords', 'alt', 'caption', 'label', 'text', 'question', 'answer', 'cta',
+    'buttontext', 'linktext', 'p', 'dt', 'dd', 'hw', 'sw', 'services',
+}
+# Numbered text keys, e.g. p1, p2
+NUMBERED_TEXT_KEY_PATTERN = re.compile(r'^(?:p|desc|text)\d+$')
+FIELD_KEY_PATTERN = re.compile(r'^\s*(?:-\s+)?["\']?([\w.-]+)["\']?\s*[:=]')
+TEXT_PATTERN = re.compile(r'[^\W\d_]{2}')
+YAML_BLOCK_SCALAR_PATTERN = re.compile(r':\s*[|>][+-]?\s*$')
+FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+SHORTCODE_OPEN_PATTERN = re.compile(r'^\s*\{\{[<%]\s*([\w/-]+)')
+
+def hash_chunk(text):
+    """Return the sha256 hex digest of a chunk, ignoring its line endings"""
+    return hashlib.sha256(text.strip('\r\n').encode('utf-8')).hexdigest()
+
+def _leading_indent(text):
+    """Return the spaces and tabs a chunk starts with"""
+    return text[:len(text) - len(text.lstrip(' \t'))]
+
+def _stored_translation(translated):
+    """Return a translated chunk as it is cached, without line endings and leading indentation"""
+    translated = translated.strip('\r\n')
+    return translated[len(_leading_indent(translated)):]
+
+def _field_key(text):
+    """Return the lower case key of a front matter field (the last part of a dotted TOML key), or None"""
+    match = FIELD_KEY_PATTERN.match(text)
+    return match.group(1).rsplit('.', 1)[-1].lower() if match else None
+
+def _is_translatable_field(text, delimiter):
+    """Check if a front matter field is a text field containing text worth translating"""
+    if text.lstrip().startswith('#'):
+        return False
+    key = _field_key(text)
+    if key is None or (key not in TRANSLATABLE_KEYS and not NUMBERED_TEXT_KEY_PATTERN.match(key)):
+        return False
+    value = text.split('=' if delimiter == '+++' else ':', 1)[1]
+    return bool(TEXT_PATTERN.search(value))
+
+def _split_front_matter(lines, delimiter):
+    """Split front matter lines (without delimiters) into field chunks"""
+    chunks = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        field = [line]
+        i += 1
+        if delimiter == '+++':
+            # TOML multi-line strings span until the closing quotes
+            for quotes in ('"""', "'''"):
+                if line.count(quotes) % 2 == 1:
+                    while i < len(lines):
+                        field.append(lines[i])
+                        i += 1
+                        if quotes in field[-1]:
+                            break
+                    break
+        elif YAML_BLOCK_SCALAR_PATTERN.search(line):
+            # YAML block scalars span all following lines indented deeper than the key
+            indent = len(line) - len(line.lstrip())
+            while i < len(lines) and (not lines[i].strip() or len(lines[i]) - len(lines[i].lstrip()) > indent):
+                field.append(lines[i])
+                i += 1
+        text = ''.join(field)
+        if not text.strip():
+            chunks.append(Chunk('blank', text, False))
+        else:
+            chunks.append(Chunk('field', text, _is_translatable_field(text, delimiter)))
+    return chunks
+
+def _take_shortcode_block(lines, i):
+    """Return the index after a shortcode block starting at lines[i]"""
+    name = SHORTCODE_OPEN_PATTERN.match(lines[i]).group(1)
+    end = i
+    # The opening tag may span several lines
+    while end < len(lines) and '>}}' not in lines[end] and '%}}' not in lines[end]:
+        end += 1
+    end += 1
+    if name.startswith('/'):
+        return end
+    # Paired shortcodes extend to their closing tag
+    closing = re.compile(r'\{\{[<%]\s*/' + re.escape(name) + r'\s*[>%]\}\}')
+    if closing.search(''.join(lines[i:end])):
+        return end
+    for j in range(end, len(lines)):
+        if closing.search(lines[j]):
+            return j + 1
+    return end
+
+def _split_body(lines):
+    """Split body lines into headings, paragraphs, shortcode and code blocks"""
+    chunks = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        start = i
+        if not line.strip():
+            while i < len(lines) and not lines[i].strip():
+                i += 1
+            chunks.append(Chunk('blank', ''.join(lines[start:i]), False))
+        elif FENCE_PATTERN.match(line):
+            fence = FENCE_PATTERN.match(line).group(1)
+            i += 1
+            while i < len(lines) and not lines[i].lstrip().startswith(fence):
+                i += 1
+            i = min(i + 1, len(lines))
+            chunks.append(Chunk('code', ''.join(lines[start:i]), False))
+        elif SHORTCODE_OPEN_PATTERN.match(line):
+            i = _take_shortcode_block(lines, i)
+            chunks.append(Chunk('shortcode', ''.join(lines[start:i]), True))
+        elif line.lstrip().startswith('#'):
+            i += 1
+            chunks.append(Chunk('heading', line, True))
+        else:
+            i += 1
+            while (i < len(lines) and lines[i].strip() and not FENCE_PATTERN.match(lines[i])
+                   and not SHORTCODE_OPEN_PATTERN.match(lines[i]) and not lines[i].lstrip().startswith('#')):
+                i += 1
+            chunks.append(Chunk('paragraph', ''.join(lines[start:i]), True))
+    return chunks
+
+def split_document(content):
+    """
+    Split a content file into chunks
+
+    Args:
+        content (str): Content of the file
+
+    Returns:
+        list: List of Chunk tuples, joining their texts gives back the content
+    """
+    lines = content.splitlines(keepends=True)
+    chunks = []
+    body_start = 0
+    if lines and lines[0].strip() in FRONT_MATTER_DELIMITERS:
+        delimiter = lines[0].strip()
+        for end in range(1, len(lines)):
+            if lines[end].strip() == delimiter:
+                chunks.append(Chunk('delimiter', lines[0], False))
+                chunks.extend(_split_front_matter(lines[1:end], delimiter))
+                chunks.append(Chunk('delimiter', lines[end], False))
+                body_start = end + 1
+                break
+    chunks.extend(_split_body(lines[body_start:]))
+    return chunks
+
+def _with_line_ending(translated, original):
+    """Give a translated chunk the leading indentation and trailing line endings of the original chunk"""
+    stripped = original.rstrip('\r\n')
+    return _leading_indent(original) + _stored_translation(translated) + original[len(stripped):]
+
+def assemble_document(chunks, translations):
+    """
+    Build the translated document from chunks
+
+    Args:
+        chunks (list): Chunks of the source document
+        translations (dict): {chunk hash: translated text} covering all translatable chunks
+
+    Returns:
+        str: Translated document
+    """
+    parts = []
+    for chunk in chunks:
+        if chunk.translatable:
+            parts.append(_with_line_ending(translations[hash_chunk(chunk.text)], chunk.text))
+        else:
+            parts.append(chunk.text)
+    return ''.join(parts)
+
+def build_payload(chunks):
+    """Join chunks to translate into a single payload separated by numbered markers"""
+    parts = []
+    for number, chunk in enumerate(chunks):
+        parts.append(CHUNK_MARKER.format(number))
+        parts.append(chunk.text.strip('\r\n'))
+    return '\n'.join(parts)
+
+def parse_payload(translated_text, chunks):
+    """
+    Split a translated payload back into chunk translations
+
+    Args:
+        translated_text (str): Translation of a payload built by build_payload
+        chunks (list): Chunks the payload was built from
+
+    Returns:
+        dict: {chunk hash: translated text} or None if the markers do not match
+    """
+    markers = list(CHUNK_MARKER_PATTERN.finditer(translated_text))
+    if [int(m.group(1)) for m in markers] != list(range(len(chunks))):
+        return None
+    translations = {}
+    for number, marker in enumerate(markers):
+        end = markers[number + 1].start() if number + 1 < len(markers) else len(translated_text)
+        translations[hash_chunk(chunks[number].text)] = _stored_translation(translated_text[marker.end():end])
+    return translations
+
+def align_document(source_chunks, translated_text):
+    """
+    Pair chunks of a fully translated document with the source chunks
+
+    Used to seed the chunk cache from whole-file translations. Alignment only
+    succeeds when both documents split into the same sequence of chunk kinds.
+
+    Returns:
+        dict: {chunk hash: translated text} or None if the documents do not align
+    """
+    translated_chunks = split_document(translated_text)
+    if [c.kind for c in translated_chunks] != [c.kind for c in source_chunks]:
+        return None
+    return {
+        hash_chunk(source.text): _stored_translation(translated.text)
+        for source, translated in zip(source_chunks, translated_chunks)
+        if source.translatable
+    }
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+translation_priority.py
+
+Priority ordering of translation tasks used by translate_with_flowhunt.py.
+
+Tasks are kept in a heap and handed out most valuable first, so when a run is
+cut short the pages that matter most are already translated. The priority of
+a task is the product of:
+    - the page weight: the weight of its section (first directory under content/en),
+      doubled for section pages (_index.md) and highest for the homepage
+    - the page traffic: 1 + log(1 + views) from an optional traffic CSV
+    - the language weight: 1 / weight of the language in config/_default/languages.toml,
+      so languages listed first in the Hugo menu are translated first
+
+Traffic CSV format:
+    A header row with a page column (named like path, url or page) and a views
+    column (named like views or sessions), e.g. a Google Analytics export. Pages
+    are matched by their URL path, e.g. /hardware/parking-sensor/, full URLs and
+    language prefixes are accepted.
+"""
+
+import os
+import csv
+import math
+import heapq
+import itertools
+from urllib.parse import urlparse
+import toml
+
+# Weight of pages in sections without a configured weight
+DEFAULT_SECTION_WEIGHT = 1.0
+# Multiplier of section pages (_index.md) and of the homepage
+SECTION_PAGE_BOOST = 2.0
+HOMEPAGE_BOOST = 10.0
+
+PAGE_COLUMNS = ('path', 'url', 'page')
+VIEWS_COLUMNS = ('views', 'sessions')
+
+def parse_section_weights(value):
+    """Parse section weights given as 'section=weight,section=weight'"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        section, _, weight = item.partition('=')
+        try:
+            weights[section.strip().strip('/')] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid section weight '{item}', expected section=weight")
+    return weights
+
+def load_language_weights(languages_file):
+    """Return {language code: weight} from a Hugo languages.toml, or {} if it is missing"""
+    if not languages_file or not os.path.exists(languages_file):
+        return {}
+    try:
+        languages = toml.load(languages_file)
+    except toml.TomlDecodeError as e:
+        print(f"Error reading language weights from {languages_file}: {e}")
+        return {}
+    return {lang: float(config['weight']) for lang, config in languages.items()
+            if isinstance(config, dict) and 'weight' in config}
+
+def page_url(rel_path):
+    """Return the URL path of a content file relative to the language directory"""
+    parts = list(os.path.splitext(str(rel_path).replace(os.sep, '/'))[0].split('/'))
+    if parts[-1] in ('_index', 'index'):
+        parts.pop()
+    path = '/'.join(parts).lower()
+    return f"/{path}/" if path else '/'
+
+def normalize_url(url, languages=()):
+    """Normalize a URL from the traffic CSV to a URL path without language prefix"""
+    path = urlparse(url.strip()).path or '/'
+    parts = [part for part in path.lower().split('/') if part]
+    if parts and parts[0] in languages:
+        parts.pop(0)
+    return '/' + '/'.join(parts) + '/' if parts else '/'
+
+def find_column(fieldnames, candidates):
+    """Return the first CSV column whose name contains one of the candidates, e.g. 'Page path' for 'path'"""
+    for candidate in candidates:
+        for name in fieldnames or []:
+            if candidate in name.strip().lower():
+                return name
+    return None
+
+def load_traffic(traffic_file, languages=()):
+    """Return {URL path: views} from a traffic CSV, views of the same page are summed"""
+    traffic = {}
+    with open(traffic_file, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        page_column = find_column(reader.fieldnames, PAGE_COLUMNS)
+        views_column = find_column(reader.fieldnames, VIEWS_COLUMNS)
+        if not page_column or not views_column:
+            raise ValueError(f"Traffic CSV {traffic_file} needs a {'/'.join(PAGE_COLUMNS)} "
+                             f"and a {'/'.join(VIEWS_COLUMNS)} column")
+        for row in reader:
+            try:
+                views = float(row[views_column].replace(',', ''))
+            except (TypeError, ValueError):
+                continue
+            url = normalize_url(row[page_column] or '', languages)
+            traffic[url] = traffic.get(url, 0.0) + views
+    return traffic
+
+class TranslationPriority:
+    """
+    Priority function of translation tasks
+
+    Args:
+        section_weights (dict): {section: weight}, sections are first directories under content/en
+        language_weights (dict): {language code: Hugo language weight}
+        traffic (dict): {URL path: views}
+    """
+
+    def __init__(self, section_weights=None, language_weights=None, traffic=None):
+        self.section_weights = section_weights or {}
+        self.language_weights = language_weights or {}
+        self.traffic = traffic or {}
+        self.max_language_weight = max(self.language_weights.values(), default=1.0)
+
+    def page_weight(self, rel_path):
+        """Return the weight of a page independent of the target language"""
+        rel_path = str(rel_path).replace(os.sep, '/')
+        section, _, rest = rel_path.partition('/')
+        if not rest:
+            # Pages in the content root, e.g. the homepage or partners.md
+            section = ''
+        weight = self.section_weights.get(section, DEFAULT_SECTION_WEIGHT)
+
+        url = page_url(rel_path)
+        if url == '/':
+            weight *= HOMEPAGE_BOOST
+        elif os.path.basename(rel_path) == '_index.md':
+            weight *= SECTION_PAGE_BOOST
+
+        return weight * (1 + math.log1p(self.traffic.get(url, 0.0)))
+
+    def language_factor(self, target_lang):
+        """Return the factor of a target language, languages without a weight come last"""
+        weight = self.language_weights.get(target_lang, self.max_language_weight + 1)
+        return 1 / max(weight, 1.0)
+
+    def __call__(self, rel_path, target_lang):
+        return self.page_weight(rel_path) * self.language_factor(target_lang)
+
+class TaskQueue:
+    """
+    Heap of translation tasks ordered by priority, highest first
+
+    Tasks of equal priority keep their insertion order. Iterating over the queue
+    pops the tasks, so the remaining tasks stay queued when a run is cut short.
+
+    Args:
+        priority (callable): Function of (relative path, target language) returning the priority
+    """
+
+    def __init__(self, priority=None):
+        self.priority = priority or TranslationPriority()
+        self.heap = []
+        self.counter = itertools.count()
+
+    def push(self, task, rel_path, target_lang):
+        """Queue a task of the given page and target language"""
+        heapq.heappush(self.heap, (-self.priority(rel_path, target_lang), next(self.counter), task))
+
+    def pop(self):
+        """Remove and return the task with the highest priority"""
+        return heapq.heappop(self.heap)[2]
+
+    def peek(self, count=1):
+        """Return the count tasks with the highest priority without removing them"""
+        return [entry[2] for entry in heapq.nsmallest(count, self.heap)]
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def __iter__(self):
+        while self.heap:
+            yield self.pop()